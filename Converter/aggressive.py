@@ -1,11 +1,7 @@
 import base
+import instrument
 import logging
 
-# configure logging for debugging purposes
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
-# logging.disable(logging.INFO)
-# logging.disable(logging.DEBUG) # disable logging for general run. comment out for logging.
 
 class AggHandler(base.ChiX_conversion): # TODO: deal with aggressive order entries where 'A'/'a' msg represents remaining now passive order related to the aggressive for a trade.
     """
@@ -34,6 +30,8 @@ class AggHandler(base.ChiX_conversion): # TODO: deal with aggressive order entri
         self.contra_id_loc = {'short':{'start':34, 'end': 43}, 'long': {'start':38, 'end':47}}
         self.passive_id_loc = {'start': 10, 'end': 19}
         self.traderef_loc = {'short':{'start':25, 'end': 34}, 'long': {'start':29, 'end':38}}
+        self.filledOrders = []  # passive orders fully traded in the current trade burst
+        self.dumpCount = 0  # agg order msgs written from the cache
         self.reset_cache()
 
     def reset_cache(self):
@@ -48,12 +46,24 @@ class AggHandler(base.ChiX_conversion): # TODO: deal with aggressive order entri
         self.cacheTimeStamp = None
 
 
+    def retireFilled(self, order_store):
+        """
+        Method to retire the passive orders fully traded during the last trade burst from the order store.
+        Retiring is left until the burst is over, so executions in the same burst can still find the order, and the
+        order is kept as a tombstone so a cancel still in flight can find it too (see OrderStore.retire).
+        """
+        for id in self.filledOrders:
+            order_store.retire(id)
+        self.filledOrders = []
+
+
     def append_cache(self, volume, price, contraID, security, aggSide, timestamp):
         """
         Method to append_cache with volume, price, contraID, security, aggSide, timestamp, used to write agg order msgs.
         """
 
-        logging.debug("Appending to cache for contraId: %s" % contraID)
+        if instrument.tracer.enabled:
+            logging.debug("Appending to cache for contraId: %s", contraID)
         self.cacheVolume += volume  # appended for each trade msg with the same contraID
         self.cachePrice = price  # updated for each trade msg with the same contraID
         if self.cacheContraID is None: # added once for each batch (will not change)
@@ -101,7 +111,7 @@ class AggHandler(base.ChiX_conversion): # TODO: deal with aggressive order entri
         return tradeRef
 
 
-    def exeWriter(self,row, passive_dict):
+    def exeWriter(self, record, order_store):
         """
         Method to write trade msg based on execution msg input.
         Output looks like: '* 111 10:00:00.00:  TRADE BHP 111 100 50 80 <ON > B(12345 ) A(9876 ) T({*F=111})'
@@ -111,93 +121,84 @@ class AggHandler(base.ChiX_conversion): # TODO: deal with aggressive order entri
             if lastContra == None, appendCache
             else if lastContra == contra, appendCache
             else if lastContra != contra, aggdump (write agg order msg), then append cache with new contra and details.
-        Takes row and passiveDict (containing passive order details needed to calculate price for trade msg).
+        Takes the decoded ExecutionRecord and orderStore (containing passive order details needed to calculate price
+        for trade msg).
         Returns execution msg, and agg order msg when necessary (in the case that the last execution msg seen is for a
         different contraID to the previous msgs).
         """
 
         # set variables, including price and value calculations based on relevant passive order
-        currentTransType = self.getTransType(row)
-        id = self.getPassiveID(row)
-        contraID = self.getContraID(row,transType=currentTransType)
+        id = record.passiveId
+        contraID = record.contraId
+        timeStamp = record.timeStamp
+        tradeRef = record.tradeRef
         aggOrd = None
 
-        try:  # look for id in the passive dict and set price and security based on values in dict
-            p_dict = passive_dict[id]
-        except:
-            raise KeyError("%s ID not in passive_dict" % id)
-        price = p_dict['price']
-        security = p_dict['security']
-        if type(price) == str:
-            price = float(price)
+        # look for id in the order store and set price and security based on values in store
+        slot, security, passiveSide, price, passiveVolume = order_store.lookup(id)
 
         # get volume based on the execution msg input data
-        volume = self.getVolume(row, transType=currentTransType)
-        value = int(price*volume) # TODO: deal with rounding
+        volume = record.volume
 
-        # get bid and ask sides based on passive dict 'side' value.
-        if p_dict['side'] == 'Bid':
+        # get bid and ask sides based on passive order side.
+        if passiveSide == 'Bid':
             aggSide = self.getCounterSide(transSide='Bid')
             bidSide = id
             askSide = contraID
-        elif p_dict['side'] == 'Ask':
+        elif passiveSide == 'Ask':
             aggSide = self.getCounterSide(transSide='Ask')
             bidSide = contraID
             askSide = id
         else:
-            raise ValueError("Side not recognised, wtf is this %s" % p_dict['side'])
-
-        # update the passive dict with new volume after trade
-        p_dict['volume'] = p_dict['volume'] - volume
-        logging.debug('Passive Dict has been updated due to trade')
-
-
-        # write trade string using above variables
-        tradeString = "* %s %s:  TRADE %s %s %s %s %s <ON > B(%s  ) A(%s  ) T(*F=%s})" % (
-        self.getTradeRef(row,transType=currentTransType),
-        self.getTimeStamp(row),
-        security,
-        self.getTradeRef(row,transType=currentTransType),
-        price,
-        volume,
-        value,
-        bidSide,
-        askSide,
-        self.getTradeRef(row,transType=currentTransType),
-        )
+            raise ValueError("Side not recognised, wtf is this %s" % passiveSide)
+
+        # update the order store with new volume after trade
+        order_store.setVolume(slot, passiveVolume - volume)
+        if instrument.tracer.enabled:
+            logging.debug('Order store has been updated due to trade')
+        if passiveVolume - volume <= 0:  # fully traded, retired once the trade burst is over
+            self.filledOrders.append(id)
+
+
+        # write trade string using above variables (value is calculated exactly from the price ticks)
+        tradeString = self.renderer.trade(timeStamp, tradeRef, self.securityTable.symbol(security), price, volume,
+                                          bidSide, askSide)
 
         # Handle agg order msg, indicated by consecutive trades (append cache when needed, dump agg msgs when needed)
-        logging.info("Contra ID %s cache contra id %s" % (contraID, self.cacheContraID))
+        if instrument.tracer.enabled:
+            logging.info("Contra ID %s cache contra id %s", contraID, self.cacheContraID)
         if self.cacheContraID is None:
-            logging.info("Contra ID is None, appending to cache")
-            self.append_cache(volume, price, contraID, security, aggSide, timestamp=(self.getTimeStamp(row)))
+            if instrument.tracer.enabled:
+                logging.info("Contra ID is None, appending to cache")
+            self.append_cache(volume, price, contraID, security, aggSide, timestamp=timeStamp)
         elif contraID == self.cacheContraID:
-            logging.info("Contra ID has not changed, appending to cache")
-            self.append_cache(volume, price, contraID, security, aggSide, timestamp=(self.getTimeStamp(row)))
+            if instrument.tracer.enabled:
+                logging.info("Contra ID has not changed, appending to cache")
+            self.append_cache(volume, price, contraID, security, aggSide, timestamp=timeStamp)
         else:
-            logging.info("New Contra ID, dumping cache, and appending")
+            if instrument.tracer.enabled:
+                logging.info("New Contra ID, dumping cache, and appending")
             aggOrd = self.aggOrderDump()
-            self.append_cache(volume, price, contraID, security, aggSide, timestamp=(self.getTimeStamp(row)))
+            self.append_cache(volume, price, contraID, security, aggSide, timestamp=timeStamp)
 
         return tradeString, aggOrd  # both the trade string and the agg msg string must be returned by the func, but agg msg may be None.
 
 
-    def aggOrderDump(self, row=None, passiveWriter=None):
+    def aggOrderDump(self, record=None):
         """
         Method to write agg order msgs by dumping the cache.
-        Takes row and passiveWriter (passiveOrderWriter class to allow for methods to be drawn from this class).
+        Takes the decoded PassiveRecord of the row that ended the trade burst, if that row was a passive order entry.
         Returns agg order msg string.
         """
         # conduct pre-checks and deal with agg orders partially traded...
-        if row is not None:
-            logging.debug('row is not none, preparing to check for passive writer')
-            if passiveWriter is None:
-                raise ValueError("No passiveWriter class object passed to aggOrderDump")
+        if record is not None:
             # If passiveID matches contraID, add passive volume to cacheVolume
-            logging.debug('passive ID %s, contra ID %s' % (passiveWriter.getOrderId(row), self.cacheContraID))
-            if passiveWriter.getOrderId(row) == self.cacheContraID:
-                logging.debug('passive order ID matches contra, volume is being appended')
-                self.cacheVolume += passiveWriter.getVolume(row)
+            if instrument.tracer.enabled:
+                logging.debug('passive ID %s, contra ID %s', record.orderId, self.cacheContraID)
+            if record.orderId == self.cacheContraID:
+                if instrument.tracer.enabled:
+                    logging.debug('passive order ID matches contra, volume is being appended')
+                self.cacheVolume += record.volume
 
         # set aggOrder msg variables based on cache, then clear cache.
         volume = self.cacheVolume
@@ -208,17 +209,9 @@ class AggHandler(base.ChiX_conversion): # TODO: deal with aggressive order entri
         timeStamp = self.cacheTimeStamp
 
         self.reset_cache()
-        logging.debug("dumping agg message")
-        return "* %s %s:  ENTER %s %s %s %s %s %s <ON > (@1 {*O=%s})" % (
-            contraID,
-            timeStamp,
-            security,
-            contraID,
-            side,
-            price,
-            volume,
-            self.getTransValue(price, volume),
-            contraID
-            )
+        self.dumpCount += 1
+        if instrument.tracer.enabled:
+            logging.debug("dumping agg message")
+        return self.renderer.aggEnter(timeStamp, contraID, self.securityTable.symbol(security), side, price, volume)
 
 
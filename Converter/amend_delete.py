@@ -1,15 +1,11 @@
 import base
+import instrument
 import logging
-# configure logging for debugging purposes
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
-# logging.disable(logging.INFO)
-# logging.disable(logging.DEBUG) # disable logging for general run. comment out for logging.
 
 class AmdDelWriter(base.ChiX_conversion):
     """
     Class to handle msg inputs of type 'x'/'X' to write amendMsg and DelMsg.
-    Requires input from 'x'/'X' transTypes, and related passive dict.
+    Requires input from 'x'/'X' transTypes, and related order store.
     Delete logic: if 'x'/'X' is for all volume and new passiveID != cancelID then msg = DEL
     Amend logic: if 'x'/'X' is for partial volume
     """
@@ -22,6 +18,7 @@ class AmdDelWriter(base.ChiX_conversion):
         self.timestamp_loc = {'start': 1, 'end': 9}
         self.transtype_loc = 9
         self.orderid_loc = {'start': 10, 'end': 19}
+        self.dumpCount = 0  # DELET and re-entry AMEND msgs written from the cache
         self.reset_cache()
 
     def getTimeStamp(self, row):
@@ -69,49 +66,42 @@ class AmdDelWriter(base.ChiX_conversion):
         self.cachePrice = price
 
 
-    def cacheAndWrite(self, row, amend_dict):
+    def cacheAndWrite(self, record, order_store):
         """
         method writes relevant details of 'X'/'x' msgs to the cancelCache when passiveVol == cancelVol
         (must wait for next passive to determine whether cancel was amend or delete).
         writes AMEND for volume when passiveVol > cancelVol
-        Must updated passiveDict in case of AMEND for volume. In this case the passive will not be re-entered so
+        Must updated orderStore in case of AMEND for volume. In this case the passive will not be re-entered so
         details will not automatically update.
+        Takes the decoded CancelRecord for the row.
         """
-        currentTransType = self.getTransType(row)
-        id = self.getOrderId(row)
-        cancelVol = self.getVolume(row, currentTransType)
-        logging.debug('Cancel Volume: %s' % cancelVol)
-        cancelTime = self.getTimeStamp(row)
-
-        try:  # look for id in the passive dict and set price and security based on values in dict
-            p_dict = amend_dict[id]
-            logging.debug('Passive Volume: %s' % p_dict['volume'])
-            logging.debug(p_dict)
-        except:
-            raise KeyError("%s ID not in passive_dict" % id)
-
-        cacheSecurity = p_dict['security']
-        cacheSide = p_dict['side']
-        cachePrice = p_dict['price']
-
-        if type(cachePrice) == str:
-            cachePrice = float(cachePrice)
-
-        if cancelVol >= p_dict['volume']:  # only save to cache if cancel volume >= total passive volume.
+        id = record.orderId
+        cancelVol = record.volume
+        if instrument.tracer.enabled:
+            logging.debug('Cancel Volume: %s', cancelVol)
+        cancelTime = record.timeStamp
+
+        # look for id in the order store and set price and security based on values in store
+        slot, cacheSecurity, cacheSide, cachePrice, passiveVolume = order_store.lookup(id)
+        if instrument.tracer.enabled:
+            logging.debug('Passive Volume: %s', passiveVolume)
+
+        if cancelVol >= passiveVolume:  # only save to cache if cancel volume >= total passive volume.
             # Cancels with greater volume than the original passive can occur and should be treated as cancels for complete volume.
             # The mis-specification is likely due to inflight error. The cancel is sent but by the time it is recieved a trade has already occured for partial volume.
             # Cache necessary until next passive is seen to establish whether amend or delete should be written.
             cacheEmpty = False # change cache status Empty to False
             self.cacheForCancel(cacheEmpty, cancelVol, id, cancelTime, cacheSecurity, cacheSide, cachePrice)
-            logging.debug("%s,%s,%s,%s,%s,%s,%s" % (cacheEmpty, cancelVol, id, cancelTime, cacheSecurity, cacheSide, cachePrice))
-
-        elif cancelVol < p_dict['volume']:  # if cancel vol less than passive vol an amend for volume can be written.
-            newVolume = p_dict['volume'] - cancelVol
-            p_dict['volume'] = newVolume # update passive dict to have new volume based on amend for volume
-            logging.debug('Passive Dict Volume Updated because of amend for Volume')
-            value = newVolume*cachePrice
-            amend =  "* %s:  AMEND %s %s %s abs %s %s %s ({*0=%s})" % (cancelTime, cacheSecurity, id, cacheSide,
-                                                                       cachePrice, newVolume, value, id)
+            if instrument.tracer.enabled:
+                logging.debug("%s,%s,%s,%s,%s,%s,%s", cacheEmpty, cancelVol, id, cancelTime, cacheSecurity, cacheSide, cachePrice)
+
+        elif cancelVol < passiveVolume:  # if cancel vol less than passive vol an amend for volume can be written.
+            newVolume = passiveVolume - cancelVol
+            order_store.setVolume(slot, newVolume) # update order store to have new volume based on amend for volume
+            if instrument.tracer.enabled:
+                logging.debug('Order Store Volume Updated because of amend for Volume')
+            amend = self.renderer.cancelAmend(cancelTime, id, self.securityTable.symbol(cacheSecurity), cacheSide,
+                                              cachePrice, newVolume)
             self.reset_cache()
             return amend
 
@@ -122,34 +112,39 @@ class AmdDelWriter(base.ChiX_conversion):
         """
         time = self.cacheTimeStamp
         id = self.cacheID
-        security = self.caheSecurity
+        security = self.securityTable.symbol(self.caheSecurity)
         side = self.cacheSide
 
-        return "* %s %s:  DELET %s %s %s 0 ()" % (id, time, id, security, side)
+        self.dumpCount += 1
+        return self.renderer.delete(time, id, security, side)
 
-    def amendWriter(self, row, passiveWriter):
+    def amendWriter(self, record, order_store):
         """
         Writes amend OR delete msg based on cacheCancel data
+        Takes the decoded PassiveRecord of the passive order entry that followed the cancel, and the orderStore
+        (deleted orders are retired from it).
         """
         cacheVolume = self.cacheVolume
         time = self.cacheTimeStamp
         id = self.cacheID
-        security = self.caheSecurity
+        security = self.securityTable.symbol(self.caheSecurity)
         side = self.cacheSide
-        newPrice = passiveWriter.getPrice(row)
-        newVolume = passiveWriter.getVolume(row)
+        newPrice = record.price
+        newVolume = record.volume
         volume = newVolume - cacheVolume
-        newValue = volume*newPrice
 
-        logging.debug("CacheId: %s - PassiveId: %s" % (self.cacheID, passiveWriter.getOrderId(row)))
+        if instrument.tracer.enabled:
+            logging.debug("CacheId: %s - PassiveId: %s", self.cacheID, record.orderId)
 
-        if self.cacheID != passiveWriter.getOrderId(row): # if passiveID != cachedID then a delete msg is written
+        if self.cacheID != record.orderId: # if passiveID != cachedID then a delete msg is written
             self.delWritten = True
-            logging.debug('Delete msg written = %s' % self.delWritten)
+            if instrument.tracer.enabled:
+                logging.debug('Delete msg written = %s', self.delWritten)
+            order_store.remove(id)
             return self.delWriter()  #runs delWriter method for writing deletion msgs
 
         else:  # if the cacheID == the passiveID then the cached details are for an amend.
-            return "* %s %s:  AMEND %s %s %s abs %s %s %s ({*0=%s})" % (id, time, security, id, side, newPrice, volume,
-                                                                       newValue, id)
+            self.dumpCount += 1
+            return self.renderer.reentryAmend(time, id, security, side, newPrice, volume)
 
 
@@ -1,10 +1,6 @@
-import logging
+import symbols
+import timestamp
 
-# configure logging for debugging purposes
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
-# logging.disable(logging.INFO)
-# logging.disable(logging.DEBUG) # disable logging for general run. comment out for logging.
 
 class ChiX_conversion(object):
     """
@@ -12,8 +8,7 @@ class ChiX_conversion(object):
     """
     def __init__(self):
         """
-        Specific variables for base class: message types (short and long messages), list for storing securities seen,
-        list for storing undisclosed orders.
+        Specific variables for base class: message types (short and long messages), table of securities seen.
         """
         # set of short order message types
         self.shortMessageType = set(['E', 'A', 'X', 'P'])  # add order, execute order, cancel order, hidden order exec
@@ -21,11 +16,15 @@ class ChiX_conversion(object):
         # set of long order message types
         self.longMessageType = set(['e', 'a', 'x', 'p'])
 
-        # create list to store order IDs for undisclosed orders
-        self.undisclosedOrderList = []
+        # create table to intern securities seen as integer codes (shared by all writers of a Parser)
+        self.securityTable = symbols.SecurityTable()
 
-        # create list to store securities seen.
-        self.securityList = []
+        # prices are held as integers in ticks of priceScale, for both short (1e4) and long (1e7) messages
+        self.priceScale = 10000000
+        self.fractionFormat = '%07d'
+
+        # integer timestamp renderer, caches the last millisecond seen
+        self.timeStampFormatter = timestamp.TimeStampFormatter()
 
     def getTransType(self, row, loc):
         """
@@ -62,29 +61,19 @@ class ChiX_conversion(object):
 
     def millis_to_stringTime(self, x):
         """
-        preliminary method to convert milliseconds to stringTime, utilising padTime method.
+        method to convert milliseconds to stringTime, utilising the TimeStampFormatter (integer only, cached).
         Takes input data (x) and returns time in correct string based output format ('00:00:00.000').
         """
-        hours = int(x / (60*60*1e3))
-        mins = int((x - hours*60*60*1e3) / (60*1e3))
-        secs = int((x - (hours*60*60*1e3) - (mins*60*1e3)) / 1e3)
-        micros = int(x - (hours*60*60*1e3) - (mins*60*1e3) - (secs*1e3))
-
-        stringTime = "%s:%s:%s.%s" % (self.padTime(hours), self.padTime(mins), self.padTime(secs),
-                                      self.padTime(micros, 3))
-        return stringTime
+        return self.timeStampFormatter.millisToString(int(x))
 
 
     def getTimeStamp(self, row, start, end):
         """
-        method to convert millisecond time stamp to correct format "00:00:00:.000" utilising millis_to_stringTime method.
+        method to convert millisecond time stamp to correct format "00:00:00:.000000" utilising TimeStampFormatter.
         Takes a row, and a start and end position.
         returns timestamp in correct format for output (string type)
         """
-        initTimeStamp = int(row[start:end].strip())
-        str_timeStamp = self.millis_to_stringTime(initTimeStamp)
-        timeStamp = str_timeStamp + "000"
-        return timeStamp
+        return self.timeStampFormatter.format(int(row[start:end]))
 
 
     def getOrderId(self, row, start, end):
@@ -142,15 +131,31 @@ class ChiX_conversion(object):
         return volume # if volume is 0 then order is undisclosed
 
 
-    def returnPriceString(self, price):
+    def returnDecimalString(self, ticks):
+        """
+        Method to render a fixed-point amount (in priceScale ticks) as a decimal string, using integer arithmetic only.
+        Trailing zeros are dropped but at least one decimal place is kept, the same as str() of the float would give.
+        Takes ticks (int) and returns the decimal string, eg. 600000000 --> '60.0'.
+        """
+        scale = self.priceScale
+        if ticks < 0:
+            return '-' + self.returnDecimalString(-ticks)
+        if 0 < ticks < scale // 10000 or ticks >= scale * 10 ** 16:  # float str() switches to exponent notation
+            return str(ticks / scale)
+        whole, fraction = divmod(ticks, scale)
+        fraction = (self.fractionFormat % fraction).rstrip('0') or '0'
+        return '%d.%s' % (whole, fraction)
+
+
+    def returnPriceString(self, ticks):
         """
         Method to correctly place decimal in converted price string (input file does not include decimal points).
-        Takes price based on getPrice method.
-        returns price, with correct decimal point placement.
+        Takes price ticks based on getPrice method.
+        returns price string, with correct decimal point placement (at least two decimal places, eg. '60.00').
         """
-        priceStr = str(price)
-        if priceStr[-2:-1] == '.':
-            price = '%.2f' % price
+        price = self.returnDecimalString(ticks)
+        if price[-2:-1] == '.':
+            price = price + '0'
         return price
 
     def returnPriceDenominator(self, transType):
@@ -159,50 +164,46 @@ class ChiX_conversion(object):
         Takes transType (either 'short' or 'long')
         Returns denominator for price, based on transType length.
         """
-        denominator = 10000.0
+        denominator = 10000
         if transType == 'long':
-            denominator = 10000000.0
+            denominator = 10000000
         return denominator
 
 
     def getPrice(self, row, idx_dict, transType):
         """
-        Method to get the price from input data and convert it to the correct output format
+        Method to get the price from input data as a fixed-point integer.
         Takes row, transType (to establish msg length), idx_dict (dict containing start and end locations referenced by msg length)
-        Returns price in correct format for output, utilising PriceString and PriceDenominator methods.
+        Returns price in ticks of priceScale (short and long prices share one scale), utilising PriceDenominator method.
         """
         msg_type = self.getMessageLength(transType)
         if msg_type not in idx_dict.keys():
             raise ValueError("%s is not in idx_dict keys: %s" % (msg_type, idx_dict.keys()))
         price = int(row[idx_dict[msg_type]['start']:idx_dict[msg_type]['end']].strip())
-        price = price / self.returnPriceDenominator(transType)  # Refactor by denominator
-        price = self.returnPriceString(price)  # correctly place decimal
-        return price
+        return price * (self.priceScale // self.returnPriceDenominator(msg_type))  # rescale to priceScale
 
 
     def getTransValue(self, price, volume):
         """
         Method to calculate transaction value based on price and volume
-        Takes price (from getPrice method converted to float from string) and volume based on getVolume method.
-        Return value as a int."""
-        if type(price) == str:  # no need to convert if price is already float. But based on price method, it will str.
-            price = float(price)
-        transValue = int(price * volume)
-        return transValue  #TODO: should this be a float accounting for rounding?
+        Takes price (ticks, from getPrice method) and volume based on getVolume method.
+        Return value as a int, truncated toward zero, calculated exactly in integers."""
+        value = price * volume
+        if value < 0:
+            return -(-value // self.priceScale)
+        return value // self.priceScale
 
 
     def getSecurity(self, row, idx_dict, transType):
         """
         Method to get the security for each input message. Location varies based on transType and messageLength.
-        Method also stores unseen securities to the securityList.
+        Method also interns unseen securities in the securityTable.
         Takes row, idx_dict and  transType.
-        Returns security as a string.
+        Returns the integer code of the security (securityTable.symbol gives the string back).
         """
         msg_type = self.getMessageLength(transType)
         if msg_type not in idx_dict.keys():
             raise ValueError("%s is not in idx_dict keys: %s" % (msg_type, idx_dict.keys()))
         security = row[idx_dict[msg_type]['start']:idx_dict[msg_type]['end']].strip()
-        if security not in self.securityList:  # if security is not in the security list, add it
-            self.securityList.append(security)
-        return security
+        return self.securityTable.intern(security)
 
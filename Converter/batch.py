@@ -0,0 +1,296 @@
+"""
+Vectorised decoding of whole blocks of input rows with NumPy.
+Chi-X rows are fixed width, so every field of every row in a block can be cut out of a byte matrix at once.
+The block is grouped by transType (which also fixes the short/long message length) and each field is turned into a
+typed column in a handful of array operations. The stateful Parser then walks records built from these columns.
+Text columns and timestamps are turned into str with one decode and split of the whole column rather than NumPy's
+per-element string functions, so the only Python work per row is building its record.
+"""
+import gc
+
+import numpy as np
+
+import base
+import decoder
+import timestamp
+
+
+def splitColumn(chars):
+    """
+    Takes an (n, width) uint8 matrix of ASCII text and returns its rows as a list of n str, in one decode and split.
+    """
+    n, width = chars.shape
+    if not n:
+        return []
+    text = np.empty((n, width + 1), dtype=np.uint8)
+    text[:, :width] = chars
+    text[:, width] = 10
+    return text.tobytes()[:-1].decode('ascii').split('\n')
+
+
+def formatTimeStamps(millis):
+    """
+    Vectorised counterpart of timestamp.TimeStampFormatter.format.
+    Takes an int64 array of millisecond timestamps and returns a list of "00:00:00.000000" strings.
+    The digits of every timestamp are written into a (n, 15) character matrix with integer array operations only.
+    """
+    if len(millis) and millis.max() >= 100 * 3600000:  # three digit hours do not fit the fixed layout
+        formatter = timestamp.TimeStampFormatter()
+        return [formatter.format(x) for x in millis.tolist()]
+    secs, ms = np.divmod(millis, 1000)
+    mins, secs = np.divmod(secs, 60)
+    hours, mins = np.divmod(mins, 60)
+    chars = np.full((len(millis), 15), ord('0'), dtype=np.uint8)
+    chars[:, 2] = chars[:, 5] = ord(':')
+    chars[:, 8] = ord('.')
+    for col, field, width in ((0, hours, 2), (3, mins, 2), (6, secs, 2), (9, ms, 3)):
+        for i in range(width):
+            chars[:, col + width - 1 - i] += (field // 10 ** i % 10).astype(np.uint8)
+    return splitColumn(chars)
+
+
+class BatchDecoder(base.ChiX_conversion):
+    """
+    Decodes a block of raw rows into the same records produced by decoder.MessageDecoder, in row order.
+    Field positions are taken from the writers' own *_loc tables.
+    """
+
+    def __init__(self, passive_writer, agg_handler, amd_del_writer, hidden_exe_writer):
+        """
+        Takes the writer objects the records will be handed to and builds the field layout for every transType.
+        """
+        super(BatchDecoder, self).__init__()
+        self.securityTable = passive_writer.securityTable
+        self.transtype_loc = passive_writer.transtype_loc
+        self.layouts = {}
+        for transType in self.shortMessageType | self.longMessageType:
+            length = self.getMessageLength(transType)
+            kind = transType.upper()
+            if kind == 'A':
+                layout = self.passiveLayout(passive_writer, length)
+            elif kind == 'E':
+                layout = self.executionLayout(agg_handler, length)
+            elif kind == 'X':
+                layout = self.cancelLayout(amd_del_writer, length)
+            else:
+                layout = self.hiddenLayout(hidden_exe_writer, length)
+            multiplier = self.priceScale // self.returnPriceDenominator(length)
+            self.layouts[ord(transType)] = (transType, kind, layout, multiplier)
+        self.width = max(end for transType, kind, layout, multiplier in self.layouts.values()
+                         for start, end in layout.values())
+
+
+    def span(self, loc, length=None):
+        """
+        Returns (start, end) for an entry of a *_loc table.
+        """
+        if length is not None:
+            loc = loc[length]
+        return loc['start'], loc['end']
+
+
+    def passiveLayout(self, writer, length):
+        return {'timeStamp': self.span(writer.timestamp_loc),
+                'orderId': self.span(writer.orderid_loc),
+                'transSide': (writer.transside_loc, writer.transside_loc + 1),
+                'volume': self.span(writer.volume_loc, length),
+                'price': self.span(writer.price_loc, length),
+                'security': self.span(writer.security_loc, length)}
+
+
+    def executionLayout(self, writer, length):
+        return {'timeStamp': self.span(writer.timestamp_loc),
+                'passiveId': self.span(writer.passive_id_loc),
+                'volume': self.span(writer.volume_loc, length),
+                'tradeRef': self.span(writer.traderef_loc, length),
+                'contraId': self.span(writer.contra_id_loc, length)}
+
+
+    def cancelLayout(self, writer, length):
+        return {'timeStamp': self.span(writer.timestamp_loc),
+                'orderId': self.span(writer.orderid_loc),
+                'volume': self.span(writer.volume_loc, length)}
+
+
+    def hiddenLayout(self, writer, length):
+        return {'timeStamp': self.span(writer.timestamp_loc),
+                'hiddenId': self.span(writer.id_loc, length),
+                'volume': self.span(writer.volume_loc, length),
+                'price': self.span(writer.price_loc, length),
+                'security': self.span(writer.security_loc, length)}
+
+
+    def byteMatrix(self, rows):
+        """
+        Loads a block of rows (bytes or str) into an (n, width) uint8 matrix, padding short rows with spaces.
+        """
+        if len(rows) and type(rows[0]) == str:
+            rows = [row.encode('ascii') for row in rows]
+        width = self.width
+        # a fixed width bytes array truncates long rows and pads short ones with NULs, in one call
+        matrix = np.array(rows, dtype='S%d' % width).view(np.uint8).reshape(len(rows), width).copy()
+        matrix[(matrix == 0) | (matrix == 10) | (matrix == 13)] = 32  # padding and line endings read as spaces
+        return matrix
+
+
+    def intColumn(self, matrix, span):
+        """
+        Parses a right or left aligned numeric field of every row into an int64 column.
+        Raises ValueError for fields that are blank or contain anything other than one run of digits with spaces
+        around it, as int() would.
+        The digits are weighted by their place value in one matrix product, and left aligned fields are then divided
+        down by the place value of their trailing spaces.
+        """
+        field = matrix[:, span[0]:span[1]]
+        width = field.shape[1]
+        isDigit = (field >= 48) & (field <= 57)
+        count = isDigit.sum(axis=1)
+        first = isDigit.argmax(axis=1)
+        trailing = isDigit[:, ::-1].argmax(axis=1)
+        bad = (count == 0) | (count != width - trailing - first) | ~np.all(isDigit | (field == 32), axis=1)
+        if bad.any():
+            raise ValueError("invalid literal for int(): '%s'" % (
+                field[np.flatnonzero(bad)[0]].tobytes().decode('ascii', 'replace')))
+        powers = 10 ** np.arange(width - 1, -1, -1, dtype=np.int64)
+        column = np.where(isDigit, field - 48, 0).astype(np.int64) @ powers
+        return column // powers[width - 1 - trailing]
+
+
+    def textColumn(self, matrix, span):
+        """
+        Returns a stripped text field of every row as a list of str.
+        """
+        return list(map(str.strip, splitColumn(matrix[:, span[0]:span[1]])))
+
+
+    def sideColumn(self, matrix, span):
+        """
+        Converts the "B"/"S" side of every row to "Bid"/"Ask". Raises error if value unknown.
+        """
+        side = matrix[:, span[0]]
+        unknown = (side != 66) & (side != 83)
+        if unknown.any():
+            raise ValueError("Unknown transSide: %s" % chr(side[np.flatnonzero(unknown)[0]]))
+        return list(map(('Bid', 'Ask').__getitem__, (side == 83).tolist()))
+
+
+    def timeStampColumn(self, matrix, span):
+        return formatTimeStamps(self.intColumn(matrix, span))
+
+
+    def priceColumn(self, matrix, span, multiplier):
+        return (self.intColumn(matrix, span) * multiplier).tolist()
+
+
+    def securityColumns(self, matrix, transTypes):
+        """
+        Interns the security of every row that carries one and returns a dict of transType code -> list of security
+        codes for the rows of that transType. Unseen securities are interned in row order, as row by row decoding would.
+        """
+        groups = []
+        firstSeen = []
+        for code, (transType, kind, layout, multiplier) in self.layouts.items():
+            if 'security' not in layout:
+                continue
+            index = np.flatnonzero(transTypes == code)
+            if not len(index):
+                continue
+            start, end = layout['security']
+            field = np.ascontiguousarray(matrix[index, start:end]).view('S%d' % (end - start)).ravel()
+            uniques, first, inverse = np.unique(field, return_index=True, return_inverse=True)
+            symbols = list(map(str.strip, splitColumn(uniques.view(np.uint8).reshape(len(uniques), end - start))))
+            groups.append((code, symbols, inverse))
+            firstSeen.extend(zip(index[first].tolist(), symbols))
+        for row, symbol in sorted(firstSeen):
+            self.securityTable.intern(symbol)
+        intern = self.securityTable.intern
+        return dict((code, np.array([intern(symbol) for symbol in symbols])[inverse.ravel()].tolist())
+                    for code, symbols, inverse in groups)
+
+
+    def decodeBlock(self, rows):
+        """
+        Takes a list of raw rows and returns a list of records in the same order.
+        Rows whose transType is not handled give None, matching MessageDecoder.decode.
+        The cyclic garbage collector is paused while the block is built: every record of the block stays alive until
+        it is returned, so each collection the allocations would trigger walks the growing block for nothing (records
+        hold no reference cycles).
+        """
+        records = [None] * len(rows)
+        if not rows:
+            return records
+        collecting = gc.isenabled()
+        gc.disable()
+        try:
+            self.fillRecords(rows, records)
+        finally:
+            if collecting:
+                gc.enable()
+        return records
+
+
+    def fillRecords(self, rows, records):
+        """
+        Decodes a non-empty block of rows into the records list, by transType group.
+        """
+        matrix = self.byteMatrix(rows)
+        transTypes = matrix[:, self.transtype_loc]
+        securities = self.securityColumns(matrix, transTypes)
+        for code in np.unique(transTypes).tolist():
+            if code not in self.layouts:
+                continue
+            transType, kind, layout, multiplier = self.layouts[code]
+            index = np.flatnonzero(transTypes == code)
+            group = matrix[index]
+            timeStamps = self.timeStampColumn(group, layout['timeStamp'])
+            volumes = self.intColumn(group, layout['volume']).tolist()
+            if kind == 'A':
+                columns = zip(timeStamps, self.textColumn(group, layout['orderId']),
+                              self.sideColumn(group, layout['transSide']), volumes,
+                              self.priceColumn(group, layout['price'], multiplier),
+                              securities[code])
+                for i, (timeStamp, orderId, transSide, volume, price, security) in zip(index.tolist(), columns):
+                    record = decoder.PassiveRecord()
+                    record.transType = transType
+                    record.timeStamp = timeStamp
+                    record.orderId = orderId
+                    record.transSide = transSide
+                    record.volume = volume
+                    record.price = price
+                    record.security = security
+                    records[i] = record
+            elif kind == 'E':
+                columns = zip(timeStamps, self.textColumn(group, layout['passiveId']), volumes,
+                              self.textColumn(group, layout['tradeRef']),
+                              self.textColumn(group, layout['contraId']))
+                for i, (timeStamp, passiveId, volume, tradeRef, contraId) in zip(index.tolist(), columns):
+                    record = decoder.ExecutionRecord()
+                    record.transType = transType
+                    record.timeStamp = timeStamp
+                    record.passiveId = passiveId
+                    record.volume = volume
+                    record.tradeRef = tradeRef
+                    record.contraId = contraId
+                    records[i] = record
+            elif kind == 'X':
+                columns = zip(timeStamps, self.textColumn(group, layout['orderId']), volumes)
+                for i, (timeStamp, orderId, volume) in zip(index.tolist(), columns):
+                    record = decoder.CancelRecord()
+                    record.transType = transType
+                    record.timeStamp = timeStamp
+                    record.orderId = orderId
+                    record.volume = volume
+                    records[i] = record
+            else:
+                columns = zip(timeStamps, self.intColumn(group, layout['hiddenId']).tolist(), volumes,
+                              self.priceColumn(group, layout['price'], multiplier),
+                              securities[code])
+                for i, (timeStamp, hiddenId, volume, price, security) in zip(index.tolist(), columns):
+                    record = decoder.HiddenRecord()
+                    record.transType = transType
+                    record.timeStamp = timeStamp
+                    record.hiddenId = hiddenId
+                    record.volume = volume
+                    record.price = price
+                    record.security = security
+                    records[i] = record
@@ -0,0 +1,312 @@
+"""End-to-end benchmarks for the converter, with a JSON baseline for regression tracking.
+The run command benchmarks Parser.parse (rows held in memory) and runParser (file to file) on the first N rows of an
+input file for each size in -sizes, and reports rows/sec, MB/sec, the peak RSS of the process and the cost of each
+transType. With -batchrows it also compares decoding (rows held in memory) and runParser row by row against decoding
+in blocks with batch.BatchDecoder. Every measurement runs in a fresh worker process so that peak RSS and caches are
+per measurement, and the best of -repeat runs is kept. Results are written as JSON; the compare command compares two
+result files and exits with status 1 if any throughput fell by more than -threshold."""
+
+import argparse
+import gc
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+import convertRun
+import generator
+import instrument
+import reader
+
+
+def peakRSS():
+    """
+    Returns the peak resident set size of the current process in bytes (ru_maxrss is in kB on Linux, bytes on macOS).
+    """
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+
+def writePrefix(input_path, output_path, rows):
+    """
+    Writes the first rows rows of the input file to output_path. Returns (rows written, bytes written), fewer rows if
+    the input is shorter.
+    """
+    written = 0
+    size = 0
+    with open(input_path, 'rb') as input_file, open(output_path, 'wb') as output_file:
+        for line in input_file:
+            if written >= rows:
+                break
+            output_file.write(line)
+            written += 1
+            size += len(line)
+    return written, size
+
+
+def benchParse(input_path, typeCosts=False):
+    """
+    Times Parser.parse over the rows of the input file, read into memory first, with a fresh Parser.
+    If typeCosts is True each row is timed on its own and the cost is added up by transType (the timer overhead is
+    measured and taken off), which slows the run, so it is a separate measurement from the throughput one.
+    Returns a dict of results.
+    """
+    with open(input_path, 'rb') as input_file:
+        data = input_file.read()
+    rows = [row for row in data.decode('ascii').split('\n') if row[9:10] not in ('', 't')]
+    pasr = convertRun.buildParser()
+    parse = pasr.parse
+    gc.collect()
+
+    if not typeCosts:
+        start = time.perf_counter()
+        for row in rows:
+            parse(row)
+        pasr.flush()
+        seconds = time.perf_counter() - start
+        return {'rows': len(rows), 'bytes': len(data), 'seconds': seconds, 'peakRSS': peakRSS()}
+
+    clock = time.perf_counter
+    start = clock()
+    for row in rows:
+        clock()
+    overhead = (clock() - start) / max(1, len(rows))  # one extra clock call per row
+
+    costs = {}
+    counts = {}
+    for row in rows:
+        start = clock()
+        parse(row)
+        elapsed = clock() - start
+        transType = row[9]
+        costs[transType] = costs.get(transType, 0.0) + elapsed
+        counts[transType] = counts.get(transType, 0) + 1
+    return {'types': dict((transType, {'rows': counts[transType],
+                                       'nsPerRow': max(0.0, costs[transType] / counts[transType] - overhead) * 1e9})
+                          for transType in sorted(counts))}
+
+
+def benchDecode(input_path, batchrows=None):
+    """
+    Times decoding the rows of the input file, read into memory first, into records with a fresh Parser's decoder:
+    row by row with decoder.MessageDecoder, or in blocks of batchrows rows with batch.BatchDecoder if batchrows is
+    given. Returns a dict of results.
+    """
+    with open(input_path, 'rb') as input_file:
+        data = input_file.read()
+    pasr = convertRun.buildParser()
+    if batchrows is None:
+        rows, skipped = reader.splitRows(data, pasr.passive_writer.transtype_loc)
+        gc.collect()
+        start = time.perf_counter()
+        for record in map(pasr.decoder.decode, rows):
+            pass
+    else:
+        import batch  # numpy is only needed when decoding in bulk
+        rows, skipped = reader.splitRows(data, pasr.passive_writer.transtype_loc, text=False)
+        decodeBlock = batch.BatchDecoder(pasr.passive_writer, pasr.agg_handler, pasr.amd_del_writer,
+                                         pasr.hidden_exe_writer).decodeBlock
+        gc.collect()
+        start = time.perf_counter()
+        for first in range(0, len(rows), batchrows):
+            for record in decodeBlock(rows[first:first + batchrows]):
+                pass
+    seconds = time.perf_counter() - start
+    return {'rows': len(rows), 'bytes': len(data), 'seconds': seconds, 'peakRSS': peakRSS()}
+
+
+def benchRun(input_path, batchrows=None):
+    """
+    Times runParser from the input file to an output file in a temporary directory, with a fresh Parser.
+    Returns a dict of results.
+    """
+    work_dir = tempfile.mkdtemp(prefix='.bench_')
+    try:
+        start = time.perf_counter()
+        stats = convertRun.runParser(input_path, os.path.join(work_dir, 'output.txt'), convertRun.buildParser(),
+                                     batchrows=batchrows)
+        seconds = time.perf_counter() - start
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return {'rows': stats['rows'], 'bytes': os.path.getsize(input_path), 'seconds': seconds,
+            'linesWritten': stats['linesWritten'], 'peakRSS': peakRSS()}
+
+
+def measure(task):
+    """
+    Pool task: takes (benchmark name, input path, options) and returns the benchmark's results.
+    """
+    name, input_path, options = task
+    instrument.configureLogging(nolog=True)
+    if name == 'parse':
+        return benchParse(input_path, **options)
+    if name == 'decode':
+        return benchDecode(input_path, **options)
+    return benchRun(input_path, **options)
+
+
+def isolated(name, input_path, **options):
+    """
+    Runs one measurement in a fresh worker process. Returns its results.
+    """
+    pool = multiprocessing.Pool(1, maxtasksperchild=1)
+    try:
+        return pool.apply(measure, ((name, input_path, options),))
+    finally:
+        pool.close()
+        pool.join()
+
+
+def best(results):
+    """
+    Takes the results of repeated runs and returns the fastest, with the peak RSS the highest of the runs.
+    """
+    fastest = dict(min(results, key=lambda result: result['seconds']))
+    fastest['peakRSS'] = max(result['peakRSS'] for result in results)
+    fastest['rowsPerSec'] = fastest['rows'] / fastest['seconds'] if fastest['seconds'] else 0.0
+    fastest['mbPerSec'] = fastest['bytes'] / float(1 << 20) / fastest['seconds'] if fastest['seconds'] else 0.0
+    return fastest
+
+
+def runBenchmarks(input_path, sizes, repeat=3, batchrows=None):
+    """
+    Runs the parse and runParser benchmarks for each size (rows taken from the start of the input file).
+    If batchrows is given, runParser is benchmarked with rows decoded in blocks of batchrows rows, and the decoding
+    of the rows is benchmarked both row by row ('decode') and in blocks ('decodeBatch'), with runParser row by row
+    ('runParserRows') for comparison.
+    Returns the results dict written to the JSON file.
+    """
+    results = {'input': os.path.abspath(input_path), 'python': platform.python_version(),
+               'platform': platform.platform(), 'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+               'repeat': repeat, 'batchrows': batchrows, 'sizes': []}
+    work_dir = tempfile.mkdtemp(prefix='.bench_')
+    try:
+        for size in sizes:
+            sample_path = os.path.join(work_dir, 'input_%s.txt' % size)
+            rows, size_bytes = writePrefix(input_path, sample_path, size)
+            if rows < size:
+                logging.warning("Input has only %s rows, size %s runs on %s rows", rows, size, rows)
+            parse_result = best([isolated('parse', sample_path) for i in range(repeat)])
+            parse_result.update(isolated('parse', sample_path, typeCosts=True))
+            run_result = best([isolated('run', sample_path, batchrows=batchrows) for i in range(repeat)])
+            entry = {'size': size, 'rows': rows, 'bytes': size_bytes, 'parse': parse_result, 'runParser': run_result}
+            if batchrows:
+                # the row by row and block measurements alternate, so a change in machine load hits both
+                decode_runs, batch_runs, run_rows = [], [], []
+                for i in range(repeat):
+                    decode_runs.append(isolated('decode', sample_path))
+                    batch_runs.append(isolated('decode', sample_path, batchrows=batchrows))
+                    run_rows.append(isolated('run', sample_path))
+                entry.update(decode=best(decode_runs), decodeBatch=best(batch_runs), runParserRows=best(run_rows))
+                logging.info("%s rows: decode %.0f rows/s row by row, %.0f rows/s in blocks of %s", rows,
+                             entry['decode']['rowsPerSec'], entry['decodeBatch']['rowsPerSec'], batchrows)
+            results['sizes'].append(entry)
+            logging.info("%s rows: parse %.0f rows/s, runParser %.0f rows/s %.1f MB/s, peak RSS %.1f MB", rows,
+                         parse_result['rowsPerSec'], run_result['rowsPerSec'], run_result['mbPerSec'],
+                         run_result['peakRSS'] / float(1 << 20))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+
+def printResults(results, output_file=sys.stdout):
+    """
+    Prints the throughput table and the per-transType cost table of a results dict.
+    """
+    output_file.write("%10s %14s %14s %10s %12s\n" % ('rows', 'parse rows/s', 'run rows/s', 'run MB/s',
+                                                     'peak RSS MB'))
+    for entry in results['sizes']:
+        output_file.write("%10s %14.0f %14.0f %10.2f %12.1f\n" % (
+            entry['rows'], entry['parse']['rowsPerSec'], entry['runParser']['rowsPerSec'],
+            entry['runParser']['mbPerSec'], entry['runParser']['peakRSS'] / float(1 << 20)))
+    if any('decodeBatch' in entry for entry in results['sizes']):
+        output_file.write("\nRow by row against blocks of %s rows:\n%10s %14s %14s %8s %14s %14s %8s\n" % (
+            results['batchrows'], 'rows', 'decode rows/s', 'batch rows/s', 'speedup', 'run rows/s', 'batch run',
+            'speedup'))
+        for entry in results['sizes']:
+            if 'decodeBatch' not in entry:
+                continue
+            decode, decodeBatch = entry['decode']['rowsPerSec'], entry['decodeBatch']['rowsPerSec']
+            run, runBatch = entry['runParserRows']['rowsPerSec'], entry['runParser']['rowsPerSec']
+            output_file.write("%10s %14.0f %14.0f %7.2fx %14.0f %14.0f %7.2fx\n" % (
+                entry['rows'], decode, decodeBatch, decodeBatch / decode if decode else 0.0, run, runBatch,
+                runBatch / run if run else 0.0))
+    for entry in results['sizes']:
+        output_file.write("\nPer transType cost at %s rows:\n%10s %10s %10s\n" % (entry['rows'], 'transType', 'rows',
+                                                                                'ns/row'))
+        for transType, cost in sorted(entry['parse']['types'].items()):
+            output_file.write("%10s %10s %10.0f\n" % (transType, cost['rows'], cost['nsPerRow']))
+
+
+def compareResults(baseline, current, threshold=0.1, output_file=sys.stdout):
+    """
+    Compares the rows/sec of each benchmark and size in two results dicts. Prints the change for each and returns the
+    list of (size, benchmark, change) that fell by more than threshold (a fraction, 0.1 for 10%).
+    """
+    baseline_sizes = dict((entry['size'], entry) for entry in baseline['sizes'])
+    regressions = []
+    output_file.write("%10s %10s %14s %14s %9s\n" % ('size', 'benchmark', 'baseline', 'current', 'change'))
+    for entry in current['sizes']:
+        before = baseline_sizes.get(entry['size'])
+        if before is None:
+            continue
+        for name in ('parse', 'runParser', 'decode', 'decodeBatch', 'runParserRows'):
+            if name not in before or name not in entry:
+                continue
+            old, new = before[name]['rowsPerSec'], entry[name]['rowsPerSec']
+            change = (new - old) / old if old else 0.0
+            flag = ''
+            if change < -threshold:
+                regressions.append((entry['size'], name, change))
+                flag = ' REGRESSION'
+            output_file.write("%10s %10s %14.0f %14.0f %+8.1f%%%s\n" % (entry['size'], name, old, new, change * 100,
+                                                                      flag))
+    return regressions
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(description='Benchmarks the converter and compares results against a baseline')
+    commands = argparser.add_subparsers(dest='command')
+    commands.required = True
+
+    run_args = commands.add_parser('run', help='run the benchmarks and write the results as JSON')
+    run_args.add_argument('input_path', type=str, help='ChiX input file, each size runs on its first rows')
+    run_args.add_argument('results_path', type=str, help='The JSON results file path')
+    run_args.add_argument('-sizes', default='10000,100000,1000000', type=str, help='comma separated row counts, defaults to 10000,100000,1000000')
+    run_args.add_argument('-repeat', default=3, type=int, help='runs per measurement, the fastest is kept, defaults to 3')
+    run_args.add_argument('-batchrows', default=None, type=int, help='benchmark runParser with rows decoded in blocks of this many rows')
+    run_args.add_argument('-seed', default=None, type=int, help='first write input_path with generator.py (the largest size in rows, default options) from this seed')
+
+    compare_args = commands.add_parser('compare', help='compare results against a baseline')
+    compare_args.add_argument('baseline_path', type=str, help='The baseline JSON results file')
+    compare_args.add_argument('results_path', type=str, help='The JSON results file to check')
+    compare_args.add_argument('-threshold', default=10.0, type=float, help='percent drop in rows/sec flagged as a regression, defaults to 10')
+
+    args = argparser.parse_args()
+    instrument.configureLogging()
+    logging.disable(logging.DEBUG)
+
+    if args.command == 'run':
+        sizes = [int(size) for size in args.sizes.split(',')]
+        if args.seed is not None:
+            generator.WorkloadGenerator(args.seed).write(args.input_path, max(sizes))
+        results = runBenchmarks(args.input_path, sizes, args.repeat, args.batchrows)
+        results['seed'] = args.seed
+        with open(args.results_path, 'w') as results_file:
+            json.dump(results, results_file, indent=2, sort_keys=True)
+        printResults(results)
+    else:
+        with open(args.baseline_path) as baseline_file:
+            baseline = json.load(baseline_file)
+        with open(args.results_path) as results_file:
+            current = json.load(results_file)
+        regressions = compareResults(baseline, current, args.threshold / 100.0)
+        if regressions:
+            print("%s throughput regressions beyond %s%%" % (len(regressions), args.threshold))
+            sys.exit(1)
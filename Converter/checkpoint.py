@@ -0,0 +1,32 @@
+import os
+import pickle
+
+
+VERSION = 4
+
+
+def save(path, state):
+    """
+    Writes a checkpoint: a dict holding the pickled Parser (order store, undisclosed registry, security table, agg and
+    cancel caches and the Parser flags) and the input and output positions it matches.
+    The checkpoint is written to a temporary file and moved over the old one, so a crash while saving leaves the last
+    complete checkpoint in place.
+    """
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as checkpoint_file:
+        pickle.dump(dict(state, version=VERSION), checkpoint_file, pickle.HIGHEST_PROTOCOL)
+        checkpoint_file.flush()
+        os.fsync(checkpoint_file.fileno())
+    os.replace(temp_path, path)
+
+
+def load(path):
+    """
+    Reads a checkpoint written by save() and returns its state dict.
+    Raises ValueError if the checkpoint was written by a different version of the converter.
+    """
+    with open(path, 'rb') as checkpoint_file:
+        state = pickle.load(checkpoint_file)
+    if state.get('version') != VERSION:
+        raise ValueError("Checkpoint %s has version %s, expected %s" % (path, state.get('version'), VERSION))
+    return state
@@ -1,6 +1,6 @@
 """This script takes the specified arguments in command line and runs the converter modules to process ChiX daily data into SMARTS format.
 Mandatory arguments are the  input and output file locations.
-Must order output files by timestamp to deal with caching before print.
+Must order output files by timestamp to deal with caching before print (merge.py merges and orders output files).
 Must convert to FAV before reading into SMARTS"""
 
 # standard imports
@@ -9,65 +9,320 @@ import logging
 import multiprocessing
 import os
 import sys
+import time
 
 # import custom modules
 import aggressive
 import amend_delete
+import checkpoint
 import hidden
+import instrument
+import metrics
+import output
 import parser
 import passive
+import profiling
+import reader
+import render
+import reorder
+import scheduler
 
 # This section can be added to specify the dir python should search to access the library
 #lib_path = ""  # this must be set to add the path of the lib to python so modules can be found
 #sys.path.append(lib_path) # this adds the path of the lib to python so that the modules can be found
 
-# set up logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
 
-def runParser(input_path, output_path, pasr, maxrows=None):
+def runParser(input_path, output_path, pasr, maxrows=None, batchrows=None, purge=False, securities_path=None,
+              flushlines=65536, chunkbytes=1 << 24, reorderlines=None, binary=False, checkpointrows=None, resume=False,
+              follow=False, idleflush=1.0, followstop=None, profiler=None, run_metrics=None):
+    """
+    Runs the parser over every row of the input file and writes the converted messages to the output file.
+    If batchrows is given, rows are read and decoded in blocks of that many rows with batch.BatchDecoder.
+    If purge is True, orders still live at the end of the file are purged from the order store (end of session).
+    If securities_path is given, the security table (integer code -> symbol) is written there as a sidecar file.
+    The input is memory-mapped and split into rows chunkbytes at a time by reader.ChunkedReader, which drops blank and
+    comment ('t') rows.
+    Output lines are buffered and written flushlines lines at a time.
+    If reorderlines is given, output lines are put in timestamp order by reorder.ReorderBuffer, holding at most
+    reorderlines lines.
+    If binary is True, pasr must have been built with a render.BinaryRenderer (buildParser(binary=True)) and the output
+    is written as binary records, see render.readRecords. The reorder buffer is not available for binary output.
+    If checkpointrows is given, a checkpoint (see checkpoint.save) is written to <output_path>.checkpoint at the end of
+    the first input chunk after every checkpointrows rows, and removed when the run completes. If resume is True and a
+    checkpoint exists, the run restarts from it (pasr is replaced by the checkpointed parser), and the output is the same
+    as an uninterrupted run.
+    At the end of the input, msgs still waiting for a later row (a pending agg ENTER or DELET) are written out with
+    Parser.flush.
+    If follow is True, the input is followed as it grows (like tail -f): output is flushed to the file each time the
+    input is polled, pending msgs are flushed once the input has been idle for idleflush seconds, and the run ends once
+    no data has arrived for followstop seconds (or on Ctrl-C if followstop is None).
+    Per-row logging is done only for the rows sampled by instrument.tracer (every row unless -logevery is given, none
+    with --nolog). When there is no per-row logging, maxrows, reorder buffer or profiler, each input block is parsed
+    with one Parser.parseMany (or parseRecords) call and its msgs written in one call.
+    If profiler (profiling.StageProfiler) is given, the read, decode, parse, render and write stages of the run are
+    timed with it. Profiling cannot be combined with checkpoints.
+    If run_metrics (metrics.RunMetrics) is given, rows and output lines are counted and a snapshot of the run is
+    published every run_metrics.interval seconds and at the end.
+    If a row raises, the lines of the rows before it (and the msgs they left pending) are written out and the output file
+    closed before the error is raised.
+    Returns a dict of run stats: rows parsed and skipped, lines written, orders live, retired and undisclosed at the end,
+    and the number of securities seen.
+    """
     logging.info("Run Starting...")
 
-    # open reader and writer objects
-    reader_object = open(input_path, 'rb')
-    writer_object = open(output_path, 'w')
-
-    counter = 0  # set counter to allow for modification of the number of row written
-    for row in reader_object:
-
-        #logging.info("\n\n\n####")  # add enter lines for readability
-
-        # Check if using python 3.0 or higher, if python 3 or above, convert to utf-8
-        if sys.version_info >= (3,0):
-            row = str(row,'utf-8')
+    if binary and reorderlines:
+        raise ValueError("The reorder buffer cannot be used with binary output")
+    if profiler is not None and checkpointrows:
+        raise ValueError("Profiling cannot be used with checkpoints")
+
+    checkpoint_path = output_path + ".checkpoint"
+    state = None
+    if resume:
+        if os.path.exists(checkpoint_path):
+            state = checkpoint.load(checkpoint_path)
+            if state['inputPath'] != os.path.abspath(input_path):
+                raise ValueError("Checkpoint %s is for input %s" % (checkpoint_path, state['inputPath']))
+            logging.info("Resuming from checkpoint after %s rows", state['rows'])
+        else:
+            logging.info("No checkpoint to resume from, starting from the beginning")
 
-        # Skip blank line
-        if row is "\n":
-            continue
+    # open reader and writer objects
+    if state is None:
+        reader_object = reader.ChunkedReader(input_path, pasr.passive_writer.transtype_loc, chunkbytes)
+        output_file = open(output_path, 'wb' if binary else 'w')
+        header = render.MAGIC
+    else:
+        pasr = state['parser']
+        reader_object = reader.ChunkedReader(input_path, pasr.passive_writer.transtype_loc, chunkbytes,
+                                             start=state['inputOffset'])
+        reader_object.rowsSkipped = state['rowsSkipped']
+        os.truncate(output_path, state['outputPosition'])  # drop output written after the checkpoint
+        output_file = open(output_path, 'ab' if binary else 'a')
+        header = b''
+
+    if binary:
+        line_writer = output.BufferedRecordWriter(output_file, flushlines, header=header)
+    else:
+        line_writer = output.BufferedLineWriter(output_file, flushlines)
+    writer_object = reorder.ReorderBuffer(line_writer, reorderlines) if reorderlines else line_writer
 
-        logging.info("####\n\n%s\n" % row) # display the input row
+    if profiler is not None:
+        line_writer.flush = profiler.timed('write', line_writer.flush)
+        profiler.instrumentParser(pasr)
 
-        counter += 1  # add one to counter for each order written
-        msg = pasr.parse(row)
-        logging.info(counter)
+    def readBlocks(**options):
+        blocks = reader_object.blocks(follow=follow, stopAfter=followstop, **options)
+        return profiler.timedIterator('read', blocks) if profiler is not None else blocks
 
-        if msg == 0:  # ignore messages that are not handled by the modules. Parser module processes unknown types as 0 (line 54)
-            continue
+    counter = 0  # set counter to allow for modification of the number of row written
+    if state is not None:
+        counter = state['rows']
+        line_writer.linesWritten = state['linesWritten']
+        if reorderlines:
+            writer_object.heap, writer_object.sequence, writer_object.forcedCount = state['reorder']
+    if run_metrics is not None:
+        writer_object = metrics.MetricsWriter(writer_object, run_metrics)
+
+    def saveCheckpoint():
+        # flush the written lines, then save the parser with the positions it matches
+        line_writer.flush()
+        output_file.flush()
+        checkpoint.save(checkpoint_path, {
+            'inputPath': os.path.abspath(input_path),
+            'inputOffset': reader_object.offset,
+            'rowsSkipped': reader_object.rowsSkipped,
+            'outputPosition': os.fstat(output_file.fileno()).st_size,
+            'linesWritten': line_writer.linesWritten,
+            'rows': counter,
+            'reorder': (writer_object.heap, writer_object.sequence, writer_object.forcedCount) if reorderlines else None,
+            'parser': pasr,
+            })
+        logging.info("Checkpoint saved after %s rows", counter)
+
+    def writeFlushed():
+        # write out the msgs still waiting for a later row
+        msgs = pasr.flush()
+        writer_object.writeLines(msgs)
+        if reorderlines:
+            writer_object.release(pasr.watermark())
+
+    def bulkDecoder():
+        # returns the function decoding blocks of raw rows into records in bulk
+        import batch  # numpy is only needed when decoding in bulk
+        batch_decoder = batch.BatchDecoder(pasr.passive_writer, pasr.agg_handler, pasr.amd_del_writer,
+                                           pasr.hidden_exe_writer)
+        if profiler is not None:
+            return profiler.timed('decode', batch_decoder.decodeBlock)
+        return batch_decoder.decodeBlock
+
+    # the generators yield (None, rows in the chunk) at the end of each input chunk, where a checkpoint can be taken
+    # (and when following the input, (None, 0) each time it is found idle)
+    def parseRows():
+        # parse rows one at a time, decoding each row as it is parsed
+        decode = pasr.decoder.decode
+        if profiler is not None:
+            decode = profiler.timed('decode', decode)
+        for block in readBlocks():
+            for row in block:
+                yield row, decode(row)
+            yield None, len(block)
+
+    def parseBlocks():
+        # parse rows from blocks of records decoded in bulk
+        decodeBlock = bulkDecoder()
+        # the batch decoder works on the raw bytes
+        for block in readBlocks(text=False):
+            for start in range(0, len(block), batchrows):
+                rows = block[start:start + batchrows]
+                for row, record in zip(rows, decodeBlock(rows)):
+                    yield row, record
+            yield None, len(block)
+
+    def parseWholeBlocks():
+        # parse each block in one call (Parser.parseMany, or Parser.parseRecords for records decoded in bulk) and
+        # write its msgs in one call, used when nothing has to look at single rows
+        nonlocal counter
+        decodeBlock = bulkDecoder() if batchrows else None
+        for block in readBlocks(text=not batchrows):
+            msgs = []
+            try:
+                if batchrows:
+                    for start in range(0, len(block), batchrows):
+                        pasr.parseRecords(decodeBlock(block[start:start + batchrows]), msgs)
+                else:
+                    pasr.parseMany(block, msgs)
+            finally:
+                writer_object.writeLines(msgs)  # a row that raises keeps the msgs of the rows before it
+            counter += len(block)
+            if run_metrics is not None:
+                run_metrics.countRows(block)
+            yield None, len(block)
+
+    # rows are parsed from their record, decoded one at a time by parseRows or in bulk by parseBlocks
+    parse = pasr.parseRecord
+    if profiler is not None:
+        parse = profiler.timed('parse', parse)
+
+    tracer = instrument.tracer
+    if maxrows is None and not reorderlines and profiler is None and not tracer.active:
+        rowSource = parseWholeBlocks()
+    else:
+        rowSource = parseBlocks() if batchrows else parseRows()
+    checkpointed = counter
+    lastData = time.time()
+    flushPending = False  # rows have arrived since the last idle flush
+    completed = False
+    try:
+        try:
+            for row, item in rowSource:
+
+                if row is None:  # end of an input chunk, or an idle poll when following the input
+                    if run_metrics is not None and run_metrics.due():
+                        run_metrics.update(pasr, reader_object)
+                    if checkpointrows and counter - checkpointed >= checkpointrows:
+                        saveCheckpoint()
+                        checkpointed = counter
+                    if follow:
+                        if item:
+                            lastData = time.time()
+                            flushPending = True
+                        elif flushPending and time.time() - lastData >= idleflush:
+                            writeFlushed()
+                            flushPending = False
+                        line_writer.flush()  # bounded latency, the lines converted so far reach the file
+                        output_file.flush()
+                    continue
+
+                counter += 1  # add one to counter for each order written
+                if run_metrics is not None:
+                    run_metrics.countRow(row[9])
+                    if not counter & 0xfff and run_metrics.due():
+                        run_metrics.update(pasr, reader_object)
+                if tracer.active and tracer.startRow(counter):
+                    logging.info("####\n\n%s\n", row) # display the input row
+
+                msg = parse(item)
+
+                if tracer.enabled:
+                    logging.info("%s: %s", counter, msg) # display the row counter and the output message(s)
+
+                if msg == 0:  # ignore messages that are not handled by the modules. Parser module processes unknown types as 0 (line 54)
+                    if reorderlines:
+                        writer_object.release(pasr.watermark())
+                    continue
+
+                if type(msg) == tuple:
+                    writer_object.writeLines(msg) # composite output, eg. trade and agg ENTER
+                elif msg != "undisclosed order":
+                    writer_object.write(msg)
+                if reorderlines:
+                    writer_object.release(pasr.watermark())  # write out the lines no later msg can come before
+
+                if maxrows is not None:
+                    if counter > maxrows: # allows for specification of number of rows to process
+                        break # exit after writing the number of rows specified
+        except KeyboardInterrupt:
+            if not follow:
+                raise
+            logging.info("Stopped following the input")
+        completed = True
+    finally:
+        # the lines converted before an error are written out too
+        try:
+            writeFlushed()  # end of the input
+        except Exception:
+            if completed:
+                raise
+            logging.exception("Pending msgs not written after the run failed")
+        finally:
+            writer_object.close()
+    if profiler is not None:
+        profiler.restoreParser(pasr)
+    if run_metrics is not None:
+        run_metrics.update(pasr, reader_object, done=True)
+    logging.info("Rows skipped (blank or comment): %s", reader_object.rowsSkipped)
+
+    order_store = pasr.passive_writer.orderStore
+    undisclosed_orders = pasr.passive_writer.undisclosedOrders
+    if purge:
+        logging.info("End of session, purged %s live orders and %s undisclosed orders" % (
+            order_store.purge(), undisclosed_orders.purge()))
+    logging.info("Orders live: %s, retired: %s, undisclosed: %s" % (len(order_store), order_store.retiredCount,
+                                                                   len(undisclosed_orders)))
+
+    if securities_path is not None:
+        pasr.securityTable.dump(securities_path)
+
+    if checkpointrows and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)  # the run is complete
+
+    return {'rows': counter, 'rowsSkipped': reader_object.rowsSkipped, 'linesWritten': line_writer.linesWritten,
+            'ordersLive': len(order_store), 'ordersRetired': order_store.retiredCount,
+            'undisclosed': len(undisclosed_orders), 'securities': len(pasr.securityTable)}
+
+
+def buildParser(binary=False):
+    """
+    Returns a new Parser with fresh writers (and so a fresh order store and security table).
+    If binary is True the Parser renders binary records instead of text lines.
+    """
+    return parser.Parser(
+            aggressive.AggHandler(),
+            passive.PassiveOrderWriter(),
+            amend_delete.AmdDelWriter(),
+            hidden.HiddenExeWriter(),
+            render.BinaryRenderer() if binary else None,
+            )
 
-        if type(msg) == dict:
-            logging.info(msg) # display the output messages
-            for key, value in msg.items():
-                if value != "undisclosed order":
-                    writer_object.write(value + "\n") # write the messages to the output file, with an enter at the end of the line
-        else:
-            logging.info(msg) # display the output message
-            if msg != "undisclosed order":
-                writer_object.write(msg + "\n")  # write the message to the output file, with an enter at the end of the line
 
-        if maxrows is not None:
-            if counter > maxrows: # allows for specification of number of rows to process
-                writer_object.close()
-                break # exit after writing the number of rows specified
+def runFileJob(job):
+    """
+    Runs the parser for one scheduler.FileJob with a parser built in the worker. Returns the stats from runParser.
+    Metrics are published if the pool was set up for them (see metrics.workerMetrics).
+    """
+    binary = job.options.get('binary', False)
+    return runParser(job.input_path, job.output_path, buildParser(binary),
+                     run_metrics=metrics.workerRunMetrics(job.input_path, binary), **job.options)
 
 
 if __name__ == "__main__":
@@ -81,27 +336,50 @@ if __name__ == "__main__":
     argparser.add_argument('-info', default='HannahIsTheGreatestProgrammerOfAllTime', type=str, help='The truth.')
     argparser.add_argument('-outtag', default='output_', type=str, help='Tag for the ouput files, defaults to output_')
     argparser.add_argument('-maxrows', default=None, type=int, help='specify the number of rows to read from the input file, default to all')
-    argparser.add_argument('-processors', default=1, type=int, help='specify the number of multiprocess jobs to run, redunant for individual files. Defaults to 1 to avoid explosions')
+    argparser.add_argument('-processors', default=None, type=int, help='specify the number of multiprocess jobs to run, redunant for individual files. Defaults to one per core, limited by -workermem')
+    argparser.add_argument('-workermem', default=1024, type=int, help='expected peak memory of one worker in MB, used to pick the number of workers, defaults to 1024')
     argparser.add_argument('-inputtype', default='file', help="Defines input type as either list_txt, dir, or file")
+    argparser.add_argument('-batchrows', default=None, type=int, help='decode the input in blocks of this many rows with NumPy (tens of thousands of rows per block to beat row by row decoding), defaults to row by row')
+    argparser.add_argument('--purge', action='store_true', help='Purge orders still live at the end of each input file (end of session)')
+    argparser.add_argument('--securities', action='store_true', help='Write the security table next to each output file as <output>.securities')
+    argparser.add_argument('-flushlines', default=65536, type=int, help='number of output lines buffered between writes, defaults to 65536')
+    argparser.add_argument('-chunkbytes', default=1 << 24, type=int, help='size of the input chunks split into rows, defaults to 16 MB')
+    argparser.add_argument('--reorder', action='store_true', help='Write the output in timestamp order through a bounded reorder buffer')
+    argparser.add_argument('-reorderlines', default=100000, type=int, help='maximum lines held by the reorder buffer, defaults to 100000')
+    argparser.add_argument('--binary', action='store_true', help='Write binary records instead of text lines, render them as text with render.py')
+    argparser.add_argument('-checkpointrows', default=None, type=int, help='write a checkpoint to <output>.checkpoint about every N rows, defaults to none')
+    argparser.add_argument('--resume', action='store_true', help='Resume from the checkpoint next to the output file, if there is one')
+    argparser.add_argument('--follow', action='store_true', help='Follow the input file as it grows, like tail -f (file input only)')
+    argparser.add_argument('-idleflush', default=1.0, type=float, help='with --follow, seconds of idle input before pending agg and DELET msgs are written, defaults to 1')
+    argparser.add_argument('-followstop', default=None, type=float, help='with --follow, stop after this many seconds without new input, defaults to never (stop with Ctrl-C)')
+    argparser.add_argument('--profile', action='store_true', help='Time each stage of the run and print a breakdown table at the end (file input only)')
+    argparser.add_argument('-profileout', default=None, type=str, help='write a profile of the run to this path: cProfile stats if it ends in .prof, otherwise collapsed stacks for flamegraph tools (file input only)')
+    argparser.add_argument('-metrics', default=None, type=str, help='write live run metrics to this path, Prometheus text format if it ends in .prom, JSON otherwise')
+    argparser.add_argument('-metricsevery', default=10.0, type=float, help='seconds between metrics updates, defaults to 10')
     argparser.add_argument('--nolog', action='store_true', help='Supress log messages')
+    argparser.add_argument('-logevery', default=1, type=int, help='log only every Nth input row, defaults to every row')
 
     # instantiate parse_args() method to activate above arguments
     args = argparser.parse_args()
 
     assert(args.inputtype in ['file', 'list_txt', 'dir' ])
 
-    if args.nolog:
-        logging.disable(logging.INFO)
+    instrument.configureLogging(nolog=args.nolog, sampleEvery=args.logevery)
 
     print(args.info)
 
+    # metrics from pool workers come in on a queue, read by the aggregator in this process
+    aggregator = None
+    metrics_queue = None
+    if args.metrics is not None:
+        if args.inputtype != 'file':
+            metrics_queue = multiprocessing.Queue(-1)
+        aggregator = metrics.MetricsAggregator(metrics.MetricsSink(args.metrics), metrics_queue)
+        if metrics_queue is not None:
+            aggregator.start()
+
     # instantiate Parser class from the parser module with the args that call all other relevant writer methods (execution, agg, hidden, and passive)
-    pasr = parser.Parser(
-            aggressive.AggHandler(),
-            passive.PassiveOrderWriter(),
-            amend_delete.AmdDelWriter(),
-            hidden.HiddenExeWriter(),
-            )
+    pasr = buildParser(args.binary)
 
     # logic for handling argparser arguments
     if args.inputtype == 'file':
@@ -109,23 +387,38 @@ if __name__ == "__main__":
             raise ValueError("Input file must end with .txt, did you mean to use -inputtype list_txt/dir")
 
         if args.output_path.endswith(".txt"):
-            runParser(args.input_path, args.output_path[:-4] + args.outtag + ".txt", pasr, maxrows=args.maxrows)
+            out_path = args.output_path[:-4] + args.outtag + ".txt"
 
         elif args.output_path.endswith("/"):
             in_name = args.input_path.split("/")[-1]
-            runParser(args.input_path, args.output_path + args.outtag + in_name, pasr, maxrows=args.maxrows)
+            out_path = args.output_path + args.outtag + in_name
 
         else:
             raise ValueError("Incorrect output path, must end in .txt or /")
 
+        profiler = profiling.StageProfiler() if args.profile else None
+        run_options = {'maxrows': args.maxrows, 'batchrows': args.batchrows, 'purge': args.purge,
+                       'securities_path': out_path + ".securities" if args.securities else None,
+                       'flushlines': args.flushlines, 'chunkbytes': args.chunkbytes,
+                       'reorderlines': args.reorderlines if args.reorder else None, 'binary': args.binary,
+                       'checkpointrows': args.checkpointrows, 'resume': args.resume, 'follow': args.follow,
+                       'idleflush': args.idleflush, 'followstop': args.followstop, 'profiler': profiler,
+                       'run_metrics': metrics.RunMetrics(args.input_path, aggregator.update, args.metricsevery,
+                                                         args.binary) if aggregator is not None else None}
+        start = time.perf_counter()
+        if args.profileout:
+            profiling.profileCall(args.profileout, runParser, args.input_path, out_path, pasr, **run_options)
+        else:
+            runParser(args.input_path, out_path, pasr, **run_options)
+        if profiler is not None:
+            print(profiler.report(time.perf_counter() - start))
+
     else:
         if args.inputtype == 'list_txt':
             if not args.input_path.endswith(".txt"):
                 raise ValueError("Input file must end with .txt, did you mean to use -inputtype dir")
-            in_list = []
-            read_input = open(args.input_path, 'rb')
-            for row in read_input:
-                in_list.append(row.rstrip('\n'))
+            with open(args.input_path, 'r') as read_input:
+                in_list = [row.strip() for row in read_input if row.strip()]
 
         elif args.inputtype == 'dir':
             if not args.input_path.endswith("/"):
@@ -140,23 +433,24 @@ if __name__ == "__main__":
         else:
             raise ValueError("args.output_path miss specified, should end in /")
 
-        # create class for mulitproccessing to allow for multiple arguments
-        class funcArgs:
-            def __init__(self, ip, op):
-                self.ip = ip
-                self.op = op
-                self.p = pasr
-                self.mr = args.maxrows
-
-        # create function wrapper that takes a class object holding the arguments
-        def classy_runParser(f_args):
-            runParser(f_args.ip, f_args.op, f_args.p, f_args.mr)
-
-        funcList = [funcArgs(i, o) for i, o in zip(in_list, out_list)]
-
-        number_processes = args.processors
-        pool = multiprocessing.Pool(number_processes)
-        results = pool.map_async(classy_runParser, funcList)
-        pool.close()
-        pool.join()
-
+        # each worker builds its own parser, jobs only carry the paths and run options
+        jobs = [scheduler.FileJob(i, o, {'maxrows': args.maxrows, 'batchrows': args.batchrows, 'purge': args.purge,
+                                         'securities_path': o + ".securities" if args.securities else None,
+                                         'flushlines': args.flushlines, 'chunkbytes': args.chunkbytes,
+                                         'reorderlines': args.reorderlines if args.reorder else None,
+                                         'binary': args.binary, 'checkpointrows': args.checkpointrows,
+                                         'resume': args.resume})
+                for i, o in zip(in_list, out_list)]
+
+        results = scheduler.runJobs(runFileJob, jobs, processors=args.processors, workerMemory=args.workermem << 20,
+                                    nolog=args.nolog, logEvery=args.logevery, metricsQueue=metrics_queue,
+                                    metricsInterval=args.metricsevery)
+        if aggregator is not None:
+            aggregator.stop()
+
+        failed = [result for result in results if result.error is not None]
+        print("Converted %s of %s files, %s failed" % (len(results) - len(failed), len(results), len(failed)))
+        for result in failed:
+            print("Failed: %s" % result.input_path)
+        if failed:
+            sys.exit(1)
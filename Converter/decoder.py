@@ -0,0 +1,187 @@
+import base
+
+
+class PassiveRecord(object):
+    """
+    Decoded passive order entry ('A'/'a'). Price is held in ticks of ChiX_conversion.priceScale and security as its
+    securityTable code.
+    """
+    __slots__ = ('transType', 'timeStamp', 'orderId', 'transSide', 'volume', 'price', 'security')
+
+
+class ExecutionRecord(object):
+    """
+    Decoded execution against a passive order ('E'/'e').
+    """
+    __slots__ = ('transType', 'timeStamp', 'passiveId', 'volume', 'tradeRef', 'contraId')
+
+
+class CancelRecord(object):
+    """
+    Decoded cancel for full or partial volume ('X'/'x').
+    """
+    __slots__ = ('transType', 'timeStamp', 'orderId', 'volume')
+
+
+class HiddenRecord(object):
+    """
+    Decoded hidden order execution ('P'/'p'). Price is held in ticks of ChiX_conversion.priceScale and security as
+    its securityTable code.
+    """
+    __slots__ = ('transType', 'timeStamp', 'hiddenId', 'volume', 'price', 'security')
+
+
+class MessageDecoder(base.ChiX_conversion):
+    """
+    Decodes each input row once into a slotted record that is shared by all writers.
+    Field positions are taken from the writers' own *_loc tables, so there is still only one place the layout of a
+    message is described. One decode function is built per transType, covering the short and long variant of each
+    message type, so no message length or idx_dict lookup is needed per row.
+    """
+
+    def __init__(self, passive_writer, agg_handler, amd_del_writer, hidden_exe_writer):
+        """
+        Takes the writer objects the records will be handed to and builds a decode function for every transType.
+        """
+        super(MessageDecoder, self).__init__()
+        self.writers = (passive_writer, agg_handler, amd_del_writer, hidden_exe_writer)
+        self.buildDecoders()
+
+
+    def __getstate__(self):
+        # the decode functions are closures, which cannot be pickled, so they are rebuilt on unpickling
+        state = self.__dict__.copy()
+        del state['decoders']
+        return state
+
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.buildDecoders()
+
+
+    def buildDecoders(self):
+        """
+        Builds the decode function for every transType from the writers' *_loc tables.
+        """
+        passive_writer, agg_handler, amd_del_writer, hidden_exe_writer = self.writers
+        self.securityTable = passive_writer.securityTable
+        self.transtype_loc = passive_writer.transtype_loc
+        self.decoders = {}
+        for transType in self.shortMessageType | self.longMessageType:
+            length = self.getMessageLength(transType)
+            kind = transType.upper()
+            if kind == 'A':
+                decoder = self.passiveDecoder(transType, passive_writer, length)
+            elif kind == 'E':
+                decoder = self.executionDecoder(transType, agg_handler, length)
+            elif kind == 'X':
+                decoder = self.cancelDecoder(transType, amd_del_writer, length)
+            else:
+                decoder = self.hiddenDecoder(transType, hidden_exe_writer, length)
+            self.decoders[transType] = decoder
+
+
+    def decode(self, row):
+        """
+        Takes a raw input row and returns the record for it, or None if the transType is not handled.
+        """
+        decoder = self.decoders.get(row[self.transtype_loc])
+        if decoder is None:
+            return None
+        return decoder(row)
+
+
+    def passiveDecoder(self, transType, writer, length):
+        """
+        Returns the decode function for passive order entries of the given message length.
+        """
+        ts0, ts1 = writer.timestamp_loc['start'], writer.timestamp_loc['end']
+        id0, id1 = writer.orderid_loc['start'], writer.orderid_loc['end']
+        side_loc = writer.transside_loc
+        vol0, vol1 = writer.volume_loc[length]['start'], writer.volume_loc[length]['end']
+        px0, px1 = writer.price_loc[length]['start'], writer.price_loc[length]['end']
+        sec0, sec1 = writer.security_loc[length]['start'], writer.security_loc[length]['end']
+        multiplier = self.priceScale // self.returnPriceDenominator(length)
+        formatTimeStamp = self.timeStampFormatter.format
+        getTransSide = self.getTransSide
+        internSecurity = self.securityTable.intern
+
+        def decode(row):
+            record = PassiveRecord()
+            record.transType = transType
+            record.timeStamp = formatTimeStamp(int(row[ts0:ts1]))
+            record.orderId = row[id0:id1].strip()
+            record.transSide = getTransSide(row, side_loc)
+            record.volume = int(row[vol0:vol1])
+            record.price = int(row[px0:px1]) * multiplier
+            record.security = internSecurity(row[sec0:sec1].strip())
+            return record
+        return decode
+
+
+    def executionDecoder(self, transType, writer, length):
+        """
+        Returns the decode function for executions of the given message length.
+        """
+        ts0, ts1 = writer.timestamp_loc['start'], writer.timestamp_loc['end']
+        id0, id1 = writer.passive_id_loc['start'], writer.passive_id_loc['end']
+        vol0, vol1 = writer.volume_loc[length]['start'], writer.volume_loc[length]['end']
+        ref0, ref1 = writer.traderef_loc[length]['start'], writer.traderef_loc[length]['end']
+        con0, con1 = writer.contra_id_loc[length]['start'], writer.contra_id_loc[length]['end']
+        formatTimeStamp = self.timeStampFormatter.format
+
+        def decode(row):
+            record = ExecutionRecord()
+            record.transType = transType
+            record.timeStamp = formatTimeStamp(int(row[ts0:ts1]))
+            record.passiveId = row[id0:id1].strip()
+            record.volume = int(row[vol0:vol1])
+            record.tradeRef = row[ref0:ref1].strip()
+            record.contraId = row[con0:con1].strip()
+            return record
+        return decode
+
+
+    def cancelDecoder(self, transType, writer, length):
+        """
+        Returns the decode function for cancels of the given message length.
+        """
+        ts0, ts1 = writer.timestamp_loc['start'], writer.timestamp_loc['end']
+        id0, id1 = writer.orderid_loc['start'], writer.orderid_loc['end']
+        vol0, vol1 = writer.volume_loc[length]['start'], writer.volume_loc[length]['end']
+        formatTimeStamp = self.timeStampFormatter.format
+
+        def decode(row):
+            record = CancelRecord()
+            record.transType = transType
+            record.timeStamp = formatTimeStamp(int(row[ts0:ts1]))
+            record.orderId = row[id0:id1].strip()
+            record.volume = int(row[vol0:vol1])
+            return record
+        return decode
+
+
+    def hiddenDecoder(self, transType, writer, length):
+        """
+        Returns the decode function for hidden executions of the given message length.
+        """
+        ts0, ts1 = writer.timestamp_loc['start'], writer.timestamp_loc['end']
+        id0, id1 = writer.id_loc[length]['start'], writer.id_loc[length]['end']
+        vol0, vol1 = writer.volume_loc[length]['start'], writer.volume_loc[length]['end']
+        px0, px1 = writer.price_loc[length]['start'], writer.price_loc[length]['end']
+        sec0, sec1 = writer.security_loc[length]['start'], writer.security_loc[length]['end']
+        multiplier = self.priceScale // self.returnPriceDenominator(length)
+        formatTimeStamp = self.timeStampFormatter.format
+        internSecurity = self.securityTable.intern
+
+        def decode(row):
+            record = HiddenRecord()
+            record.transType = transType
+            record.timeStamp = formatTimeStamp(int(row[ts0:ts1]))
+            record.hiddenId = int(row[id0:id1])
+            record.volume = int(row[vol0:vol1])
+            record.price = int(row[px0:px1]) * multiplier
+            record.security = internSecurity(row[sec0:sec1].strip())
+            return record
+        return decode
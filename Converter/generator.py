@@ -0,0 +1,323 @@
+"""Deterministic synthetic ChiX workload generator for load testing.
+Writes fixed-width ChiX rows at the offsets the writers read (see the *_loc tables of passive, aggressive,
+amend_delete and hidden) with realistic order lifecycles: passive entries ('A'), execution bursts ('E') against the
+live orders of one security and side sharing a contra ID (the aggressor's remainder sometimes posted as a passive entry
+with the contra ID), partial and full cancels ('X') with re-entries, zero-volume undisclosed orders and their cancels,
+and hidden executions ('P'), each in short and long ('a', 'e', 'x', 'p') formats.
+The same seed and options always give the same file. Rows are generated and written a chunk at a time, and the live
+order book is capped at maxLive orders (full cancels take the place of entries above the cap), so memory stays bounded
+for production-sized days."""
+
+import argparse
+import logging
+import random
+import time
+
+import instrument
+
+
+# default message mix, as relative weights
+MIX = {'enter': 0.45, 'trade': 0.25, 'partialCancel': 0.10, 'cancel': 0.10, 'undisclosedCancel': 0.03,
+       'hidden': 0.07}
+
+DIGITS = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+
+
+def toBase36(number):
+    """
+    Returns the base 36 string of a non-negative integer (ChiX order IDs are base 36).
+    """
+    digits = []
+    while True:
+        number, digit = divmod(number, 36)
+        digits.append(DIGITS[digit])
+        if not number:
+            return ''.join(reversed(digits))
+
+
+def parseMix(text):
+    """
+    Takes a mix as "name=weight,..." (eg. "enter=0.5,trade=0.3") and returns the default mix updated with it.
+    Raises ValueError for an unknown name.
+    """
+    mix = dict(MIX)
+    for item in text.split(','):
+        name, weight = item.split('=')
+        if name not in MIX:
+            raise ValueError("Unknown msg mix entry %s, expected one of %s" % (name, ', '.join(sorted(MIX))))
+        mix[name] = float(weight)
+    return mix
+
+
+class LiveOrders(object):
+    """
+    Set of order IDs with constant time add, remove and random choice (a list, and the position of each ID in it).
+    """
+
+    def __init__(self):
+        self.ids = []
+        self.positions = {}
+
+
+    def __len__(self):
+        return len(self.ids)
+
+
+    def add(self, orderId):
+        self.positions[orderId] = len(self.ids)
+        self.ids.append(orderId)
+
+
+    def remove(self, orderId):
+        position = self.positions.pop(orderId)
+        last = self.ids.pop()
+        if last != orderId:  # move the last ID into the gap
+            self.ids[position] = last
+            self.positions[last] = position
+
+
+    def choice(self, rnd):
+        return self.ids[int(rnd.random() * len(self.ids))]
+
+
+class WorkloadGenerator(object):
+    """
+    Generates ChiX rows from a seeded random.Random.
+    Timestamps rise evenly over sessionMillis from sessionStart (ms after midnight) across the rows requested, so a day
+    of any size fits in the 8 digit timestamp field, and rows generated together (eg. a trade burst) share a time.
+    """
+
+    def __init__(self, seed=0, securities=20, longShare=0.3, mix=None, undisclosedShare=0.03, reentryShare=0.5,
+                 postShare=0.3, maxBurst=4, maxLive=100000, sessionStart=28800000, sessionMillis=30600000):
+        """
+        Takes the seed, the number of securities, the share of rows in long format, the msg mix weights (see MIX), the
+        share of entries that are undisclosed, the share of full cancels followed by a re-entry, the share of trade
+        bursts whose aggressor remainder is posted, the most trades in a burst, the cap on live orders, and the
+        session start and length in ms.
+        """
+        self.rnd = random.Random(seed)
+        self.securities = ['S' + toBase36(i).zfill(3) for i in range(securities)]
+        self.longShare = longShare
+        mix = mix or MIX
+        self.kinds = sorted(mix)
+        self.weights = [mix[kind] for kind in self.kinds]
+        self.undisclosedShare = undisclosedShare
+        self.reentryShare = reentryShare
+        self.postShare = postShare
+        self.maxBurst = maxBurst
+        self.maxLive = maxLive
+        self.sessionStart = sessionStart
+        self.sessionMillis = sessionMillis
+        self.nextId = 36 ** 5  # IDs start at 6 base 36 digits
+        self.nextHiddenId = 100000
+        self.orders = {}  # order ID -> [security, side, volume, long]
+        self.live = LiveOrders()
+        self.bySide = dict(((security, side), LiveOrders()) for security in self.securities for side in 'BS')
+        self.undisclosed = LiveOrders()
+        self.timeStamp = '%8d' % sessionStart
+        self.handlers = {'enter': self.enter, 'trade': self.trade, 'partialCancel': self.partialCancel,
+                         'cancel': self.cancel, 'undisclosedCancel': self.undisclosedCancel, 'hidden': self.hidden}
+
+
+    def newId(self):
+        self.nextId += 1 + int(self.rnd.random() * 3)
+        return toBase36(self.nextId)
+
+
+    def isLong(self):
+        return self.rnd.random() < self.longShare
+
+
+    def price(self):
+        return self.rnd.randint(100, 99999) * self.rnd.choice((1, 10, 100))
+
+
+    def orderRow(self, orderId, security, side, volume, price, isLong):
+        if isLong:
+            return 'S%sa%9s%s%10d%-6s%19dY' % (self.timeStamp, orderId, side, volume, security, price * 1000)
+        return 'S%sA%9s%s%6d%-6s%10dY' % (self.timeStamp, orderId, side, volume, security, price)
+
+
+    def addOrder(self, orderId, security, side, volume, isLong):
+        self.orders[orderId] = [security, side, volume, isLong]
+        self.live.add(orderId)
+        self.bySide[(security, side)].add(orderId)
+
+
+    def removeOrder(self, orderId):
+        security, side = self.orders.pop(orderId)[:2]
+        self.live.remove(orderId)
+        self.bySide[(security, side)].remove(orderId)
+
+
+    def enter(self, rows):
+        """
+        Passive order entry, or a zero-volume undisclosed order.
+        """
+        if len(self.live) >= self.maxLive:
+            return self.cancel(rows)
+        rnd = self.rnd
+        security = rnd.choice(self.securities)
+        side = rnd.choice('BS')
+        orderId = self.newId()
+        isLong = self.isLong()
+        if rnd.random() < self.undisclosedShare:
+            rows.append(self.orderRow(orderId, security, side, 0, self.price(), isLong))
+            self.undisclosed.add(orderId)
+            return
+        volume = rnd.randint(1, 9999)
+        rows.append(self.orderRow(orderId, security, side, volume, self.price(), isLong))
+        self.addOrder(orderId, security, side, volume, isLong)
+
+
+    def trade(self, rows):
+        """
+        Execution burst: up to maxBurst live orders of one security and side traded against one contra ID, some in
+        full, then sometimes the aggressor's remainder posted as a passive order with the contra ID.
+        """
+        if not self.live:
+            return self.enter(rows)
+        rnd = self.rnd
+        security, side = self.orders[self.live.choice(rnd)][:2]
+        book = self.bySide[(security, side)]
+        contraId = self.newId()
+        for orderId in rnd.sample(book.ids, min(len(book), rnd.randint(1, self.maxBurst))):
+            order = self.orders[orderId]
+            volume = rnd.randint(1, order[2]) if rnd.random() < 0.6 else order[2]
+            if self.isLong():
+                rows.append('S%se%9s%9d %9s%9s' % (self.timeStamp, orderId, volume, self.newId(), contraId))
+            else:
+                rows.append('S%sE%9s%6d%9s%9s' % (self.timeStamp, orderId, volume, self.newId(), contraId))
+            order[2] -= volume
+            if order[2] == 0:
+                self.removeOrder(orderId)
+        if rnd.random() < self.postShare and len(self.live) < self.maxLive:
+            aggSide = 'S' if side == 'B' else 'B'
+            volume = rnd.randint(1, 999)
+            isLong = self.isLong()
+            rows.append(self.orderRow(contraId, security, aggSide, volume, self.price(), isLong))
+            self.addOrder(contraId, security, aggSide, volume, isLong)
+
+
+    def cancelRow(self, orderId, volume):
+        if self.isLong():
+            return 'S%sx%9s%9d' % (self.timeStamp, orderId, volume)
+        return 'S%sX%9s%6d' % (self.timeStamp, orderId, volume)
+
+
+    def partialCancel(self, rows):
+        """
+        Cancel of part of a live order's volume.
+        """
+        if not self.live:
+            return self.enter(rows)
+        orderId = self.live.choice(self.rnd)
+        order = self.orders[orderId]
+        if order[2] < 2:
+            return self.cancel(rows)
+        volume = self.rnd.randint(1, order[2] - 1)
+        rows.append(self.cancelRow(orderId, volume))
+        order[2] -= volume
+
+
+    def cancel(self, rows):
+        """
+        Cancel of a live order's full volume, followed by a re-entry with a new volume (reentryShare of the time) or
+        by a new order.
+        """
+        if not self.live:
+            return self.enter(rows)
+        rnd = self.rnd
+        orderId = self.live.choice(rnd)
+        order = self.orders[orderId]
+        rows.append(self.cancelRow(orderId, order[2]))
+        if rnd.random() < self.reentryShare:
+            order[2] = rnd.randint(1, 9999)
+            rows.append(self.orderRow(orderId, order[0], order[1], order[2], self.price(), order[3]))
+            return
+        self.removeOrder(orderId)
+        if len(self.live) < self.maxLive:
+            self.enter(rows)
+
+
+    def undisclosedCancel(self, rows):
+        """
+        Cancel of an undisclosed (zero volume) order.
+        """
+        if not self.undisclosed:
+            return self.enter(rows)
+        orderId = self.undisclosed.choice(self.rnd)
+        self.undisclosed.remove(orderId)
+        rows.append(self.cancelRow(orderId, 0))
+
+
+    def hidden(self, rows):
+        """
+        Hidden order execution.
+        """
+        rnd = self.rnd
+        security = rnd.choice(self.securities)
+        price = self.price()
+        volume = rnd.randint(1, 5000)
+        self.nextHiddenId += 1 + int(rnd.random() * 3)
+        if self.isLong():
+            rows.append('S%sp%9d%s%10d%-6s%19d%9d' % (self.timeStamp, 0, 'B', volume, security, price * 1000,
+                                                     self.nextHiddenId))
+        else:
+            rows.append('S%sP%9d%s%6d%-6s%10d%9d' % (self.timeStamp, 0, 'B', volume, security, price,
+                                                    self.nextHiddenId))
+
+
+    def rows(self, count, chunkRows=65536):
+        """
+        Generator of lists of about chunkRows rows (without newlines), count rows in all.
+        """
+        rnd = self.rnd
+        kinds = self.kinds
+        weights = self.weights
+        handlers = self.handlers
+        made = 0
+        while made < count:
+            rows = []
+            while len(rows) < chunkRows and made + len(rows) < count:
+                self.timeStamp = '%8d' % (self.sessionStart + (made + len(rows)) * self.sessionMillis // count)
+                handlers[rnd.choices(kinds, weights)[0]](rows)
+            rows = rows[:count - made]  # the last event may have run past count
+            made += len(rows)
+            yield rows
+
+
+    def write(self, path, count, chunkRows=65536):
+        """
+        Writes count rows to path. Returns the number of rows written.
+        """
+        with open(path, 'w', buffering=1 << 20) as output_file:
+            for rows in self.rows(count, chunkRows):
+                rows.append('')  # gives the last row its newline
+                output_file.write('\n'.join(rows))
+        return count
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(description='Writes a deterministic synthetic ChiX input file')
+
+    argparser.add_argument('output_path', type=str, help='The ChiX file to write')
+    argparser.add_argument('rows', type=int, help='number of rows to write')
+
+    argparser.add_argument('-seed', default=0, type=int, help='random seed, the same seed and options give the same file, defaults to 0')
+    argparser.add_argument('-securities', default=20, type=int, help='number of securities, defaults to 20')
+    argparser.add_argument('-longshare', default=0.3, type=float, help='share of rows in long format, defaults to 0.3')
+    argparser.add_argument('-mix', default=None, type=str, help='msg mix weights as name=weight,... of %s' % ', '.join(sorted(MIX)))
+    argparser.add_argument('-undisclosedshare', default=0.03, type=float, help='share of entries that are undisclosed, defaults to 0.03')
+    argparser.add_argument('-reentryshare', default=0.5, type=float, help='share of full cancels followed by a re-entry, defaults to 0.5')
+    argparser.add_argument('-maxlive', default=100000, type=int, help='cap on live orders, defaults to 100000')
+
+    args = argparser.parse_args()
+
+    instrument.configureLogging()
+    start = time.time()
+    generator = WorkloadGenerator(args.seed, args.securities, args.longshare,
+                                  parseMix(args.mix) if args.mix else None, args.undisclosedshare,
+                                  args.reentryshare, maxLive=args.maxlive)
+    generator.write(args.output_path, args.rows)
+    logging.info("Wrote %s rows to %s in %.1fs", args.rows, args.output_path, time.time() - start)
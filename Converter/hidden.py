@@ -1,11 +1,5 @@
-import logging
 import base
 
-# configure logging for debugging purposes
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
-# logging.disable(logging.INFO)
-# logging.disable(logging.DEBUG) # disable logging for general run. comment out for logging.
 
 class HiddenExeWriter(base.ChiX_conversion):
     """
@@ -58,24 +52,11 @@ class HiddenExeWriter(base.ChiX_conversion):
         return hiddenId
 
 
-    def writer(self, row):
+    def writer(self, record):
         """
         Write hidden execution messages like:
         * 111 10:00.00:  OFFTR BHP 111 exec=10:00.00 100.0 50 5000 <OF > T({*F=111}) B() A()
+        Takes the decoded HiddenRecord for the row.
         """
-
-        currentTransType = self.getTransType(row) # set transType using getTransType method to avoid repeating func call.
-
-        return '* %s %s:  OFFTR %s %s exec= %s %s %s %s <OF> T({*F=}) B() A() OFF MARKET TRADE MESSAGE' % (
-            self.getHiddenID(row, transType=currentTransType),
-            self.getTimeStamp(row),
-            self.getSecurity(row, transType=currentTransType),
-            self.getHiddenID(row, transType=currentTransType),
-            self.getTimeStamp(row),
-            self.getPrice(row, transType=currentTransType),
-            self.getVolume(row, transType=currentTransType),
-            self.getTransValue(self.getPrice(row, transType=currentTransType),
-            self.getVolume(row, transType=currentTransType))
-        )
-
-
+        return self.renderer.offMarketTrade(record.timeStamp, record.hiddenId,
+                                            self.securityTable.symbol(record.security), record.price, record.volume)
@@ -0,0 +1,79 @@
+import logging
+import logging.handlers
+
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+
+class Tracer(object):
+    """
+    Switch for the per-row trace logging done in the hot path (parser, writers and the run loop).
+    Trace calls are written as `if instrument.tracer.enabled: logging.debug("...", args)`, so when tracing is off a row
+    costs one attribute check per trace point and no string formatting or logging calls at all.
+    When sampleEvery is above 1, only every Nth row is traced: startRow() switches enabled on for the sampled rows only.
+    """
+
+    def __init__(self):
+        """
+        Tracing starts switched off until configure() is called.
+        """
+        self.active = False  # tracing requested for the run
+        self.enabled = False  # tracing on for the current row
+        self.sampleEvery = 1
+
+
+    def configure(self, active, sampleEvery=1):
+        """
+        Switches tracing on or off for the run. Takes active (bool) and sampleEvery (trace every Nth row).
+        """
+        self.active = active
+        self.sampleEvery = max(1, sampleEvery)
+        self.enabled = active
+
+
+    def startRow(self, counter):
+        """
+        Takes the row counter and switches tracing on if the row is sampled. Returns enabled.
+        """
+        self.enabled = self.active and counter % self.sampleEvery == 0
+        return self.enabled
+
+
+tracer = Tracer()
+
+
+def configureLogging(nolog=False, sampleEvery=1, trace=True):
+    """
+    Configures the root logger once for the run (modules no longer call basicConfig at import time) and the tracer.
+    With nolog, INFO and DEBUG records are disabled and tracing is switched off. With trace False the per-row tracing
+    is switched off but INFO records are kept (for long-running services that only log their own events).
+    """
+    logging.basicConfig(level=logging.DEBUG, format=LOG_FORMAT)
+    if nolog:
+        logging.disable(logging.INFO)
+    tracer.configure(trace and not nolog, sampleEvery)
+
+
+def startQueueListener(log_queue):
+    """
+    Takes a multiprocessing queue and starts a QueueListener that passes the records put on it by pool workers to the
+    handlers of the root logger in the main process. Returns the started listener, stop() it when the pool is done.
+    """
+    listener = logging.handlers.QueueListener(log_queue, *logging.getLogger().handlers, respect_handler_level=True)
+    listener.start()
+    return listener
+
+
+def workerLogging(log_queue, nolog=False, sampleEvery=1):
+    """
+    Pool initializer. Replaces the root handlers of the worker process with a QueueHandler, so workers hand their
+    records to the main process without blocking on the log file, and configures the tracer as in the main process.
+    """
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(logging.DEBUG)
+    if nolog:
+        logging.disable(logging.INFO)
+    tracer.configure(not nolog, sampleEvery)
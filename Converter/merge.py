@@ -0,0 +1,124 @@
+"""Merges converted output files (per file or per venue) into one SMARTS file in timestamp order.
+Inputs are streamed and merged with a heap, so memory does not grow with the size of the inputs. Inputs that are not
+already in timestamp order are first cut into sorted runs of at most -runlines lines in temporary files."""
+
+import argparse
+import heapq
+import itertools
+import logging
+import os
+import shutil
+import tempfile
+
+import instrument
+
+
+def timeStampKey(line):
+    """
+    Takes a converted msg line and returns the sort key for its "HH:MM:SS.ffffff" timestamp field (the field ending
+    in ':  ' before the msg type). The length goes first so that hours of 100 and above still sort last.
+    """
+    end = line.index(':  ')
+    timeStamp = line[line.rindex(' ', 0, end) + 1:end]
+    return len(timeStamp), timeStamp
+
+
+def mergeStreams(streams, output_file):
+    """
+    Merges iterables of lines (each in timestamp order) into an open output file with a heap.
+    Lines with equal timestamps keep the order of the streams, and the line order within each stream is kept.
+    """
+    output_file.writelines(heapq.merge(*streams, key=timeStampKey))
+
+
+def mergeSorted(input_paths, output_path, fanIn=256, tmpdir=None):
+    """
+    Merges files that are each in timestamp order into output_path.
+    At most fanIn files are open at once: with more inputs, groups of fanIn are first merged into temporary files.
+    """
+    input_paths = list(input_paths)
+    work_dir = None
+    try:
+        while len(input_paths) > fanIn:
+            if work_dir is None:
+                work_dir = tempfile.mkdtemp(prefix='.merge_', dir=tmpdir)
+            merged_paths = []
+            for i in range(0, len(input_paths), fanIn):
+                merged_path = os.path.join(work_dir, 'pass%s.txt' % len(os.listdir(work_dir)))
+                mergeSorted(input_paths[i:i + fanIn], merged_path, fanIn)
+                merged_paths.append(merged_path)
+            input_paths = merged_paths
+
+        input_files = [open(path, 'r', buffering=1 << 20) for path in input_paths]
+        try:
+            with open(output_path, 'w', buffering=1 << 20) as output_file:
+                mergeStreams(input_files, output_file)
+        finally:
+            for input_file in input_files:
+                input_file.close()
+    finally:
+        if work_dir is not None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def sortedRuns(input_path, run_dir, runLines=1000000):
+    """
+    Cuts an input file into runs of at most runLines lines, sorts each run by timestamp (a stable sort, so lines with
+    equal timestamps keep their order) and writes each run to its own file in run_dir.
+    Returns the run paths in input order.
+    """
+    run_paths = []
+    with open(input_path, 'r', buffering=1 << 20) as input_file:
+        while True:
+            run = [line for line in itertools.islice(input_file, runLines) if line.strip()]
+            if not run:
+                break
+            if not run[-1].endswith('\n'):
+                run[-1] += '\n'
+            run.sort(key=timeStampKey)
+            run_path = os.path.join(run_dir, 'run%s.txt' % len(os.listdir(run_dir)))
+            with open(run_path, 'w', buffering=1 << 20) as run_file:
+                run_file.writelines(run)
+            run_paths.append(run_path)
+    return run_paths
+
+
+def mergeFiles(input_paths, output_path, presorted=False, runLines=1000000, fanIn=256, tmpdir=None):
+    """
+    Merges converted output files into one file in timestamp order with bounded memory.
+    If presorted is True, each input must already be in timestamp order and is merged as it is. Otherwise every input is
+    first cut into sorted runs of at most runLines lines in a temporary directory (in tmpdir, defaults to the system
+    temporary directory), and the runs are merged.
+    Lines with equal timestamps keep the order of input_paths and their order within each input.
+    """
+    if presorted:
+        mergeSorted(input_paths, output_path, fanIn, tmpdir)
+        return
+
+    run_dir = tempfile.mkdtemp(prefix='.runs_', dir=tmpdir)
+    try:
+        run_paths = []
+        for input_path in input_paths:
+            run_paths.extend(sortedRuns(input_path, run_dir, runLines))
+        logging.info("Merging %s sorted runs from %s files", len(run_paths), len(input_paths))
+        mergeSorted(run_paths, output_path, fanIn, tmpdir)
+    finally:
+        shutil.rmtree(run_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(description='Merges converted output files into one file in timestamp order')
+
+    argparser.add_argument('output_path', type=str, help='The merged output file path')
+    argparser.add_argument('input_paths', type=str, nargs='+', help='The converted output files to merge')
+
+    argparser.add_argument('--presorted', action='store_true', help='Inputs are already each in timestamp order, skip cutting them into sorted runs')
+    argparser.add_argument('-runlines', default=1000000, type=int, help='maximum lines held in memory per sorted run, defaults to 1000000')
+    argparser.add_argument('-fanin', default=256, type=int, help='maximum files merged at once, defaults to 256')
+    argparser.add_argument('-tmpdir', default=None, type=str, help='directory for the temporary run files, defaults to the system temporary directory')
+
+    args = argparser.parse_args()
+
+    instrument.configureLogging()
+    mergeFiles(args.input_paths, args.output_path, presorted=args.presorted, runLines=args.runlines,
+               fanIn=args.fanin, tmpdir=args.tmpdir)
@@ -0,0 +1,315 @@
+"""Live metrics for long-running conversions.
+runParser, when given a RunMetrics, counts rows per transType and output lines per msg type (ENTER, TRADE, AMEND,
+DELET, OFFTR) and every interval seconds publishes a snapshot of the run: rows/sec, input bytes consumed against the
+file size, live orders in the order store, undisclosed orders and how often the AggHandler and AmdDelWriter caches
+have been dumped.
+Snapshots go to a MetricsAggregator, which keeps the latest snapshot of each run and writes them, with their totals,
+to a MetricsSink: a JSON file, or a Prometheus textfile (for the node_exporter textfile collector) if the path ends in
+.prom. Pool workers put their snapshots on a queue that the aggregator in the main process reads, so multiprocessing
+runs (directories of files) are reported together."""
+
+import json
+import logging
+import os
+import threading
+import time
+
+import render
+
+
+KINDS = ('ENTER', 'TRADE', 'AMEND', 'DELET', 'OFFTR')
+RECORD_KINDS = {render.ENTER: 'ENTER', render.TRADE: 'TRADE', render.AMEND: 'AMEND', render.DELET: 'DELET',
+                render.OFFTR: 'OFFTR'}
+
+# counts summed over the runs for the totals
+SUMMED = ('rows', 'rowsPerSec', 'bytesConsumed', 'inputBytes', 'ordersLive', 'undisclosed', 'aggCacheDumps',
+          'cancelCacheDumps')
+
+# set in pool workers by workerMetrics
+workerQueue = None
+workerInterval = 10.0
+
+
+class RunMetrics(object):
+    """
+    Counters for one run, published as snapshots through publish (a callable taking the snapshot dict).
+    """
+
+    def __init__(self, input_path, publish, interval=10.0, binary=False):
+        """
+        Takes the input path, the publish callable, the seconds between snapshots and whether the output lines are
+        binary records.
+        """
+        self.input_path = os.path.abspath(input_path)
+        self.publish = publish
+        self.interval = interval
+        self.binary = binary
+        self.transTypes = {}
+        self.lines = dict((kind, 0) for kind in KINDS)
+        self.start = self.lastPublish = time.time()
+        self.lastRows = 0
+
+
+    def countRow(self, transType):
+        """
+        Counts one row of the transType (a str, or a byte value for rows read as bytes).
+        """
+        transTypes = self.transTypes
+        transTypes[transType] = transTypes.get(transType, 0) + 1
+
+
+    def countRows(self, rows):
+        """
+        Counts a block of rows by transType.
+        """
+        transTypes = self.transTypes
+        for row in rows:
+            transType = row[9]
+            transTypes[transType] = transTypes.get(transType, 0) + 1
+
+
+    def countLines(self, lines):
+        """
+        Counts output lines by msg type: the word after the timestamp for text lines, the kind for binary records.
+        """
+        counts = self.lines
+        if self.binary:
+            for line in lines:
+                kind = RECORD_KINDS[line[0]]
+                counts[kind] += 1
+        else:
+            for line in lines:
+                start = line.index(':  ') + 3
+                kind = line[start:start + 5]
+                counts[kind] += 1
+
+
+    def due(self):
+        """
+        Returns True if the next snapshot is due.
+        """
+        return time.time() - self.lastPublish >= self.interval
+
+
+    def snapshot(self, pasr, reader_object, done=False):
+        """
+        Returns the current metrics of the run as a dict. Takes the run's Parser and reader.ChunkedReader.
+        """
+        now = time.time()
+        rows = sum(self.transTypes.values())
+        elapsed = now - self.start
+        sinceLast = now - self.lastPublish
+        try:
+            inputBytes = os.path.getsize(self.input_path)  # the input can grow while it is followed
+        except OSError:
+            inputBytes = 0
+        transTypes = dict((chr(transType) if isinstance(transType, int) else transType, count)
+                          for transType, count in self.transTypes.items())
+        snapshot = {
+            'input': self.input_path,
+            'pid': os.getpid(),
+            'updated': now,
+            'elapsed': elapsed,
+            'done': done,
+            'rows': rows,
+            'rowsPerSec': rows / elapsed if elapsed else 0.0,
+            'recentRowsPerSec': (rows - self.lastRows) / sinceLast if sinceLast else 0.0,
+            'bytesConsumed': reader_object.offset,
+            'inputBytes': inputBytes,
+            'progress': float(reader_object.offset) / inputBytes if inputBytes else 1.0,
+            'transTypes': transTypes,
+            'lines': dict(self.lines),
+            'ordersLive': len(pasr.passive_writer.orderStore),
+            'undisclosed': len(pasr.passive_writer.undisclosedOrders),
+            'aggCacheDumps': pasr.agg_handler.dumpCount,
+            'cancelCacheDumps': pasr.amd_del_writer.dumpCount,
+            }
+        self.lastPublish = now
+        self.lastRows = rows
+        return snapshot
+
+
+    def update(self, pasr, reader_object, done=False):
+        """
+        Publishes a snapshot of the run.
+        """
+        self.publish(self.snapshot(pasr, reader_object, done))
+
+
+class MetricsWriter(object):
+    """
+    Passes lines on to the run's writer (output.BufferedLineWriter or reorder.ReorderBuffer) and counts them.
+    """
+
+    def __init__(self, writer, run_metrics):
+        self.writer = writer
+        self.run_metrics = run_metrics
+
+
+    def write(self, line):
+        self.run_metrics.countLines((line,))
+        self.writer.write(line)
+
+
+    def writeLines(self, lines):
+        self.run_metrics.countLines(lines)
+        self.writer.writeLines(lines)
+
+
+    def __getattr__(self, name):
+        # release, flush, close and the attributes of the writer
+        return getattr(self.writer, name)
+
+
+class MetricsSink(object):
+    """
+    Writes metrics to a file, replacing it each time so readers never see a partial file.
+    The format is the Prometheus text format if the path ends in .prom, JSON otherwise.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.prometheus = path.endswith('.prom')
+
+
+    def write(self, runs, total):
+        """
+        Takes the latest snapshot of each run and their totals and writes them out.
+        """
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w') as metrics_file:
+            if self.prometheus:
+                metrics_file.write(self.prometheusText(runs, total))
+            else:
+                json.dump({'runs': runs, 'total': total}, metrics_file, indent=2, sort_keys=True)
+        os.replace(temp_path, self.path)
+
+
+    def prometheusText(self, runs, total):
+        """
+        Returns the snapshots as Prometheus text format samples labelled with the input path.
+        """
+        samples = [
+            ('chix_rows_total', 'counter', 'Rows parsed', 'rows', None),
+            ('chix_rows_per_second', 'gauge', 'Rows parsed per second over the run', 'rowsPerSec', None),
+            ('chix_recent_rows_per_second', 'gauge', 'Rows parsed per second since the last update',
+             'recentRowsPerSec', None),
+            ('chix_input_bytes_consumed', 'gauge', 'Input bytes read', 'bytesConsumed', None),
+            ('chix_input_bytes', 'gauge', 'Input file size in bytes', 'inputBytes', None),
+            ('chix_orders_live', 'gauge', 'Live orders in the order store', 'ordersLive', None),
+            ('chix_undisclosed_orders', 'gauge', 'Undisclosed orders held', 'undisclosed', None),
+            ('chix_agg_cache_dumps_total', 'counter', 'Agg orders dumped from the AggHandler cache',
+             'aggCacheDumps', None),
+            ('chix_cancel_cache_dumps_total', 'counter', 'Cancels written from the AmdDelWriter cache',
+             'cancelCacheDumps', None),
+            ('chix_run_done', 'gauge', '1 once the run has finished', 'done', None),
+            ('chix_rows_by_transtype_total', 'counter', 'Rows parsed by transType', 'transTypes', 'transtype'),
+            ('chix_lines_total', 'counter', 'Output lines written by msg type', 'lines', 'msg'),
+            ]
+        lines = []
+        for name, metricType, helpText, key, labelName in samples:
+            lines.append("# HELP %s %s" % (name, helpText))
+            lines.append("# TYPE %s %s" % (name, metricType))
+            for run in runs:
+                value = run[key]
+                label = 'input="%s"' % run['input'].replace('\\', '\\\\').replace('"', '\\"')
+                if labelName is None:
+                    lines.append("%s{%s} %s" % (name, label, float(value)))
+                else:
+                    for item, count in sorted(value.items()):
+                        lines.append('%s{%s,%s="%s"} %s' % (name, label, labelName, item, float(count)))
+        lines.append("")
+        return "\n".join(lines)
+
+
+def combine(runs):
+    """
+    Takes run snapshots and returns their totals.
+    """
+    total = dict((key, 0) for key in SUMMED)
+    total['transTypes'] = {}
+    total['lines'] = dict((kind, 0) for kind in KINDS)
+    for run in runs:
+        for key in SUMMED:
+            total[key] += run[key]
+        if not run['done']:
+            total['rowsPerSec'] -= run['rowsPerSec']
+            total['rowsPerSec'] += run['recentRowsPerSec']  # runs still going, their current rate
+        for name in ('transTypes', 'lines'):
+            for item, count in run[name].items():
+                total[name][item] = total[name].get(item, 0) + count
+    total['runs'] = len(runs)
+    total['runsDone'] = sum(1 for run in runs if run['done'])
+    total['progress'] = float(total['bytesConsumed']) / total['inputBytes'] if total['inputBytes'] else 1.0
+    return total
+
+
+class MetricsAggregator(object):
+    """
+    Keeps the latest snapshot of each run (by input path) and writes them all to the sink on each update.
+    Snapshots are passed to update() directly, or put on queue by pool workers and read by a listener thread.
+    """
+
+    def __init__(self, sink, queue=None):
+        self.sink = sink
+        self.queue = queue
+        self.runs = {}
+        self.lock = threading.Lock()
+        self.thread = None
+
+
+    def update(self, snapshot):
+        """
+        Takes a run snapshot and writes out the metrics of every run.
+        """
+        with self.lock:
+            self.runs[snapshot['input']] = snapshot
+            runs = [self.runs[input_path] for input_path in sorted(self.runs)]
+            try:
+                self.sink.write(runs, combine(runs))
+            except (IOError, OSError) as error:
+                logging.warning("Metrics not written to %s: %s", self.sink.path, error)
+
+
+    def listen(self):
+        while True:
+            snapshot = self.queue.get()
+            if snapshot is None:
+                return
+            self.update(snapshot)
+
+
+    def start(self):
+        """
+        Starts reading snapshots from the queue.
+        """
+        self.thread = threading.Thread(target=self.listen, name='metrics-aggregator')
+        self.thread.daemon = True
+        self.thread.start()
+
+
+    def stop(self):
+        """
+        Reads the snapshots still on the queue and stops the listener.
+        """
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join()
+
+
+def workerMetrics(queue, interval=10.0):
+    """
+    Pool worker setup: runs in the worker publish their snapshots on queue every interval seconds.
+    """
+    global workerQueue, workerInterval
+    workerQueue = queue
+    workerInterval = interval
+
+
+def workerRunMetrics(input_path, binary=False):
+    """
+    Returns a RunMetrics publishing to the worker's queue, or None if the pool was not set up for metrics.
+    """
+    if workerQueue is None:
+        return None
+    return RunMetrics(input_path, workerQueue.put, workerInterval, binary)
@@ -0,0 +1,145 @@
+import array
+
+
+def orderKey(orderId):
+    """
+    Converts an order ID string to the key it is held under in the order store and the undisclosed registry.
+    IDs of ASCII digits and upper case letters (ChiX IDs are base 36) become an integer, read in base 36 after a
+    leading '1' so that IDs differing only in leading zeros get different keys. Any other ID (lower case letters,
+    blank, punctuation) is kept as the string itself, which never equals an integer key, so every distinct ID has its
+    own key.
+    """
+    if orderId.isascii() and orderId.isalnum() and (orderId.isdigit() or orderId.isupper()):
+        return int('1' + orderId, 36)
+    return orderId
+
+
+class OrderStore(object):
+    """
+    Compact store for the live passive orders needed to write aggressive ENTER, TRADE and AMEND/DELET msgs.
+    Replaces a dict of four-key dicts per order with parallel typed arrays (security code, side, price ticks and
+    remaining volume), indexed by a slot. Order IDs are held by their orderKey (an integer for well-formed IDs) and
+    mapped to their slot, and slots freed by remove() are reused through a free list.
+    Orders are retired as soon as they are fully traded or deleted, so the store tracks the live book rather than every
+    order seen in the session. retiredCount counts the orders dropped so far, len() gives the live orders.
+    A fully traded order is retired with retire(), which keeps its slot as a tombstone (volume 0) until a cancel,
+    re-entry or purge arrives for it: a cancel sent before the fill was seen can still arrive afterwards, and is
+    written as a DELET from the tombstone's details.
+    """
+
+    def __init__(self):
+        """
+        Creates the empty arrays, slot map and free list.
+        """
+        self.slots = {}  # orderKey of the order ID -> slot
+        self.filled = {}  # orderKey of a fully traded order -> slot, its tombstone
+        self.security = array.array('i')
+        self.side = array.array('b')
+        self.price = array.array('q')
+        self.volume = array.array('q')
+        self.free = []
+        self.retiredCount = 0
+
+        self.sides = ('Bid', 'Ask')
+        self.sideCodes = {'Bid': 0, 'Ask': 1}
+
+
+    def __len__(self):
+        return len(self.slots)
+
+
+    def __contains__(self, orderId):
+        return orderKey(orderId) in self.slots
+
+
+    def add(self, orderId, security, side, price, volume):
+        """
+        Stores the details of a passive order, replacing any details already held for the same order ID
+        (a re-entry after a full cancel amends the price).
+        Takes orderId, security (securityTable code), side ('Bid'/'Ask'), price (ticks) and volume.
+        """
+        key = orderKey(orderId)
+        sideCode = self.sideCodes[side]
+        slot = self.slots.get(key)
+        if slot is None and key in self.filled:
+            slot = self.slots[key] = self.filled.pop(key)  # a re-entry of a fully traded order takes its tombstone
+        if slot is None:
+            if self.free:
+                slot = self.free.pop()
+            else:
+                slot = len(self.volume)
+                self.security.append(security)
+                self.side.append(sideCode)
+                self.price.append(price)
+                self.volume.append(volume)
+                self.slots[key] = slot
+                return
+            self.slots[key] = slot
+        self.security[slot] = security
+        self.side[slot] = sideCode
+        self.price[slot] = price
+        self.volume[slot] = volume
+
+
+    def lookup(self, orderId):
+        """
+        Takes an order ID and returns (slot, security code, side, price, volume) for it, from its tombstone (volume 0)
+        if it has been fully traded.
+        Raises KeyError if the order is not in the store.
+        """
+        key = orderKey(orderId)
+        slot = self.slots.get(key)
+        if slot is None:
+            slot = self.filled.get(key)
+            if slot is None:
+                raise KeyError("%s ID not in order store" % orderId)
+        return slot, self.security[slot], self.sides[self.side[slot]], self.price[slot], self.volume[slot]
+
+
+    def setVolume(self, slot, volume):
+        """
+        Updates the remaining volume of the order held in slot (after a trade or an amend for volume).
+        """
+        self.volume[slot] = volume
+
+
+    def retire(self, orderId):
+        """
+        Retires a fully traded order from the live orders, keeping its slot as a tombstone for a late cancel.
+        Unknown order IDs are ignored.
+        """
+        key = orderKey(orderId)
+        slot = self.slots.pop(key, None)
+        if slot is not None:
+            self.filled[key] = slot
+            self.retiredCount += 1
+
+
+    def remove(self, orderId):
+        """
+        Retires an order (or drops the tombstone of a fully traded one) and puts its slot on the free list. Unknown
+        order IDs are ignored.
+        """
+        key = orderKey(orderId)
+        slot = self.slots.pop(key, None)
+        if slot is not None:
+            self.retiredCount += 1
+        else:
+            slot = self.filled.pop(key, None)
+        if slot is not None:
+            self.free.append(slot)
+
+
+    def purge(self):
+        """
+        Retires every live order and drops the tombstones, for use at the end of a session. The arrays are released
+        rather than kept as free slots. Returns the number of live orders purged.
+        """
+        purged = len(self.slots)
+        self.retiredCount += purged
+        self.slots = {}
+        self.filled = {}
+        self.free = []
+        for name in ('security', 'side', 'price', 'volume'):
+            setattr(self, name, array.array(getattr(self, name).typecode))
+        return purged
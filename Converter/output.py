@@ -0,0 +1,77 @@
+class BufferedLineWriter(object):
+    """
+    Output stage for converted msgs.
+    Rendered lines are collected in a list and written with one bulk write() call per buffer of flushLines lines,
+    joined with newlines in a single step instead of concatenating a newline onto every line.
+    """
+
+    def __init__(self, file_object, flushLines=65536):
+        """
+        Takes the open output file and the number of lines to hold before writing them out.
+        """
+        self.file_object = file_object
+        self.flushLines = flushLines
+        self.buffer = []
+        self.linesWritten = 0
+
+
+    def write(self, line):
+        """
+        Adds one line (without its newline) to the buffer.
+        """
+        self.buffer.append(line)
+        if len(self.buffer) >= self.flushLines:
+            self.flush()
+
+
+    def writeLines(self, lines):
+        """
+        Adds a sequence of lines (without newlines) to the buffer.
+        """
+        self.buffer.extend(lines)
+        if len(self.buffer) >= self.flushLines:
+            self.flush()
+
+
+    def flush(self):
+        """
+        Writes the buffered lines to the file in one call and empties the buffer.
+        """
+        if self.buffer:
+            self.buffer.append("")  # gives the last line its newline
+            self.file_object.write("\n".join(self.buffer))
+            self.linesWritten += len(self.buffer) - 1
+            self.buffer = []
+
+
+    def close(self):
+        """
+        Flushes any buffered lines and closes the file.
+        """
+        self.flush()
+        self.file_object.close()
+
+
+class BufferedRecordWriter(BufferedLineWriter):
+    """
+    Output stage for binary records (render.BinaryRenderer). Same interface as BufferedLineWriter, but the records
+    are joined without separators, and the file starts with the render.MAGIC header.
+    """
+
+    def __init__(self, file_object, flushLines=65536, header=b''):
+        """
+        Takes the open output file (binary mode), the number of records to hold before writing them out and the
+        header to write first.
+        """
+        super(BufferedRecordWriter, self).__init__(file_object, flushLines)
+        self.file_object.write(header)
+
+
+    def flush(self):
+        """
+        Writes the buffered records to the file in one call and empties the buffer.
+        """
+        if self.buffer:
+            self.file_object.write(b"".join(self.buffer))
+            self.linesWritten += len(self.buffer)
+            self.buffer = []
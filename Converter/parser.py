@@ -1,20 +1,31 @@
 import logging
 
-# configure logging for debugging purposes
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
-# logging.disable(logging.INFO)
-# logging.disable(logging.DEBUG) # disable logging for general run. comment out for logging.
+import decoder
+import instrument
+import render
+
+
+# Parser states, as flags: a trade burst waiting for its agg ENTER, and a cancel waiting for the next msg to show
+# whether it is an amend or a deletion. Both can be pending at once (an execution after a cancel).
+IDLE = 0
+TRADE_PENDING = 1
+CANCEL_PENDING = 2
+TRADE_AND_CANCEL_PENDING = TRADE_PENDING | CANCEL_PENDING
+
 
 class Parser:
     """
     Class can write correct conversions for all specified messages.
     Currently handles passive, agg, amend, delete, hidden, and execution msgs)
+    Rows are dispatched through a state machine: each state has a precomputed table of the handler for every
+    transType, so choosing the logic for a row is one lookup.
     """
-    def __init__(self, agg_handler, passive_writer, amd_del_writer, hidden_exe_writer):
+    def __init__(self, agg_handler, passive_writer, amd_del_writer, hidden_exe_writer, renderer=None):
         """
         Expects to be given all writer methods to be used to produce outputs.
-        lastMessageTrade and lastMessageCancel are initiated to False, and adjusted as input is received.
+        renderer turns the events the writers produce into output msgs, defaults to render.TextRenderer (SMARTS text
+        lines), render.BinaryRenderer gives binary records.
+        The state starts as IDLE (lastMessageTrade and lastMessageCancel False), and is adjusted as input is received.
         """
 
         self.agg_handler = agg_handler
@@ -22,8 +33,125 @@ class Parser:
         self.amd_del_writer = amd_del_writer
         self.hidden_exe_writer = hidden_exe_writer
 
-        self.lastMessageTrade = False
-        self.lastMessageCancel = False
+        # one security table is shared by every writer, so they all carry the same integer codes
+        self.securityTable = passive_writer.securityTable
+        for writer in (agg_handler, amd_del_writer, hidden_exe_writer):
+            writer.securityTable = self.securityTable
+
+        # one renderer is shared by every writer
+        if renderer is None:
+            renderer = render.TextRenderer()
+        self.renderer = renderer
+        for writer in (agg_handler, passive_writer, amd_del_writer, hidden_exe_writer):
+            writer.renderer = renderer
+
+        # rows are decoded once into a record that is shared by every writer
+        self.decoder = decoder.MessageDecoder(passive_writer, agg_handler, amd_del_writer, hidden_exe_writer)
+
+        self.state = IDLE
+        self.lastTimeStamp = None  # timestamp of the last row parsed
+        self.buildTransitions()
+
+
+    def __getstate__(self):
+        # the transition table holds bound methods, it is rebuilt on unpickling
+        state = self.__dict__.copy()
+        del state['transitions']
+        return state
+
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.buildTransitions()
+
+
+    def buildTransitions(self):
+        """
+        Builds the transition table: for each state, the handler of each transType (short and long variants share
+        their handler).
+        """
+        handlers = {
+            IDLE: {'A': self.onPassive, 'E': self.onExecution, 'X': self.onCancel, 'P': self.onHidden},
+            TRADE_PENDING: {'A': self.onPassiveAfterTrade, 'E': self.onExecution, 'X': self.onCancelAfterTrade,
+                            'P': self.onHiddenAfterTrade},
+            CANCEL_PENDING: {'A': self.onPassiveAfterCancel, 'E': self.onExecution, 'X': self.onCancel,
+                             'P': self.onHidden},
+            TRADE_AND_CANCEL_PENDING: {'A': self.onPassiveAfterTrade, 'E': self.onExecution,
+                                       'X': self.onCancelAfterTrade, 'P': self.onHiddenAfterTrade},
+            }
+        self.transitions = []
+        for state in (IDLE, TRADE_PENDING, CANCEL_PENDING, TRADE_AND_CANCEL_PENDING):
+            table = {}
+            for kind, handler in handlers[state].items():
+                table[kind] = table[kind.lower()] = handler
+            self.transitions.append(table)
+
+
+    @property
+    def lastMessageTrade(self):
+        """
+        True while a trade burst is pending.
+        """
+        return bool(self.state & TRADE_PENDING)
+
+
+    @lastMessageTrade.setter
+    def lastMessageTrade(self, pending):
+        self.state = self.state | TRADE_PENDING if pending else self.state & ~TRADE_PENDING
+
+
+    @property
+    def lastMessageCancel(self):
+        """
+        True while a cancel is pending (the last msg was a cancel).
+        """
+        return bool(self.state & CANCEL_PENDING)
+
+
+    @lastMessageCancel.setter
+    def lastMessageCancel(self, pending):
+        self.state = self.state | CANCEL_PENDING if pending else self.state & ~CANCEL_PENDING
+
+
+    def watermark(self):
+        """
+        Returns the earliest timestamp a msg written from now on can have, or None before the first row.
+        This is the timestamp of the last row parsed, or of the cached agg order or the cached cancel if either can
+        still be written (a cancel cache is only written out if the row straight after the cancel is a passive).
+        """
+        timeStamp = self.lastTimeStamp
+        aggTimeStamp = self.agg_handler.cacheTimeStamp
+        if aggTimeStamp is not None and aggTimeStamp < timeStamp:
+            timeStamp = aggTimeStamp
+        if self.lastMessageCancel and not self.amd_del_writer.cacheEmpty:
+            cancelTimeStamp = self.amd_del_writer.cacheTimeStamp
+            if cancelTimeStamp is not None and cancelTimeStamp < timeStamp:
+                timeStamp = cancelTimeStamp
+        return timeStamp
+
+
+    def flush(self):
+        """
+        Writes out the state still waiting for a later row, for use at the end of the input or when the input has been
+        idle (following a growing file): the agg ENTER of a pending trade burst, and the DELET of a cancel for the full
+        volume that no re-entry followed. Returns a tuple of msgs (empty if nothing was pending).
+        """
+        msgs = []
+        order_store = self.passive_writer.orderStore
+        if self.lastMessageTrade == True:
+            self.lastMessageTrade = False
+            self.agg_handler.retireFilled(order_store)
+            if self.agg_handler.cacheContraID is not None:
+                msgs.append(self.agg_handler.aggOrderDump())
+        if self.lastMessageCancel == True:
+            self.lastMessageCancel = False
+            if self.amd_del_writer.cacheEmpty == False:
+                msgs.append(self.amd_del_writer.delWriter())
+                order_store.remove(self.amd_del_writer.cacheID)
+                self.amd_del_writer.reset_cache()
+        if instrument.tracer.enabled and msgs:
+            logging.debug("Flushed pending msgs: %s", msgs)
+        return tuple(msgs)
 
 
     def getTransType(self, row):
@@ -37,115 +165,193 @@ class Parser:
         """
         Uses specified writer methods to process input data depending on the transType and related logic.
         Takes row and returns correct msg output based on writer method for that transType, or error for unrecognised transType.
+        Composite outputs (eg. a trade and the aggressive ENTER it completes) are returned as a tuple of msg strings,
+        in the order they are written.
+        """
+        return self.parseRecord(self.decoder.decode(row))
+
+
+    def parseRecord(self, record):
         """
-        aggMsg = None # set to none as aggMsg does not always have a value.
-        msg = None
-        passivemsg = None # set to none as passivemsg does not always have a value.
-        transType = self.getTransType(row)
-        aggOnly = False
-        if transType not in ['a', 'A', 'x', 'X', 'e', 'E', 'p', 'P']:
+        Runs the parse logic on a row that has already been decoded, either by MessageDecoder.decode or in bulk by
+        batch.BatchDecoder.decodeBlock. Takes the record (None for unrecognised transTypes) and returns as parse does.
+        The handler for the row is looked up in the transition table of the current state.
+        """
+        if record is None:  # transType not in ['a', 'A', 'x', 'X', 'e', 'E', 'p', 'P']
             return 0
+        self.lastTimeStamp = record.timeStamp
 
-        logging.debug("State Variables at start: lastMessageTrade=%s, lastMessageCancel=%s" % (self.lastMessageTrade, self.lastMessageCancel))
+        if instrument.tracer.enabled:
+            logging.debug("State Variables at start: lastMessageTrade=%s, lastMessageCancel=%s", self.lastMessageTrade, self.lastMessageCancel)
+
+        return self.transitions[self.state][record.transType](record)
 
-        # Check fo undisclosed orders:
-        if transType in ['a', 'A']:
-            if self.passive_writer.getOrderId(row) in self.passive_writer.undisclosedOrderList:
-                logging.info("Message for undisclosed order skipping")
-                return 0
 
-        if transType in ['x', 'X']:
-            if self.amd_del_writer.getOrderId(row) in self.passive_writer.undisclosedOrderList:
+    def parseMany(self, rows, msgs=None):
+        """
+        Parses a block of rows in one call. Takes a sequence of rows and returns the msgs they give as one flat list,
+        in output order, ready to be written out in one call. Rows that give no msg (unrecognised transTypes,
+        undisclosed orders, cancels waiting in the cache) add nothing.
+        Gives the same msgs as calling parse on each row in turn and flattening the results.
+        If msgs (a list) is given the msgs are added to it, so the msgs of the rows before a row that raises are kept.
+        """
+        return self.parseRecords(map(self.decoder.decode, rows), msgs)
+
+
+    def parseRecords(self, records, msgs=None):
+        """
+        Runs the parse logic on a block of records decoded by MessageDecoder.decode or batch.BatchDecoder.decodeBlock,
+        and returns the msgs as parseMany does. Attribute lookups are made once for the block.
+        """
+        if msgs is None:
+            msgs = []
+        append = msgs.append
+        extend = msgs.extend
+        transitions = self.transitions
+        tracer = instrument.tracer
+        for record in records:
+            if record is None:
+                continue
+            self.lastTimeStamp = record.timeStamp
+            if tracer.enabled:
+                logging.debug("State Variables at start: lastMessageTrade=%s, lastMessageCancel=%s", self.lastMessageTrade, self.lastMessageCancel)
+            msg = transitions[self.state][record.transType](record)
+            if msg.__class__ is tuple:
+                extend(msg)  # composite output, eg. trade and agg ENTER
+            elif msg and msg != "undisclosed order":
+                append(msg)
+        return msgs
+
+
+    def undisclosed(self, orderId):
+        """
+        Returns True if the order is an undisclosed order, whose msgs are skipped.
+        """
+        if orderId in self.passive_writer.undisclosedOrders:
+            if instrument.tracer.enabled:
                 logging.info("Message for undisclosed order skipping")
-                return 0
-
-       # if transType in ['e', 'E']:
-        #    if self.agg_handler.getPassiveID(row) in self.passive_writer.undisclosedOrderList:
-         #       logging.info("Message for undisclosed order skipping")
-          #      return 0
-
-        # First, run execution loop if transType is execution. Set lastMessageTrade == True
-        if transType in ['e', 'E']:
-            self.lastMessageTrade = True
-            # set both variables that can be outputted by agg_handler.exeWriter
-            msg, aggMsg =  self.agg_handler.exeWriter(row, passive_dict=self.passive_writer.passiveDict)
-            # Return early, either a trade msg or a trade and agg msg will be returned depending on the output of exeWriter.
-            if aggMsg is not None:  #if aggMsg has a value, return both aggMsg and msg (trade msg)
-                return {'msg': msg, 'aggMsg':aggMsg}
-            else:  # otherwise, return trade msg only
-                return msg
-
-        # Second, run agg msg loop.
-        # This can be built with simple bool check, because if it was a trade it would have returned above already.
-        # This will only catch other message types, hence why we can set lastMessTrade = False here.
-        # If passive msg, add details to aggmsg cache before agg msg dump. Else, dump existing agg details.
-        if self.lastMessageTrade == True:
-            self.lastMessageTrade = False
-            if transType in ['a', 'A']:
-                # deals with partially traded agg orders
-                aggMsg = self.agg_handler.aggOrderDump(row, passiveWriter=self.passive_writer)
-                aggOnly = True
-            else:
-                aggMsg = self.agg_handler.aggOrderDump(row=None)
-
-        # Third, write basic passive order entry msg when the previous msg != cancel or trade
-        if transType in ['a', 'A'] and self.lastMessageCancel == False:
-            msg = self.passive_writer.writer(row)
-
-        # Fourth, deal with cases where transType == cancel
-        if transType in ['x', 'X']:
-            self.lastMessageCancel = True
-            logging.debug("LastMessageCancel == %s" % self.lastMessageCancel)
-            # msg will only have a value if an amend can be printed at this time (partial volume amendment).
-            # Otherwise, msg value will be None and cancel cache will be appended.
-            # Next passive details are required to establish whether cancel is an amend or deletion.
-            msg = self.amd_del_writer.cacheAndWrite(row, amend_dict=self.passive_writer.passiveDict)
-            if msg is None:
-                # if there is an agg message to dump return it
-                if aggMsg is not None:
-                    return aggMsg
-                else:
-                    # if there is nothing to dump, retun 0 and wait for cancel cache on next msg
-                    return 0
-
-        # Fifth, deal with cases where passive order occurs after cancel
-        if transType in ['a', 'A'] and self.lastMessageCancel == True:
-            #logging.debug("'%s'...this should be FALSE" % self.amd_del_writer.cacheEmpty)
-            # if cache is empty, write passive (empty cache implies amend for volume already written).
-            # When volume alone is amended the passive will not be re-entered so no need to handle this case.
-            if self.amd_del_writer.cacheEmpty == True:
-                msg = self.passive_writer.writer(row)
-            # if cache != empty then either an amend or delete must be written based on amdWriter logic
-            else:
-                # If delWritten == True then both del and passive must be returned.
-                # Else, the msg will be an amend and the passive will remain None.
-                msg = self.amd_del_writer.amendWriter(row, passiveWriter=self.passive_writer)
-                if self.amd_del_writer.delWritten == True:
-                    passivemsg = self.passive_writer.writer(row)
-                    self.amd_del_writer.reset_cache()
-
-        # Sixth, deal with off-market trades
-        if transType in ['p', 'P']:
-            msg = self.hidden_exe_writer.writer(row)
-
-        # Set lastMsgCancel to false if msg type is not 'X'/'x'
-        if transType not in ["x", "X"]:
-            self.lastMessageCancel = False
+            return True
+        return False
+
+
+    def dumpTrade(self, record=None):
+        """
+        Ends the pending trade burst: retires the passive orders it filled and returns the agg ENTER msg from the
+        AggHandler cache (record is the passive entry that ended the burst, if it was one).
+        """
+        self.state &= ~TRADE_PENDING
+        self.agg_handler.retireFilled(self.passive_writer.orderStore)
+        return self.agg_handler.aggOrderDump(record)
+
+
+    def writePassive(self, record, afterCancel):
+        """
+        Writes a passive order entry. After a cancel for the full volume (a non-empty cancel cache) the entry decides
+        between a re-entry AMEND and a DELET followed by the new order's ENTER (see AmdDelWriter.amendWriter).
+        Returns (msg, passivemsg), passivemsg being the ENTER written after a DELET or None.
+        """
+        amd_del_writer = self.amd_del_writer
+        if not afterCancel or amd_del_writer.cacheEmpty:
+            # an empty cache after a cancel implies the amend for volume has already been written
+            return self.passive_writer.writer(record), None
+        msg = amd_del_writer.amendWriter(record, order_store=self.passive_writer.orderStore)
+        if amd_del_writer.delWritten:
+            passivemsg = self.passive_writer.writer(record)
+            amd_del_writer.reset_cache()
+            return msg, passivemsg
+        if record.volume > 0:
+            # the re-entry carries the amended price and volume of the order
+            self.passive_writer.storeOrder(record)
+        return msg, None
+
+
+    def composite(self, *msgs):
+        """
+        Returns the msgs that were written, in order, as a tuple; undisclosed orders are left out of the sequence.
+        """
+        if instrument.tracer.enabled:
+            logging.debug('Composite output: %s', msgs)
+        return tuple(m for m in msgs if m is not None and m != "undisclosed order")
+
+
+    # Passive order entries ('a'/'A'). The state after any of them is IDLE.
+
+    def onPassive(self, record):
+        if self.undisclosed(record.orderId):
+            return 0
+        return self.passive_writer.writer(record)
+
+
+    def onPassiveAfterCancel(self, record):
+        if self.undisclosed(record.orderId):
+            return 0
+        self.state = IDLE
+        msg, passivemsg = self.writePassive(record, True)
+        if passivemsg is not None:
+            return self.composite(msg, passivemsg)
+        return msg
+
+
+    def onPassiveAfterTrade(self, record):
+        # the entry may be the remainder of the agg order (same ID as the contra), so its volume goes to the agg
+        # ENTER, and only the agg ENTER is returned (the passive is still written to the order store)
+        if self.undisclosed(record.orderId):
+            return 0
+        aggMsg = self.dumpTrade(record)
+        self.writePassive(record, self.state & CANCEL_PENDING)
+        self.state = IDLE
+        return (aggMsg,)
+
+
+    # Executions ('e'/'E') start or continue a trade burst in any state. Either a trade msg or a trade and agg msg is
+    # returned depending on the output of exeWriter.
+
+    def onExecution(self, record):
+        if self.undisclosed(record.passiveId):  # no passive details to trade against
+            return 0
+        self.state |= TRADE_PENDING
+        msg, aggMsg = self.agg_handler.exeWriter(record, order_store=self.passive_writer.orderStore)
+        if aggMsg is not None:
+            return (msg, aggMsg)
+        return msg
+
+
+    # Cancels ('x'/'X'). The state after a cancel is CANCEL_PENDING: a cancel for the full volume is cached until
+    # the next msg shows whether it is an amend or a deletion. msg only has a value if an amend for volume can be
+    # written at this time.
+
+    def onCancel(self, record):
+        if self.undisclosed(record.orderId):
+            self.passive_writer.undisclosedOrders.remove(record.orderId)  # the order is dead once cancelled
+            return 0
+        self.state = CANCEL_PENDING
+        msg = self.amd_del_writer.cacheAndWrite(record, order_store=self.passive_writer.orderStore)
+        if msg is None:
+            return 0  # wait for the cancel cache on the next msg
+        return msg
+
+
+    def onCancelAfterTrade(self, record):
+        if self.undisclosed(record.orderId):
+            self.passive_writer.undisclosedOrders.remove(record.orderId)
+            return 0
+        aggMsg = self.dumpTrade()
+        self.state = CANCEL_PENDING
+        msg = self.amd_del_writer.cacheAndWrite(record, order_store=self.passive_writer.orderStore)
+        if msg is None:
+            return aggMsg
+        return self.composite(msg, aggMsg)
 
-        # Handle message output, including composite messages.
-        if aggMsg is not None or passivemsg is not None:
-            logging.debug('aggMsgs is not NONE or passivemsg is not NONE: agg = %s passive = %s '% (aggMsg, passivemsg))
-            if aggOnly == True:
-                msg = {'aggMsg':aggMsg}
-            else:
-                msg = {"msg": msg}  # set msg to be a dict
-                if aggMsg is not None:  # add the agg msg to the msg dict
-                    msg['aggMsg'] = aggMsg
 
-                if passivemsg is not None:  # add the passivemsg to the dirc
-                    msg['passivemsg'] = passivemsg
+    # Off-market trades ('p'/'P'). The state after any of them is IDLE.
 
-        aggOnly = False
-        return msg  # return either the msg or the dict of msgs
+    def onHidden(self, record):
+        self.state = IDLE
+        return self.hidden_exe_writer.writer(record)
 
 
+    def onHiddenAfterTrade(self, record):
+        aggMsg = self.dumpTrade()
+        msg = self.hidden_exe_writer.writer(record)
+        self.state = IDLE
+        return self.composite(msg, aggMsg)
@@ -0,0 +1,211 @@
+"""Profiling for convertRun.py --profile.
+StageProfiler times the stages of a run (read, decode, Parser.parse state logic, each writer's rendering, output
+write) with a perf_counter pair per call and prints a breakdown table. The Parser and writer modules are not changed:
+runParser wraps the stage functions of a run when it is given a profiler.
+StackSampler samples the main thread's stack on a timer and writes the counts as a collapsed-stack file (one
+"outer;...;inner count" line per stack), the input format of flamegraph.pl, speedscope and similar tools."""
+
+import cProfile
+import os
+import sys
+import threading
+import time
+
+
+# names of the writers of a Parser, as shown in the breakdown table
+WRITERS = (('passive', 'passive_writer'), ('aggressive', 'agg_handler'), ('amend/delete', 'amd_del_writer'),
+           ('hidden', 'hidden_exe_writer'))
+
+# order of the stages in the breakdown table (stages are matched by their first word)
+STAGE_ORDER = ('read', 'decode', 'parse', 'render', 'write')
+
+
+class TimedRenderer(object):
+    """
+    Stands in for a writer's renderer and times every call made to it under one stage.
+    """
+
+    def __init__(self, renderer, profiler, stage):
+        self.renderer = renderer
+        self.profiler = profiler
+        self.stage = stage
+
+
+    def __getattr__(self, name):
+        # render methods are wrapped the first time they are looked up and kept on the instance
+        method = self.profiler.timed(self.stage, getattr(self.renderer, name))
+        setattr(self, name, method)
+        return method
+
+
+class StageProfiler(object):
+    """
+    Time and call counters per stage. Stages are reported in pipeline order (STAGE_ORDER), then in the order they
+    were first timed.
+    """
+
+    def __init__(self):
+        self.seconds = {}
+        self.calls = {}
+        self.stages = []
+
+
+    def add(self, stage, seconds, calls=1):
+        """
+        Adds the time of calls to a stage.
+        """
+        if stage not in self.seconds:
+            self.stages.append(stage)
+            self.seconds[stage] = 0.0
+            self.calls[stage] = 0
+        self.seconds[stage] += seconds
+        self.calls[stage] += calls
+
+
+    def timed(self, stage, function):
+        """
+        Returns function wrapped so that each call is timed under stage.
+        """
+        clock = time.perf_counter
+        self.add(stage, 0.0, 0)
+        seconds = self.seconds
+        calls = self.calls
+
+        def timedCall(*args):
+            start = clock()
+            result = function(*args)
+            seconds[stage] += clock() - start
+            calls[stage] += 1
+            return result
+        return timedCall
+
+
+    def timedIterator(self, stage, iterable):
+        """
+        Generator of the items of iterable, timing the work done to produce each one under stage.
+        """
+        clock = time.perf_counter
+        self.add(stage, 0.0, 0)
+        iterator = iter(iterable)
+        while True:
+            start = clock()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add(stage, clock() - start, 0)
+                return
+            self.add(stage, clock() - start)
+            yield item
+
+
+    def instrumentParser(self, pasr):
+        """
+        Gives each writer of the Parser a TimedRenderer, so rendering is timed per writer.
+        """
+        for name, attribute in WRITERS:
+            writer = getattr(pasr, attribute)
+            writer.renderer = TimedRenderer(pasr.renderer, self, 'render (%s)' % name)
+
+
+    def restoreParser(self, pasr):
+        """
+        Puts the Parser's own renderer back on its writers.
+        """
+        for name, attribute in WRITERS:
+            getattr(pasr, attribute).renderer = pasr.renderer
+
+
+    def report(self, totalSeconds):
+        """
+        Takes the wall time of the run and returns the breakdown table as a string.
+        Rendering is done inside Parser.parse, so the parse row is the state logic only (parse time less rendering);
+        the remainder of the run is the run loop itself.
+        """
+        seconds = dict(self.seconds)
+        renderSeconds = sum(seconds[stage] for stage in self.stages if stage.startswith('render'))
+        if 'parse' in seconds:
+            seconds['parse'] -= renderSeconds
+        timedSeconds = sum(seconds.values())
+        lines = ["%-26s %12s %10s %8s %10s" % ('stage', 'calls', 'seconds', '% run', 'us/call')]
+        ranks = dict((name, rank) for rank, name in enumerate(STAGE_ORDER))
+        for stage in sorted(self.stages, key=lambda stage: ranks.get(stage.split()[0], len(ranks))):
+            calls = self.calls[stage]
+            lines.append("%-26s %12s %10.3f %7.1f%% %10.2f" % (
+                'parse (state logic)' if stage == 'parse' else stage, calls, seconds[stage],
+                100.0 * seconds[stage] / totalSeconds if totalSeconds else 0.0,
+                1e6 * seconds[stage] / calls if calls else 0.0))
+        other = max(0.0, totalSeconds - timedSeconds)
+        lines.append("%-26s %12s %10.3f %7.1f%%" % ('other (run loop)', '', other,
+                                                     100.0 * other / totalSeconds if totalSeconds else 0.0))
+        lines.append("%-26s %12s %10.3f" % ('total', '', totalSeconds))
+        return "\n".join(lines)
+
+
+class StackSampler(object):
+    """
+    Samples the stack of the thread that created it every interval seconds from a background thread.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.threadId = threading.get_ident()
+        self.counts = {}
+        self.samples = 0
+        self.stopping = threading.Event()
+        self.thread = None
+
+
+    def start(self):
+        self.thread = threading.Thread(target=self.sample, name='stack-sampler')
+        self.thread.daemon = True
+        self.thread.start()
+
+
+    def stop(self):
+        self.stopping.set()
+        if self.thread is not None:
+            self.thread.join()
+
+
+    def sample(self):
+        counts = self.counts
+        while not self.stopping.wait(self.interval):
+            frame = sys._current_frames().get(self.threadId)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append("%s (%s)" % (code.co_name, os.path.basename(code.co_filename)))
+                frame = frame.f_back
+            if stack:
+                key = ";".join(reversed(stack))
+                counts[key] = counts.get(key, 0) + 1
+                self.samples += 1
+
+
+    def write(self, path):
+        """
+        Writes the sampled stacks to path in collapsed-stack format.
+        """
+        with open(path, 'w') as collapsed_file:
+            for stack, count in sorted(self.counts.items()):
+                collapsed_file.write("%s %s\n" % (stack, count))
+
+
+def profileCall(path, function, *args, **kwargs):
+    """
+    Calls function and writes a profile of the call to path: cProfile stats (for pstats or snakeviz) if path ends in
+    .prof or .pstats, otherwise a collapsed-stack file from a StackSampler. Returns what function returns.
+    """
+    if path.endswith(('.prof', '.pstats')):
+        profile = cProfile.Profile()
+        try:
+            return profile.runcall(function, *args, **kwargs)
+        finally:
+            profile.dump_stats(path)
+    sampler = StackSampler()
+    sampler.start()
+    try:
+        return function(*args, **kwargs)
+    finally:
+        sampler.stop()
+        sampler.write(path)
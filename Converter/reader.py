@@ -0,0 +1,140 @@
+import mmap
+import time
+
+
+def splitRows(chunk, transTypeLoc=9, skipTypes=('t',), text=True):
+    """
+    Splits a chunk of whole lines (bytes or a memoryview) into rows in one call and drops blank rows and rows of the
+    skipped transTypes. Rows are str (decoded from ASCII in one step for the chunk, straight from the memoryview) if
+    text is True, otherwise bytes.
+    Returns (kept rows, number of rows dropped).
+    """
+    if text:
+        rows = str(chunk, 'ascii').split('\n')
+        skip = set(skipTypes) | set([''])
+    else:
+        rows = bytes(chunk).split(b'\n')  # the rows are bytes objects, so one copy of the chunk is made here
+        skip = set([skipType.encode('ascii') for skipType in skipTypes]) | set([b''])
+    kept = [row for row in rows if row[transTypeLoc:transTypeLoc + 1] not in skip]
+    return kept, len(rows) - len(kept)
+
+
+class ChunkedReader(object):
+    """
+    Input stage for ChiX daily files.
+    The file is memory-mapped and cut into chunks of about chunkBytes that end on a line boundary, handed out as
+    memoryviews of the map so that no bytes are copied until the chunk is split. Each chunk is split into rows in one
+    call and blank rows and comment rows ('t' transType) are dropped before anything else looks at
+    them. Rows are handed on as str, decoded from ASCII once per chunk rather than once per row, or as bytes for
+    decoders that work on bytes (batch.BatchDecoder).
+    """
+
+    def __init__(self, path, transTypeLoc=9, chunkBytes=1 << 24, skipTypes=('t',), start=0):
+        """
+        Takes the input path, the position of the transType in a row, the chunk size in bytes, the transTypes of
+        rows to drop and the byte offset to start reading from (the start of a row, eg. a checkpointed offset).
+        """
+        self.path = path
+        self.transTypeLoc = transTypeLoc
+        self.chunkBytes = chunkBytes
+        self.skipTypes = skipTypes  # rows too short to have a transType are dropped as blank
+        self.rowsSkipped = 0
+        self.offset = start  # byte offset of the first row of the next chunk
+
+
+    def __iter__(self):
+        return self.rows()
+
+
+    def chunks(self):
+        """
+        Generator of the file contents as memoryview chunks of about chunkBytes, each ending at the end of a line
+        (without its newline). offset is moved past each chunk as it is handed out. A chunk is a view of the mapped
+        file and is released when the next chunk is asked for, so it must be used (or copied) before then.
+        """
+        with open(self.path, 'rb') as input_file:
+            try:
+                data = mmap.mmap(input_file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:  # empty files cannot be mapped
+                return
+            view = memoryview(data)
+            try:
+                size = len(data)
+                start = self.offset
+                while start < size:
+                    end = start + self.chunkBytes
+                    if end >= size:
+                        end = size
+                    else:
+                        cut = data.rfind(b'\n', start, end)
+                        if cut < start:  # a line longer than a chunk
+                            cut = data.find(b'\n', end)
+                        end = size if cut < 0 else cut
+                    chunk = view[start:end]
+                    start = self.offset = min(end + 1, size)
+                    try:
+                        yield chunk
+                    finally:
+                        chunk.release()  # the map cannot be closed while views of it are held
+            finally:
+                view.release()
+                data.close()
+
+
+    def followChunks(self, pollInterval=0.1, stopAfter=None):
+        """
+        Generator of chunks as chunks(), for a file that is still being written (like tail -f). The file is read
+        rather than mapped, from offset, and a partial last line is held back until the rest of it has been written.
+        When no complete line is available, None is yielded and the file is polled again after pollInterval seconds.
+        Stops once no data has arrived for stopAfter seconds (never if stopAfter is None).
+        """
+        with open(self.path, 'rb') as input_file:
+            input_file.seek(self.offset)
+            pending = b''
+            lastData = time.time()
+            while True:
+                data = input_file.read(self.chunkBytes)
+                if data:
+                    lastData = time.time()
+                    data = pending + data
+                    cut = data.rfind(b'\n')
+                    if cut >= 0:
+                        chunk, pending = data[:cut], data[cut + 1:]
+                        self.offset += cut + 1
+                        yield chunk
+                        continue
+                    pending = data
+                if stopAfter is not None and time.time() - lastData >= stopAfter:
+                    if pending:  # the last line of a file that has stopped growing
+                        self.offset += len(pending)
+                        yield pending
+                    return
+                yield None
+                time.sleep(pollInterval)
+
+
+    def blocks(self, text=True, follow=False, pollInterval=0.1, stopAfter=None):
+        """
+        Generator of lists of the rows in each chunk, without their newlines, with blank and comment rows dropped.
+        Rows are str if text is True, otherwise bytes.
+        If follow is True, the file is followed as it grows (see followChunks) and an empty list is yielded each time
+        the input is found idle.
+        """
+        chunks = self.followChunks(pollInterval, stopAfter) if follow else self.chunks()
+        for chunk in chunks:
+            if chunk is None:
+                yield []
+                continue
+            kept, skipped = splitRows(chunk, self.transTypeLoc, self.skipTypes, text)
+            self.rowsSkipped += skipped
+            if kept:
+                yield kept
+
+
+    def rows(self, text=True):
+        """
+        Generator of single rows, as blocks().
+        """
+        for block in self.blocks(text):
+            for row in block:
+                yield row
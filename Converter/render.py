@@ -0,0 +1,225 @@
+"""Renderers for the events written by the converter (ENTER, TRADE, AMEND, DELET and OFFTR msgs).
+The writers hand each event's fields to the Parser's renderer. TextRenderer gives the SMARTS text line. BinaryRenderer
+packs the same fields into a fixed-layout record, so a run can skip formatting text lines and re-parsing them later.
+readRecords reads a binary file back, and recordsToText renders it as the same text lines the text renderer writes."""
+
+import argparse
+import struct
+
+import base
+
+
+# event kinds and their variants (the text differs between passive and aggressive ENTERs, and between the AMEND for
+# volume written at a partial cancel and the AMEND written at a re-entry)
+ENTER, TRADE, AMEND, DELET, OFFTR = 1, 2, 3, 4, 5
+PASSIVE, AGGRESSIVE = 0, 1
+CANCEL, REENTRY = 0, 1
+
+SIDES = ('Bid', 'Ask')
+SIDE_CODES = {'Bid': 0, 'Ask': 1}
+NO_SIDE = 255
+
+# kind, variant, side, timestamp (ms), price (ticks), volume, security, order ID (or trade ref), bid ID, ask ID
+RECORD = struct.Struct('<BBBIqq6s9s9s9s')
+MAGIC = b'CHIXBIN1'
+
+
+class TextRenderer(base.ChiX_conversion):
+    """
+    Renders events as SMARTS text lines.
+    Timestamps are the "00:00:00.000000" strings of the records, prices are in priceScale ticks and securities are
+    symbols.
+    """
+
+    def passiveEnter(self, timeStamp, orderId, security, side, price, volume):
+        """
+        Returns the ENTER line for a passive order entry, eg.
+        "* 57 10:00:00.013000:  ENTER CGF 57 Ask 7.30 1979 14446 <ON > (@1 {*O=57})"
+        """
+        return "* %s %s:  ENTER %s %s %s %s %s %s <ON > (@1 {*O=%s})" % (
+            orderId, timeStamp, security, orderId, side, self.returnPriceString(price), volume,
+            self.getTransValue(price, volume), orderId)
+
+
+    def aggEnter(self, timeStamp, orderId, security, side, price, volume):
+        """
+        Returns the ENTER line for an aggressive order built from a trade burst (price as a shortest decimal).
+        """
+        return "* %s %s:  ENTER %s %s %s %s %s %s <ON > (@1 {*O=%s})" % (
+            orderId, timeStamp, security, orderId, side, self.returnDecimalString(price), volume,
+            self.getTransValue(price, volume), orderId)
+
+
+    def trade(self, timeStamp, tradeRef, security, price, volume, bidId, askId):
+        """
+        Returns the TRADE line for an execution, eg.
+        "* 111 10:00:00.000000:  TRADE BHP 111 100.0 50 5000 <ON > B(12345  ) A(9876  ) T(*F=111})"
+        """
+        return "* %s %s:  TRADE %s %s %s %s %s <ON > B(%s  ) A(%s  ) T(*F=%s})" % (
+            tradeRef, timeStamp, security, tradeRef, self.returnDecimalString(price), volume,
+            self.getTransValue(price, volume), bidId, askId, tradeRef)
+
+
+    def cancelAmend(self, timeStamp, orderId, security, side, price, volume):
+        """
+        Returns the AMEND for volume line written at a partial cancel. Takes the new volume of the order.
+        """
+        return "* %s:  AMEND %s %s %s abs %s %s %s ({*0=%s})" % (
+            timeStamp, security, orderId, side, self.returnDecimalString(price), volume,
+            self.returnDecimalString(volume * price), orderId)
+
+
+    def reentryAmend(self, timeStamp, orderId, security, side, price, volume):
+        """
+        Returns the AMEND line written when a cancelled order is re-entered. Takes the change in volume.
+        """
+        return "* %s %s:  AMEND %s %s %s abs %s %s %s ({*0=%s})" % (
+            orderId, timeStamp, security, orderId, side, self.returnPriceString(price), volume,
+            self.returnDecimalString(volume * price), orderId)
+
+
+    def delete(self, timeStamp, orderId, security, side):
+        """
+        Returns the DELET line for a cancelled order.
+        """
+        return "* %s %s:  DELET %s %s %s 0 ()" % (orderId, timeStamp, orderId, security, side)
+
+
+    def offMarketTrade(self, timeStamp, hiddenId, security, price, volume):
+        """
+        Returns the OFFTR line for a hidden order execution.
+        """
+        return '* %s %s:  OFFTR %s %s exec= %s %s %s %s <OF> T({*F=}) B() A() OFF MARKET TRADE MESSAGE' % (
+            hiddenId, timeStamp, security, hiddenId, timeStamp, self.returnPriceString(price), volume,
+            self.getTransValue(price, volume))
+
+
+    def renderRecord(self, fields):
+        """
+        Takes the fields of one binary record (as unpacked by readRecords) and returns its text line, the same line
+        TextRenderer writes for the event.
+        """
+        kind, variant, side, millis, price, volume, security, orderId, bidId, askId = fields
+        timeStamp = self.timeStampFormatter.format(millis)
+        security = security.rstrip(b'\0').decode('ascii')
+        orderId = orderId.rstrip(b'\0').decode('ascii')
+        side = SIDES[side] if side != NO_SIDE else None
+        if kind == ENTER:
+            if variant == AGGRESSIVE:
+                return self.aggEnter(timeStamp, orderId, security, side, price, volume)
+            return self.passiveEnter(timeStamp, orderId, security, side, price, volume)
+        if kind == TRADE:
+            return self.trade(timeStamp, orderId, security, price, volume, bidId.rstrip(b'\0').decode('ascii'),
+                              askId.rstrip(b'\0').decode('ascii'))
+        if kind == AMEND:
+            if variant == REENTRY:
+                return self.reentryAmend(timeStamp, orderId, security, side, price, volume)
+            return self.cancelAmend(timeStamp, orderId, security, side, price, volume)
+        if kind == DELET:
+            return self.delete(timeStamp, orderId, security, side)
+        if kind == OFFTR:
+            return self.offMarketTrade(timeStamp, orderId, security, price, volume)
+        raise ValueError("Unknown record kind %s" % kind)
+
+
+class BinaryRenderer(base.ChiX_conversion):
+    """
+    Packs events into fixed-layout binary records (RECORD, 56 bytes), taking the same arguments as TextRenderer.
+    IDs and symbols are stored as their ASCII text (up to the width of their input field), timestamps as milliseconds.
+    """
+
+    def __init__(self):
+        super(BinaryRenderer, self).__init__()
+        self.bindMethods()
+
+
+    def __getstate__(self):
+        # the bound pack and parse methods cannot be pickled, so they are bound again on unpickling
+        state = self.__dict__.copy()
+        del state['pack'], state['parseTimeStamp']
+        return state
+
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.bindMethods()
+
+
+    def bindMethods(self):
+        self.pack = RECORD.pack
+        self.parseTimeStamp = self.timeStampFormatter.parse
+
+
+    def passiveEnter(self, timeStamp, orderId, security, side, price, volume):
+        return self.pack(ENTER, PASSIVE, SIDE_CODES[side], self.parseTimeStamp(timeStamp), price, volume,
+                         security.encode('ascii'), orderId.encode('ascii'), b'', b'')
+
+
+    def aggEnter(self, timeStamp, orderId, security, side, price, volume):
+        return self.pack(ENTER, AGGRESSIVE, SIDE_CODES[side], self.parseTimeStamp(timeStamp), price, volume,
+                         security.encode('ascii'), orderId.encode('ascii'), b'', b'')
+
+
+    def trade(self, timeStamp, tradeRef, security, price, volume, bidId, askId):
+        return self.pack(TRADE, 0, NO_SIDE, self.parseTimeStamp(timeStamp), price, volume, security.encode('ascii'),
+                         tradeRef.encode('ascii'), bidId.encode('ascii'), askId.encode('ascii'))
+
+
+    def cancelAmend(self, timeStamp, orderId, security, side, price, volume):
+        return self.pack(AMEND, CANCEL, SIDE_CODES[side], self.parseTimeStamp(timeStamp), price, volume,
+                         security.encode('ascii'), orderId.encode('ascii'), b'', b'')
+
+
+    def reentryAmend(self, timeStamp, orderId, security, side, price, volume):
+        return self.pack(AMEND, REENTRY, SIDE_CODES[side], self.parseTimeStamp(timeStamp), price, volume,
+                         security.encode('ascii'), orderId.encode('ascii'), b'', b'')
+
+
+    def delete(self, timeStamp, orderId, security, side):
+        return self.pack(DELET, 0, SIDE_CODES[side], self.parseTimeStamp(timeStamp), 0, 0, security.encode('ascii'),
+                         orderId.encode('ascii'), b'', b'')
+
+
+    def offMarketTrade(self, timeStamp, hiddenId, security, price, volume):
+        return self.pack(OFFTR, 0, NO_SIDE, self.parseTimeStamp(timeStamp), price, volume, security.encode('ascii'),
+                         str(hiddenId).encode('ascii'), b'', b'')
+
+
+def readRecords(path, chunkRecords=65536):
+    """
+    Generator of the records of a binary output file, as tuples of fields in RECORD order (strings as NUL padded
+    bytes). Raises ValueError if the file is not a binary output file or ends part way through a record.
+    """
+    with open(path, 'rb') as binary_file:
+        if binary_file.read(len(MAGIC)) != MAGIC:
+            raise ValueError("%s is not a binary output file" % path)
+        while True:
+            chunk = binary_file.read(RECORD.size * chunkRecords)
+            if not chunk:
+                break
+            if len(chunk) % RECORD.size:
+                raise ValueError("%s ends part way through a record" % path)
+            for fields in RECORD.iter_unpack(chunk):
+                yield fields
+
+
+def recordsToText(input_path, output_path):
+    """
+    Renders a binary output file as the text output file for the same run.
+    """
+    renderer = TextRenderer()
+    with open(output_path, 'w') as text_file:
+        lines = [renderer.renderRecord(fields) for fields in readRecords(input_path)]
+        if lines:
+            lines.append("")  # gives the last line its newline
+            text_file.write("\n".join(lines))
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(description='Renders a binary output file as SMARTS text')
+
+    argparser.add_argument('input_path', type=str, help='The binary output file path')
+    argparser.add_argument('output_path', type=str, help='The text output file path')
+
+    args = argparser.parse_args()
+    recordsToText(args.input_path, args.output_path)
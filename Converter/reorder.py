@@ -0,0 +1,78 @@
+import heapq
+import logging
+
+import merge
+
+
+class ReorderBuffer(object):
+    """
+    Output stage that puts the msgs of a run in timestamp order.
+    Aggressive ENTER msgs are written with the timestamp of the first trade of their burst, and DELET/AMEND msgs with
+    the timestamp of their cancel, but only once later rows have been seen, so the Parser's output is slightly out of
+    order. Lines are held in a heap keyed on (timestamp, arrival) until the watermark (Parser.watermark, the earliest
+    timestamp any msg still to come can have) passes them, and are then handed to the writer in order, so lines with
+    equal timestamps keep the order they were written in.
+    At most maxLines lines are held: past that the earliest line is written straight away and counted in forcedCount.
+    """
+
+    def __init__(self, writer, maxLines=100000):
+        """
+        Takes the writer the ordered lines are passed to (output.BufferedLineWriter) and the maximum lines to hold.
+        """
+        self.writer = writer
+        self.maxLines = maxLines
+        self.heap = []
+        self.sequence = 0
+        self.forcedCount = 0
+
+
+    def write(self, line):
+        """
+        Adds one line (without its newline) to the buffer.
+        """
+        heapq.heappush(self.heap, (merge.timeStampKey(line), self.sequence, line))
+        self.sequence += 1
+        if len(self.heap) > self.maxLines:
+            self.writer.write(heapq.heappop(self.heap)[2])
+            self.forcedCount += 1
+
+
+    def writeLines(self, lines):
+        """
+        Adds a sequence of lines (without newlines) to the buffer.
+        """
+        for line in lines:
+            self.write(line)
+
+
+    def release(self, watermark):
+        """
+        Takes the watermark timestamp ("00:00:00.000000", or None before the first row) and writes out every line with
+        an earlier or equal timestamp (a later msg with the watermark timestamp is written after them in any case).
+        """
+        if watermark is None:
+            return
+        heap = self.heap
+        key = (len(watermark), watermark)
+        while heap and heap[0][0] <= key:
+            self.writer.write(heapq.heappop(heap)[2])
+
+
+    def flush(self):
+        """
+        Writes out every line held, in order.
+        """
+        heap = self.heap
+        while heap:
+            self.writer.write(heapq.heappop(heap)[2])
+
+
+    def close(self):
+        """
+        Writes out every line held and closes the writer.
+        """
+        self.flush()
+        if self.forcedCount:
+            logging.warning("Reorder buffer full, %s lines written before their turn (maxLines %s)", self.forcedCount,
+                            self.maxLines)
+        self.writer.close()
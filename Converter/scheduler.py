@@ -0,0 +1,133 @@
+import logging
+import multiprocessing
+import os
+import time
+import traceback
+
+import instrument
+import metrics
+
+
+class FileJob(object):
+    """
+    One input file to convert. Holds the paths, the input size used for scheduling and the keyword arguments for the
+    runner. Jobs are pickled to the workers, so they carry no parser state: each worker builds its own parser.
+    """
+
+    def __init__(self, input_path, output_path, options):
+        """
+        Takes the input and output paths and a dict of keyword arguments for the runner.
+        """
+        self.input_path = input_path
+        self.output_path = output_path
+        self.options = options
+        self.size = os.path.getsize(input_path)
+
+
+class JobResult(object):
+    """
+    Outcome of one FileJob: the stats returned by the runner, the wall time in seconds, and the formatted traceback if
+    the runner raised (error is None otherwise).
+    """
+
+    def __init__(self, job, stats=None, seconds=0.0, error=None):
+        self.input_path = job.input_path
+        self.output_path = job.output_path
+        self.size = job.size
+        self.stats = stats
+        self.seconds = seconds
+        self.error = error
+
+
+def availableMemory():
+    """
+    Returns the memory available for new processes in bytes, or None if it cannot be found.
+    """
+    try:
+        with open('/proc/meminfo') as meminfo:
+            for line in meminfo:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except (IOError, OSError, ValueError):
+        pass
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def workerCount(jobs, processors=None, workerMemory=1 << 30):
+    """
+    Picks the number of worker processes for a list of jobs.
+    An explicit processors value is used as given, otherwise one worker per core, limited by the available memory
+    divided by workerMemory (the expected peak memory of one worker). Never more workers than jobs, never fewer than 1.
+    """
+    if processors is None:
+        processors = multiprocessing.cpu_count()
+        memory = availableMemory()
+        if memory is not None:
+            processors = min(processors, memory // workerMemory)
+    return max(1, min(processors, len(jobs)))
+
+
+def workerInit(log_queue, nolog=False, logEvery=1, metricsQueue=None, metricsInterval=10.0):
+    """
+    Pool initializer: sets up worker logging (instrument.workerLogging) and, if metricsQueue is given, metrics
+    publishing (metrics.workerMetrics).
+    """
+    instrument.workerLogging(log_queue, nolog, logEvery)
+    if metricsQueue is not None:
+        metrics.workerMetrics(metricsQueue, metricsInterval)
+
+
+def runJob(runner_job):
+    """
+    Runs one job in a worker. Takes (runner, job), calls runner(job) and returns a JobResult with its stats and wall
+    time. Exceptions are caught and returned in the JobResult, so one bad file does not stop the others.
+    """
+    runner, job = runner_job
+    start = time.time()
+    try:
+        stats = runner(job)
+    except Exception:
+        return JobResult(job, seconds=time.time() - start, error=traceback.format_exc())
+    return JobResult(job, stats, time.time() - start)
+
+
+def runJobs(runner, jobs, processors=None, workerMemory=1 << 30, nolog=False, logEvery=1, metricsQueue=None,
+            metricsInterval=10.0):
+    """
+    Runs every job on a process pool, largest input first, so the biggest files start straight away and the small
+    ones fill in around them instead of a big file at the end of the list setting the finish time.
+    runner must be a module level function taking a FileJob (it is pickled to the workers).
+    Worker log records are passed to this process through a queue. If metricsQueue is given, workers publish metrics
+    snapshots on it every metricsInterval seconds (read by a metrics.MetricsAggregator).
+    Returns the list of JobResults in completion order.
+    """
+    jobs = sorted(jobs, key=lambda job: job.size, reverse=True)
+    processes = workerCount(jobs, processors, workerMemory)
+    logging.info("Running %s files on %s workers", len(jobs), processes)
+
+    # workers put their log records on a queue, written out by a listener in this process
+    log_queue = multiprocessing.Queue(-1)
+    log_listener = instrument.startQueueListener(log_queue)
+
+    results = []
+    pool = multiprocessing.Pool(processes, initializer=workerInit,
+                                initargs=(log_queue, nolog, logEvery, metricsQueue, metricsInterval))
+    try:
+        for result in pool.imap_unordered(runJob, [(runner, job) for job in jobs], chunksize=1):
+            if result.error is None:
+                logging.info("Converted %s (%s bytes) in %.3fs: %s", result.input_path, result.size, result.seconds,
+                             result.stats)
+            else:
+                logging.error("Failed %s after %.3fs:\n%s", result.input_path, result.seconds, result.error)
+            results.append(result)
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+        log_listener.stop()
+    return results
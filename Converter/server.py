@@ -0,0 +1,440 @@
+"""Streaming conversion server.
+Accepts ChiX rows over TCP or a Unix socket and streams the converted SMARTS lines (or binary records, with --binary)
+back over the same connection. Each feed connection has its own Parser, so its order state and security table are its
+own, and the rows of a connection are converted in the order they arrive, giving the same lines as a file run of the
+same rows. The pending msgs are flushed once the feed has been idle for -idleflush seconds and when it ends.
+Subscribers connect to a second endpoint (-subport or -subunix) and are sent the lines converted from every feed, each
+batch of a feed as it is converted (batches hold whole lines, so the lines of different feeds are never mixed up).
+If a row of a feed fails to convert, the lines of the rows before it are sent, then an error report, and the feed is
+closed; the other feeds carry on.
+The send command is a client stand-in that feeds a file to the server and writes what comes back to an output file,
+and the subscribe command one that writes what a subscriber is sent to an output file."""
+
+import argparse
+import asyncio
+import logging
+import time
+
+import convertRun
+import instrument
+import reader
+import render
+
+
+# starts the error report sent to a feed client: an "ERROR <error>" line for text output (SMARTS lines start with
+# "* "), ERROR_MAGIC followed by the same line for binary records (a record starts with its kind, 1 to 5)
+ERROR = b'ERROR '
+ERROR_MAGIC = b'CHIXERR1'
+
+
+class FeedError(Exception):
+    """
+    Raised by FeedSession when a row fails to convert. Carries the error, the bytes converted from the rows before
+    the failing row and the numbers of the first and last rows of the batch it is in.
+    """
+
+    def __init__(self, error, output_bytes, firstRow, lastRow):
+        super(FeedError, self).__init__("in rows %s to %s: %s: %s" % (firstRow, lastRow, type(error).__name__, error))
+        self.error = error
+        self.output_bytes = output_bytes
+
+
+class FeedSession(object):
+    """
+    Conversion state of one feed connection: its Parser and the partial row held back at the end of the last read.
+    """
+
+    def __init__(self, pasr, binary=False):
+        self.pasr = pasr
+        self.binary = binary
+        self.pending = b''
+        self.rows = 0
+        self.rowsSkipped = 0
+        self.linesWritten = 0
+        self.flushPending = False  # rows have been parsed since the last flush
+
+
+    def convert(self, data):
+        """
+        Takes the bytes read from the connection and returns the bytes to send back for the complete rows in them.
+        A partial last row is held back until the rest of it arrives.
+        Raises FeedError if a row fails to convert.
+        """
+        data = self.pending + data
+        cut = data.rfind(b'\n')
+        if cut < 0:
+            self.pending = data
+            return b''
+        self.pending = data[cut + 1:]
+        block = data[:cut]
+        firstRow = self.rows + 1
+        msgs = []
+        try:
+            rows, skipped = reader.splitRows(block)  # raises UnicodeDecodeError for bytes that are not ASCII
+            self.rowsSkipped += skipped
+            self.rows += len(rows)
+            if rows:
+                self.flushPending = True
+            self.pasr.parseMany(rows, msgs)
+        except Exception as error:
+            self.pending = b''
+            # a batch that cannot be split counts no rows, it is reported up to its last line
+            lastRow = self.rows if self.rows >= firstRow else firstRow + block.count(b'\n')
+            raise FeedError(error, self.encode(msgs), firstRow, lastRow)
+        return self.encode(msgs)
+
+
+    def flush(self, final=False):
+        """
+        Returns the bytes of the msgs still waiting for a later row. If final is True the feed has ended and a partial
+        last row (one without a newline) is converted first.
+        """
+        data = b''
+        if final and self.pending:
+            data = self.convert(b'\n')
+        if not self.flushPending:
+            return data
+        self.flushPending = False
+        return data + self.encode(self.pasr.flush())
+
+
+    def encode(self, msgs):
+        """
+        Returns the bytes for a sequence of msgs (text lines, or binary records).
+        """
+        self.linesWritten += len(msgs)
+        if not msgs:
+            return b''
+        if self.binary:
+            return b''.join(msgs)
+        return ("\n".join(msgs) + "\n").encode('ascii')
+
+
+    def errorReport(self, error):
+        """
+        Returns the bytes reporting a FeedError to the client, sent after the lines converted before it.
+        """
+        report = ERROR + ("%s\n" % str(error).replace("\n", " ")).encode('ascii', 'replace')
+        return ERROR_MAGIC + report if self.binary else report
+
+
+class ConversionServer(object):
+    """
+    asyncio server converting feed connections.
+    Reads are batched adaptively: each read takes up to the current batch size, which doubles (up to maxBatch bytes)
+    while reads come back full and halves (down to minBatch bytes) when they come back mostly empty, so a busy feed is
+    converted in large blocks and a quiet one with low latency.
+    Backpressure: each converted batch is drained to the connection before the next read, so a client that is slow to
+    read the output stops the server reading its input, and the socket buffers push back on the sender.
+    Subscribers do not hold up the feeds: each has a queue of at most subscriberQueue batches, and a subscriber that
+    falls that far behind is disconnected.
+    """
+
+    def __init__(self, binary=False, idleflush=1.0, minBatch=1 << 12, maxBatch=1 << 20, writeLimit=1 << 20,
+                 subscriberQueue=256):
+        """
+        Takes whether to send binary records, the idle seconds before pending msgs are flushed, the batch size bounds
+        in bytes, the output bytes buffered per connection before the server waits for the client to read and the
+        batches queued per subscriber before it is disconnected.
+        """
+        self.binary = binary
+        self.idleflush = idleflush
+        self.minBatch = minBatch
+        self.maxBatch = maxBatch
+        self.writeLimit = writeLimit
+        self.subscriberQueue = subscriberQueue
+        self.connections = 0
+        self.subscribers = {}  # queue of each subscriber -> its peer name
+
+
+    def publish(self, output_bytes):
+        """
+        Queues a batch of converted bytes for every subscriber, disconnecting those whose queue is full.
+        """
+        for queue, peer in list(self.subscribers.items()):
+            try:
+                queue.put_nowait(output_bytes)
+            except asyncio.QueueFull:
+                logging.warning("Subscriber %s disconnected, %s batches behind", peer, queue.qsize())
+                self.dropSubscriber(queue)
+
+
+    def dropSubscriber(self, queue):
+        """
+        Disconnects a subscriber without sending the batches queued for it.
+        """
+        self.subscribers.pop(queue, None)
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait(None)
+
+
+    def closeSubscribers(self):
+        """
+        Disconnects the subscribers once the batches queued for them are sent.
+        """
+        for queue in list(self.subscribers):
+            try:
+                queue.put_nowait(None)
+            except asyncio.QueueFull:
+                self.dropSubscriber(queue)
+
+
+    async def send(self, stream_writer, output_bytes):
+        """
+        Sends converted bytes to the feed client and to the subscribers.
+        """
+        if output_bytes:
+            self.publish(output_bytes)
+            stream_writer.write(output_bytes)
+            await stream_writer.drain()
+
+
+    async def handleFeed(self, stream_reader, stream_writer):
+        """
+        Converts one feed connection until the client ends its input, then flushes and closes the connection.
+        """
+        self.connections += 1
+        peer = stream_writer.get_extra_info('peername') or 'connection %s' % self.connections
+        stream_writer.transport.set_write_buffer_limits(high=self.writeLimit)
+        session = FeedSession(convertRun.buildParser(self.binary), self.binary)
+        logging.info("Feed opened: %s", peer)
+        start = time.time()
+        batch = self.minBatch
+        try:
+            if self.binary:
+                stream_writer.write(render.MAGIC)
+            while True:
+                try:
+                    data = await asyncio.wait_for(stream_reader.read(batch), self.idleflush)
+                except asyncio.TimeoutError:  # idle feed, send the msgs waiting for a later row
+                    await self.send(stream_writer, session.flush())
+                    continue
+                if not data:
+                    break
+                if len(data) == batch:
+                    batch = min(batch * 2, self.maxBatch)
+                elif len(data) < batch // 4:
+                    batch = max(batch // 2, self.minBatch)
+                await self.send(stream_writer, session.convert(data))
+            await self.send(stream_writer, session.flush(final=True))
+            if stream_writer.can_write_eof():
+                stream_writer.write_eof()
+        except FeedError as error:
+            logging.error("Feed %s failed %s", peer, error, exc_info=error.error)
+            try:
+                await self.send(stream_writer, error.output_bytes)
+                stream_writer.write(session.errorReport(error))
+                await stream_writer.drain()
+            except ConnectionError:
+                pass
+        except ConnectionError as error:
+            logging.warning("Feed %s lost: %s", peer, error)
+        finally:
+            stream_writer.close()
+        logging.info("Feed closed: %s, rows %s (skipped %s), lines written %s in %.2fs", peer, session.rows,
+                     session.rowsSkipped, session.linesWritten, time.time() - start)
+
+
+    async def handleSubscriber(self, stream_reader, stream_writer):
+        """
+        Sends the lines converted from every feed to one subscriber connection until it disconnects or falls too far
+        behind.
+        """
+        peer = stream_writer.get_extra_info('peername') or 'subscriber %s' % (len(self.subscribers) + 1)
+        queue = asyncio.Queue(self.subscriberQueue)
+        self.subscribers[queue] = peer
+        logging.info("Subscriber opened: %s", peer)
+        closed = asyncio.ensure_future(stream_reader.read())  # subscribers send nothing, this ends when they go
+        sent = 0
+        try:
+            if self.binary:
+                stream_writer.write(render.MAGIC)
+            while True:
+                batch = asyncio.ensure_future(queue.get())
+                await asyncio.wait((batch, closed), return_when=asyncio.FIRST_COMPLETED)
+                if not batch.done():
+                    batch.cancel()
+                    break
+                output_bytes = batch.result()
+                if output_bytes is None:  # disconnected by publish
+                    break
+                stream_writer.write(output_bytes)
+                await stream_writer.drain()
+                sent += len(output_bytes)
+        except ConnectionError as error:
+            logging.warning("Subscriber %s lost: %s", peer, error)
+        finally:
+            self.subscribers.pop(queue, None)
+            closed.cancel()
+            stream_writer.close()
+        logging.info("Subscriber closed: %s, %s bytes sent", peer, sent)
+
+
+    async def start(self, host='127.0.0.1', port=9000, unixPath=None, handler=None):
+        """
+        Starts listening on the Unix socket unixPath if given, otherwise on host and port. Returns the asyncio server.
+        Connections are feeds unless another handler (eg. handleSubscriber) is given.
+        """
+        handler = handler or self.handleFeed
+        if unixPath is not None:
+            server = await asyncio.start_unix_server(handler, path=unixPath)
+        else:
+            server = await asyncio.start_server(handler, host, port)
+        for sock in server.sockets:
+            logging.info("Listening for %s on %s", 'feeds' if handler == self.handleFeed else 'subscribers',
+                         sock.getsockname())
+        return server
+
+
+    async def serve(self, host='127.0.0.1', port=9000, unixPath=None, subscriberPort=None, subscriberUnixPath=None):
+        """
+        Serves feed connections, and subscribers on subscriberUnixPath or subscriberPort if given, until cancelled.
+        """
+        servers = [await self.start(host, port, unixPath)]
+        if subscriberPort is not None or subscriberUnixPath is not None:
+            servers.append(await self.start(host, subscriberPort, subscriberUnixPath, self.handleSubscriber))
+        try:
+            await asyncio.gather(*[server.serve_forever() for server in servers])
+        finally:
+            self.closeSubscribers()
+            for server in servers:
+                server.close()
+
+
+async def sendFile(input_path, output_path, host='127.0.0.1', port=9000, unixPath=None, chunkBytes=1 << 16):
+    """
+    Client stand-in: streams an input file to the server and writes the output sent back to output_path while the
+    input is still being sent. Returns the number of bytes received.
+    """
+    if unixPath is not None:
+        stream_reader, stream_writer = await asyncio.open_unix_connection(unixPath)
+    else:
+        stream_reader, stream_writer = await asyncio.open_connection(host, port)
+
+    async def send():
+        with open(input_path, 'rb') as input_file:
+            while True:
+                data = input_file.read(chunkBytes)
+                if not data:
+                    break
+                stream_writer.write(data)
+                await stream_writer.drain()
+        stream_writer.write_eof()
+
+    sender = asyncio.ensure_future(send())
+    received = 0
+    try:
+        with open(output_path, 'wb') as output_file:
+            while True:
+                data = await stream_reader.read(1 << 16)
+                if not data:
+                    break
+                output_file.write(data)
+                received += len(data)
+        await sender
+    except ConnectionError:
+        if not sender.done():  # the server stopped reading after an error report
+            logging.warning("Feed closed by the server before the input was sent")
+    finally:
+        sender.cancel()
+        stream_writer.close()
+    return received
+
+
+def errorReport(output_path):
+    """
+    Returns the error report at the end of an output file written by sendFile (without ERROR_MAGIC and the ERROR
+    word), or None if the feed converted without an error.
+    """
+    with open(output_path, 'rb') as output_file:
+        data = output_file.read()
+    if data.startswith(render.MAGIC):
+        start = data.rfind(ERROR_MAGIC + ERROR, len(render.MAGIC))
+        while start >= 0 and (start - len(render.MAGIC)) % render.RECORD.size:  # bytes inside a record
+            start = data.rfind(ERROR_MAGIC + ERROR, len(render.MAGIC), start)
+        return data[start + len(ERROR_MAGIC + ERROR):].decode('ascii').rstrip('\n') if start >= 0 else None
+    start = data.rfind(b'\n', 0, len(data) - 1) + 1
+    if data.startswith(ERROR, start):
+        return data[start + len(ERROR):].decode('ascii').rstrip('\n')
+    return None
+
+
+async def subscribe(output_path, host='127.0.0.1', port=9001, unixPath=None):
+    """
+    Client stand-in for a subscriber: writes what the server sends to output_path until the server closes the
+    connection. Returns the number of bytes received.
+    """
+    if unixPath is not None:
+        stream_reader, stream_writer = await asyncio.open_unix_connection(unixPath)
+    else:
+        stream_reader, stream_writer = await asyncio.open_connection(host, port)
+    received = 0
+    try:
+        with open(output_path, 'wb') as output_file:
+            while True:
+                data = await stream_reader.read(1 << 16)
+                if not data:
+                    break
+                output_file.write(data)
+                output_file.flush()
+                received += len(data)
+    finally:
+        stream_writer.close()
+    return received
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(description='Streaming ChiX to SMARTS conversion server')
+    commands = argparser.add_subparsers(dest='command')
+    commands.required = True
+
+    serve_args = commands.add_parser('serve', help='run the conversion server')
+    serve_args.add_argument('--binary', action='store_true', help='send binary records (see render.py) instead of text lines')
+    serve_args.add_argument('-idleflush', default=1.0, type=float, help='seconds a feed is idle before its pending msgs are sent, defaults to 1')
+    serve_args.add_argument('-minbatch', default=1 << 12, type=int, help='smallest read batch in bytes, defaults to 4096')
+    serve_args.add_argument('-maxbatch', default=1 << 20, type=int, help='largest read batch in bytes, defaults to 1048576')
+    serve_args.add_argument('-writelimit', default=1 << 20, type=int, help='output bytes buffered per connection before waiting on the client, defaults to 1048576')
+    serve_args.add_argument('-subport', default=None, type=int, help='TCP port for subscribers, sent the lines of every feed, defaults to none')
+    serve_args.add_argument('-subunix', default=None, type=str, help='Unix socket path for subscribers, used instead of -subport')
+    serve_args.add_argument('-subqueue', default=256, type=int, help='converted batches queued per subscriber before it is disconnected, defaults to 256')
+    serve_args.add_argument('--nolog', action='store_true', help='disable the per-connection logging')
+
+    send_args = commands.add_parser('send', help='feed an input file to a running server (client stand-in)')
+    send_args.add_argument('input_path', type=str, help='The input file path')
+    send_args.add_argument('output_path', type=str, help='The output file path')
+
+    subscribe_args = commands.add_parser('subscribe', help='write the lines of every feed to a file (subscriber stand-in)')
+    subscribe_args.add_argument('output_path', type=str, help='The output file path')
+
+    for command_args in (serve_args, send_args, subscribe_args):
+        command_args.add_argument('-host', default='127.0.0.1', type=str, help='host to listen on or connect to, defaults to 127.0.0.1')
+        command_args.add_argument('-unix', default=None, type=str, help='Unix socket path, used instead of host and port')
+    for command_args in (serve_args, send_args):
+        command_args.add_argument('-port', default=9000, type=int, help='TCP port, defaults to 9000')
+    subscribe_args.add_argument('-port', default=9001, type=int, help='TCP port of the subscriber endpoint, defaults to 9001')
+
+    args = argparser.parse_args()
+
+    if args.command == 'serve':
+        instrument.configureLogging(args.nolog, trace=False)  # connection events only, no per-row tracing
+        conversion_server = ConversionServer(args.binary, args.idleflush, args.minbatch, args.maxbatch, args.writelimit,
+                                             args.subqueue)
+        try:
+            asyncio.run(conversion_server.serve(args.host, args.port, args.unix, args.subport, args.subunix))
+        except KeyboardInterrupt:
+            logging.info("Server stopped")
+    elif args.command == 'send':
+        instrument.configureLogging(trace=False)
+        received = asyncio.run(sendFile(args.input_path, args.output_path, args.host, args.port, args.unix))
+        logging.info("Received %s bytes", received)
+        report = errorReport(args.output_path)
+        if report is not None:
+            logging.error("Feed failed: %s", report)
+    else:
+        instrument.configureLogging(trace=False)
+        try:
+            received = asyncio.run(subscribe(args.output_path, args.host, args.port, args.unix))
+            logging.info("Received %s bytes", received)
+        except KeyboardInterrupt:
+            logging.info("Subscriber stopped")
@@ -0,0 +1,43 @@
+class SecurityTable(object):
+    """
+    Interns security symbols to small integer codes.
+    One table is shared by every writer of a Parser, so the order store, the agg and amend caches and the records all
+    carry the integer code, and the symbol is only looked up again when a msg is rendered.
+    """
+
+    def __init__(self):
+        """
+        Creates the empty symbol -> code dict and the code -> symbol list.
+        """
+        self.codes = {}
+        self.symbols = []
+
+
+    def __len__(self):
+        return len(self.symbols)
+
+
+    def intern(self, symbol):
+        """
+        Returns the integer code for a security symbol, assigning the next code on first sight.
+        """
+        code = self.codes.get(symbol)
+        if code is None:
+            code = self.codes[symbol] = len(self.symbols)
+            self.symbols.append(symbol)
+        return code
+
+
+    def symbol(self, code):
+        """
+        Returns the security symbol for an integer code.
+        """
+        return self.symbols[code]
+
+
+    def dump(self, path):
+        """
+        Writes the table as a sidecar file, one "code,symbol" line per security in code order.
+        """
+        with open(path, 'w') as sidecar:
+            sidecar.write("".join(["%s,%s\n" % (code, symbol) for code, symbol in enumerate(self.symbols)]))
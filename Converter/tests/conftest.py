@@ -0,0 +1,57 @@
+"""Shared pytest setup for the converter tests.
+The converter modules import each other by module name, so the Converter directory is put on sys.path. The
+testDir/*.txt input files are the conversion cases, and testDir/expected holds the expected output of each case
+with the end-of-input flush (Parser.flush).
+The expected outputs pin the parser as it stood just before the table-driven state machine (Parser.parse at the
+live metrics change), not the original per-row converter:
+- the hand-written cases give the same lines as the original converter, plus the msgs the flush writes;
+- testCase_generatedSeed7 differs from the original converter on most lines, because of the fixed-point prices
+  (no float rounding), the re-entry storing the amended order and the end-of-input flush. Do not regenerate it
+  from the original converter."""
+
+import glob
+import os
+import sys
+
+import pytest
+
+
+CONVERTER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, CONVERTER_DIR)
+
+TEST_DIR = os.path.join(os.path.dirname(CONVERTER_DIR), 'testDir')
+EXPECTED_DIR = os.path.join(TEST_DIR, 'expected')
+CASES = sorted(os.path.basename(path) for path in glob.glob(os.path.join(TEST_DIR, '*.txt')))
+
+
+def readRows(path):
+    """
+    Returns the rows of an input file that the run parses (blank and comment ('t') rows dropped, as reader.py does).
+    """
+    with open(path, 'r') as input_file:
+        return [row for row in input_file.read().split('\n') if row[9:10] not in ('', 't')]
+
+
+def readLines(path):
+    """
+    Returns the lines of an output file, without their newlines.
+    """
+    with open(path, 'r') as output_file:
+        return output_file.read().splitlines()
+
+
+@pytest.fixture(params=CASES)
+def case(request):
+    """
+    Each conversion case as (input path, expected output lines).
+    """
+    return os.path.join(TEST_DIR, request.param), readLines(os.path.join(EXPECTED_DIR, request.param))
+
+
+@pytest.fixture
+def generatedCase():
+    """
+    The largest conversion case (a generator.py workload) as (input path, expected output lines).
+    """
+    name = 'testCase_generatedSeed7.txt'
+    return os.path.join(TEST_DIR, name), readLines(os.path.join(EXPECTED_DIR, name))
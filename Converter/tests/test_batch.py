@@ -0,0 +1,85 @@
+"""batch.BatchDecoder against decoder.MessageDecoder: blocks of every case decode to the same records, and runParser
+with rows decoded in blocks gives the expected lines."""
+
+import os
+import random
+
+import numpy as np
+import pytest
+
+import batch
+import convertRun
+import timestamp
+
+from conftest import readRows
+
+
+def recordFields(record):
+    # the type and slot values of a record, None for rows whose transType is not handled
+    if record is None:
+        return None
+    return (type(record).__name__,) + tuple(getattr(record, name) for name in type(record).__slots__)
+
+
+def batchDecoder(pasr):
+    return batch.BatchDecoder(pasr.passive_writer, pasr.agg_handler, pasr.amd_del_writer, pasr.hidden_exe_writer)
+
+
+def test_decodeBlock_matches_decoder(case):
+    input_path, expected = case
+    rows = readRows(input_path)
+    scalar = convertRun.buildParser()
+    bulk = convertRun.buildParser()
+    decodeBlock = batchDecoder(bulk).decodeBlock
+    rnd = random.Random(len(rows))
+    start = 0
+    while start < len(rows):  # blocks of random sizes, with securities first seen in later blocks
+        size = rnd.randint(0, 500)
+        block = rows[start:start + size]
+        records = decodeBlock([row.encode('ascii') for row in block])
+        assert list(map(recordFields, records)) == [recordFields(scalar.decoder.decode(row)) for row in block]
+        start += size
+    # securities interned in the same order, so the codes in the records mean the same symbols
+    assert bulk.passive_writer.securityTable.symbols == scalar.passive_writer.securityTable.symbols
+
+
+def test_decodeBlock_str_rows_and_unknown_transType(generatedCase):
+    input_path, expected = generatedCase
+    rows = readRows(input_path)[:200]
+    rows.insert(50, rows[50][:9] + 'Z' + rows[50][10:])
+    scalar = convertRun.buildParser()
+    records = batchDecoder(convertRun.buildParser()).decodeBlock(rows)
+    assert records[50] is None
+    assert list(map(recordFields, records)) == [recordFields(scalar.decoder.decode(row)) for row in rows]
+    assert batchDecoder(convertRun.buildParser()).decodeBlock([]) == []
+
+
+@pytest.mark.parametrize('field', [' 12 3 ', '      ', '12x456'])
+def test_decodeBlock_rejects_bad_numbers(generatedCase, field):
+    input_path, expected = generatedCase
+    pasr = convertRun.buildParser()
+    rows = [row for row in readRows(input_path) if row[9] == 'X'][:10]
+    start = pasr.amd_del_writer.volume_loc['short']['start']
+    rows[3] = rows[3][:start] + field + rows[3][start + len(field):]
+    with pytest.raises(ValueError):
+        pasr.decoder.decode(rows[3])
+    with pytest.raises(ValueError):
+        batchDecoder(pasr).decodeBlock(rows)
+
+
+def test_formatTimeStamps_matches_formatter():
+    formatter = timestamp.TimeStampFormatter()
+    millis = np.array([0, 1, 999, 1000, 59999, 3599999, 3600000, 45296789, 99 * 3600000 + 3599999], dtype=np.int64)
+    assert batch.formatTimeStamps(millis) == [formatter.format(x) for x in millis.tolist()]
+    hundredHours = np.array([5, 100 * 3600000 + 1], dtype=np.int64)
+    assert batch.formatTimeStamps(hundredHours) == [formatter.format(x) for x in hundredHours.tolist()]
+    assert batch.formatTimeStamps(np.array([], dtype=np.int64)) == []
+
+
+@pytest.mark.parametrize('options', [{}, {'maxrows': 10 ** 9}], ids=['blocks', 'rows'])
+def test_runParser_batchrows_matches_expected(case, tmp_path, options):
+    input_path, expected = case
+    output_path = os.path.join(str(tmp_path), 'out.txt')
+    convertRun.runParser(input_path, output_path, convertRun.buildParser(), batchrows=97, **options)
+    with open(output_path, 'r') as output_file:
+        assert output_file.read().splitlines() == expected
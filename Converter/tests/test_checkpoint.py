@@ -0,0 +1,101 @@
+"""Checkpoint and resume: a run that fails part way and is resumed from its last checkpoint writes the same output as
+an uninterrupted run."""
+
+import os
+import pickle
+
+import pytest
+
+import checkpoint
+import convertRun
+import merge
+import parser
+import render
+
+from conftest import readLines
+
+
+class Crash(Exception):
+    pass
+
+
+@pytest.fixture
+def crashAfter(monkeypatch):
+    """
+    Returns a function that makes the Parser raise Crash once it has parsed the given number of records.
+    """
+    parseRecord = parser.Parser.parseRecord
+    parseRecords = parser.Parser.parseRecords
+    parsed = [0, None]
+
+    def crashingRecord(self, record):
+        if parsed[1] is not None and parsed[0] >= parsed[1]:
+            raise Crash()
+        parsed[0] += 1
+        return parseRecord(self, record)
+
+    def crashingRecords(self, records, msgs=None):
+        records = list(records)
+        if parsed[1] is not None and parsed[0] + len(records) > parsed[1]:
+            parseRecords(self, records[:parsed[1] - parsed[0]], msgs)
+            parsed[0] = parsed[1]
+            raise Crash()
+        parsed[0] += len(records)
+        return parseRecords(self, records, msgs)
+
+    monkeypatch.setattr(parser.Parser, 'parseRecord', crashingRecord)
+    monkeypatch.setattr(parser.Parser, 'parseRecords', crashingRecords)
+
+    def crashAfter(count):
+        parsed[:] = [0, count]
+    return crashAfter
+
+
+@pytest.mark.parametrize('options', [{}, {'batchrows': 37}, {'maxrows': 10 ** 9}, {'reorderlines': 100000},
+                                     {'binary': True}], ids=['blocks', 'batch', 'rows', 'reorder', 'binary'])
+@pytest.mark.parametrize('crashAt', [1500, 2900])
+def test_resume_matches_uninterrupted_run(generatedCase, tmp_path, crashAfter, options, crashAt):
+    input_path, expected = generatedCase
+    binary = options.get('binary', False)
+    output_path = os.path.join(str(tmp_path), 'out.txt')
+    checkpoint_path = output_path + '.checkpoint'
+
+    crashAfter(crashAt)
+    with pytest.raises(Crash):
+        convertRun.runParser(input_path, output_path, convertRun.buildParser(binary), checkpointrows=500,
+                             chunkbytes=4096, **options)
+    assert checkpoint.load(checkpoint_path)['version'] == checkpoint.VERSION
+
+    crashAfter(None)
+    convertRun.runParser(input_path, output_path, convertRun.buildParser(binary), checkpointrows=500, chunkbytes=4096,
+                         resume=True, **options)
+    assert not os.path.exists(checkpoint_path)  # removed once the run is complete
+    if binary:
+        text_path = os.path.join(str(tmp_path), 'out_text.txt')
+        render.recordsToText(output_path, text_path)
+        output_path = text_path
+    lines = readLines(output_path)
+    if options.get('reorderlines'):
+        expected = sorted(expected, key=merge.timeStampKey)
+    assert lines == expected
+
+
+def test_resume_without_checkpoint_starts_over(generatedCase, tmp_path):
+    input_path, expected = generatedCase
+    output_path = os.path.join(str(tmp_path), 'out.txt')
+    with open(output_path, 'w') as output_file:
+        output_file.write('left over from an earlier run\n')
+    convertRun.runParser(input_path, output_path, convertRun.buildParser(), checkpointrows=500, resume=True)
+    assert readLines(output_path) == expected
+
+
+def test_load_rejects_other_versions(tmp_path):
+    checkpoint_path = os.path.join(str(tmp_path), 'out.txt.checkpoint')
+    checkpoint.save(checkpoint_path, {'offset': 0})
+    assert checkpoint.load(checkpoint_path)['offset'] == 0
+    assert not os.path.exists(checkpoint_path + '.tmp')
+    # save always stamps the current version, so an old checkpoint is written by hand
+    with open(checkpoint_path, 'wb') as checkpoint_file:
+        pickle.dump({'offset': 0, 'version': checkpoint.VERSION - 1}, checkpoint_file)
+    with pytest.raises(ValueError):
+        checkpoint.load(checkpoint_path)
@@ -0,0 +1,91 @@
+"""runParser end to end: every way of reading and parsing the input (whole blocks, row by row, small chunks, traced rows,
+followed input) writes the expected lines, and a run that fails on a row keeps the lines of the rows before it."""
+
+import os
+
+import pytest
+
+import convertRun
+import instrument
+import merge
+
+from conftest import readLines, readRows
+
+
+MODES = {'blocks': {}, 'rows': {'maxrows': 10 ** 9}, 'chunked': {'chunkbytes': 4096},
+         'chunkedRows': {'chunkbytes': 1000, 'maxrows': 10 ** 9}, 'smallFlush': {'flushlines': 7},
+         'batchChunked': {'chunkbytes': 4096, 'batchrows': 1000}}
+
+
+def expectedFor(rows):
+    # the lines of a serial run over rows, with the end-of-input flush
+    pasr = convertRun.buildParser()
+    return pasr.parseMany(rows) + list(pasr.flush())
+
+
+@pytest.mark.parametrize('mode', sorted(MODES))
+def test_runParser_matches_expected(case, tmp_path, mode):
+    input_path, expected = case
+    output_path = os.path.join(str(tmp_path), 'out.txt')
+    stats = convertRun.runParser(input_path, output_path, convertRun.buildParser(), **MODES[mode])
+    assert readLines(output_path) == expected
+    assert stats['rows'] == len(readRows(input_path))
+    assert stats['linesWritten'] == len(expected)
+
+
+def test_traced_rows_match_expected(generatedCase, tmp_path):
+    input_path, expected = generatedCase
+    output_path = os.path.join(str(tmp_path), 'out.txt')
+    instrument.tracer.configure(True, 1000)
+    try:
+        convertRun.runParser(input_path, output_path, convertRun.buildParser())
+    finally:
+        instrument.tracer.configure(False)
+    assert readLines(output_path) == expected
+
+
+def test_maxrows_stops_early(generatedCase, tmp_path):
+    input_path, expected = generatedCase
+    output_path = os.path.join(str(tmp_path), 'out.txt')
+    stats = convertRun.runParser(input_path, output_path, convertRun.buildParser(), maxrows=1000)
+    assert 1000 <= stats['rows'] < len(expected)
+    assert readLines(output_path) == expectedFor(readRows(input_path)[:stats['rows']])
+
+
+def test_follow_converts_the_whole_file(generatedCase, tmp_path):
+    input_path, expected = generatedCase
+    output_path = os.path.join(str(tmp_path), 'out.txt')
+    convertRun.runParser(input_path, output_path, convertRun.buildParser(), follow=True, idleflush=0.05,
+                         followstop=0.3)
+    assert readLines(output_path) == expected
+
+
+@pytest.mark.parametrize('options', [{}, {'batchrows': 500}, {'maxrows': 10 ** 9}, {'reorderlines': 100000}],
+                         ids=['blocks', 'batch', 'rows', 'reorder'])
+def test_failed_row_keeps_earlier_lines(generatedCase, tmp_path, options):
+    input_path, expected = generatedCase
+    rows = readRows(input_path)
+    bad_path = os.path.join(str(tmp_path), 'bad.txt')
+    # a passive entry cut short before its price, part way through the file
+    bad = next(i for i in range(2000, len(rows)) if rows[i][9] == 'A')
+    with open(bad_path, 'w') as bad_file:
+        bad_file.write('\n'.join(rows[:bad] + [rows[bad][:25]] + rows[bad + 1:]) + '\n')
+    output_path = os.path.join(str(tmp_path), 'out.txt')
+    with pytest.raises(ValueError):
+        convertRun.runParser(bad_path, output_path, convertRun.buildParser(), **options)
+    if options.get('batchrows'):
+        bad -= bad % options['batchrows']  # no row of the block holding the bad row is parsed
+    lines = expectedFor(rows[:bad])
+    if options.get('reorderlines'):
+        lines = sorted(lines, key=merge.timeStampKey)
+    assert readLines(output_path) == lines
+
+
+def test_securities_sidecar_and_purge(generatedCase, tmp_path):
+    input_path, expected = generatedCase
+    output_path = os.path.join(str(tmp_path), 'out.txt')
+    securities_path = output_path + '.securities'
+    stats = convertRun.runParser(input_path, output_path, convertRun.buildParser(), purge=True,
+                                 securities_path=securities_path)
+    assert stats['ordersLive'] == 0 and stats['undisclosed'] == 0
+    assert len(readLines(securities_path)) == stats['securities'] == 5
@@ -0,0 +1,63 @@
+"""generator.WorkloadGenerator: the same seed gives the same rows whatever the chunk size, the rows are valid input for
+the converter, and the generated test case is reproduced."""
+
+import os
+import random
+
+import pytest
+
+import convertRun
+import generator
+
+from conftest import readRows
+
+
+def generate(seed, count, chunkRows=65536, **options):
+    rows = []
+    for chunk in generator.WorkloadGenerator(seed, **options).rows(count, chunkRows):
+        rows.extend(chunk)
+    return rows
+
+
+def test_same_seed_same_rows():
+    rows = generate(3, 5000)
+    assert len(rows) == 5000
+    assert generate(3, 5000, chunkRows=777) == rows
+    assert generate(4, 5000) != rows
+
+
+def test_generated_case_is_reproduced(generatedCase, tmp_path):
+    input_path, expected = generatedCase
+    output_path = os.path.join(str(tmp_path), 'generated.txt')
+    generator.WorkloadGenerator(7, securities=5, undisclosedShare=0.1, maxLive=200).write(output_path, 4000)
+    with open(output_path, 'r') as generated_file, open(input_path, 'r') as case_file:
+        assert generated_file.read() == case_file.read()
+
+
+def test_rows_are_valid_input(tmp_path):
+    gen = generator.WorkloadGenerator(11, securities=8, maxLive=300)
+    input_path = os.path.join(str(tmp_path), 'in.txt')
+    gen.write(input_path, 20000)
+    rows = readRows(input_path)
+    assert len(rows) == 20000
+    pasr = convertRun.buildParser()
+    # every row decodes, and every execution and cancel finds its order in the order store
+    assert None not in [pasr.decoder.decode(row) for row in rows]
+    assert len(pasr.parseMany(rows)) > 0
+    assert len(gen.live) <= 300
+    timeStamps = [int(row[1:9]) for row in rows]
+    assert timeStamps == sorted(timeStamps)
+    assert {row[9] for row in rows} == set('AaEeXxPp')
+
+
+def test_parseMix():
+    mix = generator.parseMix('enter=0.5,trade=0.3')
+    assert mix['enter'] == 0.5 and mix['trade'] == 0.3 and mix['hidden'] == generator.MIX['hidden']
+    with pytest.raises(ValueError):
+        generator.parseMix('bogus=1')
+
+
+def test_toBase36():
+    rnd = random.Random(0)
+    for number in [0, 1, 35, 36] + [rnd.randrange(36 ** 9) for i in range(100)]:
+        assert int(generator.toBase36(number), 36) == number
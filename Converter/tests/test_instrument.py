@@ -0,0 +1,69 @@
+"""instrument.Tracer: tracing is off until configured, and with sampleEvery N only every Nth row is traced, both by
+startRow and in the rows logged by a run."""
+
+import logging
+import os
+
+import pytest
+
+import convertRun
+import instrument
+
+from conftest import readLines, readRows
+
+
+@pytest.fixture
+def tracer():
+    """
+    Returns the module tracer, switched off again after the test.
+    """
+    yield instrument.tracer
+    instrument.tracer.configure(False)
+    logging.disable(logging.NOTSET)
+
+
+def test_startRow_enables_sampled_rows_only(tracer):
+    assert not tracer.active and not tracer.enabled
+    tracer.configure(True, 3)
+    assert [counter for counter in range(1, 13) if tracer.startRow(counter)] == [3, 6, 9, 12]
+    assert not tracer.startRow(13) and not tracer.enabled
+    tracer.configure(True)
+    assert all(tracer.startRow(counter) for counter in range(1, 13))
+    tracer.configure(True, 0)  # below 1 traces every row
+    assert tracer.sampleEvery == 1
+    tracer.configure(False, 3)
+    assert not any(tracer.startRow(counter) for counter in range(1, 13))
+
+
+def test_configureLogging(tracer):
+    instrument.configureLogging(sampleEvery=5)
+    assert tracer.active and tracer.sampleEvery == 5
+    instrument.configureLogging(trace=False)
+    assert not tracer.active
+    instrument.configureLogging(nolog=True)
+    assert not tracer.active and logging.getLogger().manager.disable == logging.INFO
+
+
+@pytest.mark.parametrize('sampleEvery', [1, 1000])
+def test_run_traces_sampled_rows(generatedCase, tmp_path, tracer, caplog, sampleEvery):
+    input_path, expected = generatedCase
+    output_path = os.path.join(str(tmp_path), 'out.txt')
+    caplog.set_level(logging.DEBUG)
+    tracer.configure(True, sampleEvery)
+    convertRun.runParser(input_path, output_path, convertRun.buildParser())
+    assert readLines(output_path) == expected
+    rows = readRows(input_path)
+    traced = [record.args[0] for record in caplog.records if record.msg == "%s: %s"]
+    assert traced == list(range(sampleEvery, len(rows) + 1, sampleEvery))
+    logged = [record.args[0] for record in caplog.records if record.msg == "####\n\n%s\n"]
+    assert logged == [rows[counter - 1] for counter in traced]
+
+
+def test_untraced_run_logs_no_rows(generatedCase, tmp_path, tracer, caplog):
+    input_path, expected = generatedCase
+    output_path = os.path.join(str(tmp_path), 'out.txt')
+    caplog.set_level(logging.DEBUG)
+    convertRun.runParser(input_path, output_path, convertRun.buildParser(), maxrows=10 ** 9)
+    assert readLines(output_path) == expected
+    assert not [record for record in caplog.records if record.levelno == logging.DEBUG]
+    assert not [record for record in caplog.records if record.msg in ("%s: %s", "####\n\n%s\n")]
@@ -0,0 +1,58 @@
+"""merge.mergeFiles against an in-memory stable sort of the converted lines, for sorted and unsorted inputs and more
+inputs than the fan-in."""
+
+import os
+
+import pytest
+
+import merge
+
+
+def writeLines(path, lines):
+    with open(path, 'w') as output_file:
+        output_file.write(''.join(line + '\n' for line in lines))
+    return path
+
+
+def readMerged(path):
+    with open(path, 'r') as merged_file:
+        return merged_file.read().splitlines()
+
+
+def test_timeStampKey_orders_hours_of_100_last():
+    early = '* 1 99:59:59.999000:  ENTER S001 1'
+    late = '* 1 100:00:00.000000:  ENTER S001 1'
+    assert merge.timeStampKey(early) < merge.timeStampKey(late)
+
+
+@pytest.mark.parametrize('runLines', [1000000, 50])
+def test_mergeFiles_matches_stable_sort(generatedCase, tmp_path, runLines):
+    input_path, expected = generatedCase
+    # the serial output cut into three interleaved parts, each in the serial (not timestamp) order
+    parts = [expected[i::3] for i in range(3)]
+    paths = [writeLines(os.path.join(str(tmp_path), 'part%s.txt' % i), part) for i, part in enumerate(parts)]
+    output_path = os.path.join(str(tmp_path), 'merged.txt')
+    merge.mergeFiles(paths, output_path, runLines=runLines, fanIn=2, tmpdir=str(tmp_path))
+    assert readMerged(output_path) == sorted(sum(parts, []), key=merge.timeStampKey)
+    # only the output is left behind
+    assert sorted(os.listdir(str(tmp_path))) == ['merged.txt', 'part0.txt', 'part1.txt', 'part2.txt']
+
+
+def test_mergeFiles_presorted(generatedCase, tmp_path):
+    input_path, expected = generatedCase
+    ordered = sorted(expected, key=merge.timeStampKey)
+    paths = [writeLines(os.path.join(str(tmp_path), 'part%s.txt' % i), ordered[i::5]) for i in range(5)]
+    output_path = os.path.join(str(tmp_path), 'merged.txt')
+    merge.mergeFiles(paths, output_path, presorted=True, fanIn=2, tmpdir=str(tmp_path))
+    assert readMerged(output_path) == sorted(sum((ordered[i::5] for i in range(5)), []), key=merge.timeStampKey)
+
+
+def test_mergeFiles_empty_and_unterminated_inputs(tmp_path):
+    empty = writeLines(os.path.join(str(tmp_path), 'empty.txt'), [])
+    unterminated = os.path.join(str(tmp_path), 'unterminated.txt')
+    with open(unterminated, 'w') as output_file:
+        output_file.write('* 1 09:00:00.001000:  ENTER S001 1\n* 2 09:00:00.000000:  ENTER S001 2')
+    output_path = os.path.join(str(tmp_path), 'merged.txt')
+    merge.mergeFiles([empty, unterminated], output_path)
+    assert readMerged(output_path) == ['* 2 09:00:00.000000:  ENTER S001 2',
+                                       '* 1 09:00:00.001000:  ENTER S001 1']
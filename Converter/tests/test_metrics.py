@@ -0,0 +1,114 @@
+"""Live metrics: single file and directory runs with -metrics write the row and line counts of every run, and totals
+that are the sums of the runs."""
+
+import collections
+import json
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+import metrics
+
+from conftest import CASES, CONVERTER_DIR, EXPECTED_DIR, TEST_DIR, readLines, readRows
+
+
+def runConvert(*args):
+    # convertRun from the command line, as a run with -metrics is started
+    subprocess.run([sys.executable, os.path.join(CONVERTER_DIR, 'convertRun.py')] + list(args) + ['--nolog'],
+                   cwd=CONVERTER_DIR, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def msgKind(line):
+    # the word after the timestamp
+    start = line.index(':  ') + 3
+    return line[start:start + 5]
+
+
+def checkRun(run, input_path):
+    # the counters of a finished run against its input and expected output
+    rows = readRows(input_path)
+    expected = readLines(os.path.join(EXPECTED_DIR, os.path.basename(input_path)))
+    assert run['input'] == os.path.abspath(input_path)
+    assert run['done'] is True
+    assert run['rows'] == len(rows)
+    assert run['transTypes'] == dict(collections.Counter(row[9] for row in rows))
+    lines = dict((kind, 0) for kind in metrics.KINDS)
+    lines.update(collections.Counter(msgKind(line) for line in expected))
+    assert run['lines'] == lines
+    assert run['bytesConsumed'] == run['inputBytes'] == os.path.getsize(input_path)
+    assert run['progress'] == 1.0
+
+
+def checkTotal(runs, total):
+    for key in metrics.SUMMED:
+        assert total[key] == pytest.approx(sum(run[key] for run in runs)), key
+    for name in ('transTypes', 'lines'):
+        summed = collections.Counter()
+        for run in runs:
+            summed.update(run[name])
+        assert total[name] == dict((item, summed[item]) for item in total[name])
+        assert sum(total[name].values()) == sum(summed.values())
+    assert total['runs'] == total['runsDone'] == len(runs)
+    assert total['progress'] == 1.0
+
+
+def test_single_file_run(generatedCase, tmp_path):
+    input_path, expected = generatedCase
+    metrics_path = os.path.join(str(tmp_path), 'metrics.json')
+    runConvert(input_path, str(tmp_path) + '/', '-metrics', metrics_path)
+    with open(metrics_path, 'r') as metrics_file:
+        snapshot = json.load(metrics_file)
+    assert len(snapshot['runs']) == 1
+    checkRun(snapshot['runs'][0], input_path)
+    checkTotal(snapshot['runs'], snapshot['total'])
+    assert not os.path.exists(metrics_path + '.tmp')
+
+
+def test_directory_run(tmp_path):
+    input_dir = os.path.join(str(tmp_path), 'in')
+    output_dir = os.path.join(str(tmp_path), 'out')
+    os.mkdir(input_dir)
+    os.mkdir(output_dir)
+    for name in CASES:
+        shutil.copy(os.path.join(TEST_DIR, name), input_dir)
+    metrics_path = os.path.join(str(tmp_path), 'metrics.json')
+    runConvert(input_dir + '/', output_dir + '/', '-inputtype', 'dir', '-processors', '2', '-metrics', metrics_path)
+    with open(metrics_path, 'r') as metrics_file:
+        snapshot = json.load(metrics_file)
+    runs = snapshot['runs']
+    assert sorted(os.path.basename(run['input']) for run in runs) == CASES
+    for run in runs:
+        checkRun(run, run['input'])
+    checkTotal(runs, snapshot['total'])
+    assert snapshot['total']['rows'] == sum(len(readRows(os.path.join(TEST_DIR, name))) for name in CASES)
+
+
+def test_prometheus_sink(generatedCase, tmp_path):
+    input_path, expected = generatedCase
+    metrics_path = os.path.join(str(tmp_path), 'metrics.prom')
+    runConvert(input_path, str(tmp_path) + '/', '-metrics', metrics_path)
+    with open(metrics_path, 'r') as metrics_file:
+        text = metrics_file.read()
+    assert '# TYPE chix_rows_total counter' in text
+    samples = dict(line.rsplit(' ', 1) for line in text.splitlines() if not line.startswith('#'))
+    label = 'input="%s"' % os.path.abspath(input_path)
+    assert float(samples['chix_rows_total{%s}' % label]) == len(readRows(input_path))
+    assert float(samples['chix_run_done{%s}' % label]) == 1.0
+    enters = sum(1 for line in expected if msgKind(line) == 'ENTER')
+    assert float(samples['chix_lines_total{%s,msg="ENTER"}' % label]) == enters
+
+
+def test_combine_uses_recent_rate_of_unfinished_runs():
+    def run(rows, rowsPerSec, recentRowsPerSec, done):
+        snapshot = dict((key, 0) for key in metrics.SUMMED)
+        snapshot.update(rows=rows, rowsPerSec=rowsPerSec, recentRowsPerSec=recentRowsPerSec, done=done,
+                        bytesConsumed=50, inputBytes=100, transTypes={'A': rows}, lines={'ENTER': rows})
+        return snapshot
+    total = metrics.combine([run(10, 5.0, 1.0, True), run(20, 8.0, 2.0, False)])
+    assert total['rows'] == 30
+    assert total['rowsPerSec'] == 5.0 + 2.0  # finished runs count their average, running ones their current rate
+    assert total['transTypes'] == {'A': 30} and total['lines']['ENTER'] == 30
+    assert (total['runs'], total['runsDone'], total['progress']) == (2, 1, 0.5)
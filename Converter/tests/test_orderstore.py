@@ -0,0 +1,82 @@
+"""Order store and undisclosed registry: keys for every distinct order ID, slot reuse and retirement counts."""
+
+import pickle
+
+import pytest
+
+import orderstore
+import undisclosed
+
+
+IDS = ['1', '01', '001', '0', '109747', '1002AN', '1002an', '1002An', 'ZZZZZZZZZ', '', ' ', 'A-1', 'A_1', 'A1',
+       '+1', '-1', '١']
+
+
+def test_orderKey_distinct_for_distinct_ids():
+    keys = [orderstore.orderKey(orderId) for orderId in IDS]
+    assert len(set(keys)) == len(IDS)
+    assert isinstance(orderstore.orderKey('1002AN'), int)
+    assert orderstore.orderKey('1002an') == '1002an'  # lower case keeps its string key
+
+
+def test_store_add_lookup_remove():
+    store = orderstore.OrderStore()
+    for code, orderId in enumerate(IDS):
+        store.add(orderId, code, 'Bid' if code % 2 else 'Ask', 100 + code, 10 * code)
+    assert len(store) == len(IDS)
+    for code, orderId in enumerate(IDS):
+        assert orderId in store
+        slot, security, side, price, volume = store.lookup(orderId)
+        assert (security, side, price, volume) == (code, 'Bid' if code % 2 else 'Ask', 100 + code, 10 * code)
+    store.setVolume(store.lookup('1002an')[0], 7)
+    assert store.lookup('1002an')[4] == 7 and store.lookup('1002AN')[4] == 50
+
+    store.remove('01')
+    store.remove('01')  # unknown IDs are ignored
+    assert '01' not in store and '1' in store and store.retiredCount == 1
+    with pytest.raises(KeyError):
+        store.lookup('01')
+    slots = len(store.volume)
+    store.add('NEW1', 3, 'Ask', 5, 6)  # the freed slot is reused
+    assert len(store.volume) == slots and store.lookup('NEW1')[1:] == (3, 'Ask', 5, 6)
+    store.add('NEW1', 4, 'Bid', 8, 9)  # a re-entry replaces the details
+    assert store.lookup('NEW1')[1:] == (4, 'Bid', 8, 9) and len(store) == len(IDS)
+
+    restored = pickle.loads(pickle.dumps(store))
+    assert restored.lookup('1002an')[1:] == store.lookup('1002an')[1:]
+    assert store.purge() == len(IDS)
+    assert len(store) == 0 and len(store.volume) == 0 and store.retiredCount == len(IDS) + 1
+
+
+def test_filled_orders_leave_a_tombstone():
+    store = orderstore.OrderStore()
+    store.add('111', 1, 'Ask', 4084, 100)
+    store.add('222', 1, 'Bid', 4083, 50)
+    store.setVolume(store.lookup('111')[0], 0)
+    store.retire('111')
+    store.retire('999')  # unknown IDs are ignored
+    assert '111' not in store and len(store) == 1 and store.retiredCount == 1
+    assert store.lookup('111')[1:] == (1, 'Ask', 4084, 0)  # a late cancel still finds it
+    store.remove('111')  # the cancel drops the tombstone, without counting the order again
+    assert store.retiredCount == 1 and not store.filled
+    with pytest.raises(KeyError):
+        store.lookup('111')
+
+    store.retire('222')
+    store.add('222', 1, 'Bid', 4090, 20)  # a re-entry takes over the tombstone's slot
+    assert '222' in store and not store.filled and store.lookup('222')[1:] == (1, 'Bid', 4090, 20)
+    store.retire('222')
+    assert store.purge() == 0 and not store.filled
+
+
+def test_undisclosed_registry():
+    registry = undisclosed.UndisclosedRegistry()
+    for orderId in ('1002AN', '1002an', '', '007'):
+        registry.add(orderId)
+    assert '1002AN' in registry and '1002an' in registry and '' in registry
+    assert '1002An' not in registry and '7' not in registry
+    registry.remove('1002an')
+    registry.remove('1002an')
+    assert '1002an' not in registry and '1002AN' in registry
+    assert (registry.addedCount, registry.removedCount, len(registry)) == (4, 1, 3)
+    assert registry.purge() == 3 and len(registry) == 0
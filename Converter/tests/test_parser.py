@@ -0,0 +1,91 @@
+"""Parser equivalence with the expected outputs: every case converted row by row, in blocks and from checkpointed state
+gives the expected lines (see conftest for what they pin)."""
+
+import pickle
+import random
+
+import convertRun
+import parser
+
+from conftest import readRows
+
+
+def parseRows(pasr, rows):
+    # the msgs of each row flattened in output order, as runParser writes them
+    lines = []
+    for row in rows:
+        msg = pasr.parse(row)
+        if type(msg) == tuple:
+            lines.extend(msg)
+        elif msg != 0 and msg != "undisclosed order":
+            lines.append(msg)
+    return lines
+
+
+def test_parse_matches_expected(case):
+    input_path, expected = case
+    pasr = convertRun.buildParser()
+    assert parseRows(pasr, readRows(input_path)) + list(pasr.flush()) == expected
+
+
+def test_parseMany_matches_expected(case):
+    input_path, expected = case
+    rows = readRows(input_path)
+    rnd = random.Random(len(rows))
+    pasr = convertRun.buildParser()
+    lines = []
+    start = 0
+    while start < len(rows):  # blocks of random sizes, so the pending state crosses block boundaries
+        size = rnd.randint(0, 300)
+        lines.extend(pasr.parseMany(rows[start:start + size]))
+        start += size
+    assert lines + list(pasr.flush()) == expected
+
+
+def test_parseRecords_matches_parseMany(generatedCase):
+    input_path, expected = generatedCase
+    pasr = convertRun.buildParser()
+    records = [pasr.decoder.decode(row) for row in readRows(input_path)]
+    assert pasr.parseRecords(records) + list(pasr.flush()) == expected
+
+
+def test_state_survives_pickling(generatedCase):
+    input_path, expected = generatedCase
+    rows = readRows(input_path)
+    pasr = convertRun.buildParser()
+    lines = []
+    for start in range(0, len(rows), 500):
+        pasr = pickle.loads(pickle.dumps(pasr))  # the transition table is rebuilt for the restored state
+        lines.extend(pasr.parseMany(rows[start:start + 500]))
+    assert lines + list(pasr.flush()) == expected
+
+
+def test_pending_state_flags():
+    pasr = convertRun.buildParser()
+    assert pasr.state == parser.IDLE
+    pasr.state = parser.TRADE_AND_CANCEL_PENDING
+    assert pasr.lastMessageTrade and pasr.lastMessageCancel
+    pasr.lastMessageTrade = False
+    assert pasr.state == parser.CANCEL_PENDING
+    pasr.lastMessageCancel = False
+    assert pasr.state == parser.IDLE
+
+
+def test_flush_when_idle_is_empty():
+    assert convertRun.buildParser().flush() == ()
+
+
+def test_cancel_after_fill_is_written_as_delete():
+    # a cancel for an order already fully traded (sent before the fill reached the exchange) finds the filled order's
+    # tombstone, and the agg ENTER of the burst is still written
+    rows = ['S42257971A      111S   100ABC       408400Y',
+            'S42257978E      111   100      T01      222',
+            'S42257980X      111   100',
+            'S42257990A      333B    50ABC       408300Y']
+    pasr = convertRun.buildParser()
+    lines = pasr.parseMany(rows) + list(pasr.flush())
+    assert [line.split()[3] for line in lines] == ['ENTER', 'TRADE', 'ENTER', 'DELET', 'ENTER']
+    assert [line.split()[1] for line in lines] == ['111', 'T01', '222', '111', '333']
+    order_store = pasr.passive_writer.orderStore
+    assert '111' not in order_store and not order_store.filled
+    assert len(order_store) == 1
@@ -0,0 +1,22 @@
+"""Stage profiling: the breakdown has a stage for each part of the run, and profiling does not change the output."""
+
+import convertRun
+import profiling
+
+
+def test_stages_and_output(generatedCase, tmp_path):
+    input_path, expected = generatedCase
+    for batchrows in (None, 256):
+        profiler = profiling.StageProfiler()
+        output_path = str(tmp_path / 'output.txt')
+        stats = convertRun.runParser(input_path, output_path, convertRun.buildParser(), batchrows=batchrows,
+                                     profiler=profiler)
+        with open(output_path) as output_file:
+            assert output_file.read().splitlines() == expected
+        assert profiler.calls['parse'] == stats['rows']
+        # decoding is timed on its own, row by row or a block at a time
+        assert profiler.calls['decode'] == (stats['rows'] if batchrows is None else -(-stats['rows'] // batchrows))
+        for stage in ('read', 'write', 'render (passive)', 'render (aggressive)', 'render (amend/delete)',
+                      'render (hidden)'):
+            assert stage in profiler.seconds
+        assert 'parse (state logic)' in profiler.report(1.0)
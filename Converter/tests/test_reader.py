@@ -0,0 +1,56 @@
+"""Input stage: chunked splitting drops the same rows and keeps the same rows as a plain split, whatever the chunk
+size, and resumes from an offset."""
+
+import pytest
+
+import reader
+
+from conftest import readRows
+
+
+def writeInput(tmp_path):
+    data = b'S28800000A   1001   B   100BHP   0000012300\n\n         t comment\n' \
+           b'S28800001X   1001       50\r\n' + b'S28800002Z junk\n' * 3 + b'S28800003E   1001     10   2001   3001'
+    input_path = tmp_path / 'input.txt'
+    input_path.write_bytes(data)
+    return str(input_path), data
+
+
+def test_splitRows_text_and_bytes():
+    chunk = b'S28800000A   1001\n\n         t comment\nS2880\nS28800001X   1001'
+    rows, skipped = reader.splitRows(memoryview(chunk))
+    assert rows == ['S28800000A   1001', 'S28800001X   1001'] and skipped == 3
+    assert reader.splitRows(chunk, text=False) == ([row.encode('ascii') for row in rows], 3)
+
+
+def test_chunk_sizes_give_the_same_rows(tmp_path, generatedCase):
+    input_path, data = writeInput(tmp_path)
+    expected = [row for row in data.decode('ascii').split('\n') if row[9:10] not in ('', 't')]
+    for chunkBytes in (1, 7, 40, 1 << 20):
+        chunked = reader.ChunkedReader(input_path, chunkBytes=chunkBytes)
+        assert list(chunked) == expected and chunked.rowsSkipped == 2 and chunked.offset == len(data)
+    generated_path = generatedCase[0]
+    assert list(reader.ChunkedReader(generated_path, chunkBytes=4096)) == readRows(generated_path)
+
+
+def test_chunks_are_released_views(tmp_path):
+    input_path, data = writeInput(tmp_path)
+    chunks = reader.ChunkedReader(input_path, chunkBytes=20).chunks()
+    first = next(chunks)
+    assert isinstance(first, memoryview) and first.tobytes() == data[:data.index(b'\n')]
+    next(chunks)
+    with pytest.raises(ValueError):  # released once the next chunk is asked for
+        first.tobytes()
+    chunks.close()  # abandoning the generator closes the map
+
+
+def test_start_offset(tmp_path):
+    input_path, data = writeInput(tmp_path)
+    start = data.index(b'S28800001')
+    assert list(reader.ChunkedReader(input_path, start=start))[0].startswith('S28800001X')
+
+
+def test_empty_file(tmp_path):
+    empty_path = tmp_path / 'empty.txt'
+    empty_path.write_bytes(b'')
+    assert list(reader.ChunkedReader(str(empty_path))) == []
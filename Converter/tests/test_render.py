@@ -0,0 +1,55 @@
+"""Binary output: a run written as binary records and rendered back with render.recordsToText gives the text lines
+of the expected output, and malformed binary files are rejected."""
+
+import os
+
+import pytest
+
+import convertRun
+import render
+
+from conftest import readLines
+
+
+@pytest.mark.parametrize('options', [{}, {'batchrows': 50}, {'maxrows': 10 ** 9}, {'chunkbytes': 4096}],
+                         ids=['blocks', 'batch', 'rows', 'chunked'])
+def test_binary_run_renders_expected(case, tmp_path, options):
+    input_path, expected = case
+    binary_path = os.path.join(str(tmp_path), 'out.bin')
+    text_path = os.path.join(str(tmp_path), 'out.txt')
+    convertRun.runParser(input_path, binary_path, convertRun.buildParser(binary=True), binary=True, **options)
+    with open(binary_path, 'rb') as binary_file:
+        data = binary_file.read()
+    assert data[:len(render.MAGIC)] == render.MAGIC
+    assert len(data) == len(render.MAGIC) + render.RECORD.size * len(expected)
+    render.recordsToText(binary_path, text_path)
+    assert readLines(text_path) == expected
+
+
+def test_renderRecord_matches_text_renderer():
+    text = render.TextRenderer()
+    binary = render.BinaryRenderer()
+    events = [('passiveEnter', ('09:00:00.001000', 'ABC123', 'S001', 'Bid', 76487000, 500)),
+              ('aggEnter', ('09:00:00.002000', 'ABC124', 'S001', 'Ask', 76487000, 300)),
+              ('trade', ('09:00:00.002000', 'T1', 'S001', 76487000, 300, 'ABC123', 'ABC124')),
+              ('cancelAmend', ('09:00:01.000000', 'ABC123', 'S001', 'Bid', 76487000, 200)),
+              ('reentryAmend', ('09:00:02.000000', 'ABC123', 'S001', 'Bid', 76500000, -100)),
+              ('delete', ('09:00:03.000000', 'ABC123', 'S001', 'Bid')),
+              ('offMarketTrade', ('09:00:04.000000', '100001', 'S002', 1234500, 700))]
+    for name, args in events:
+        fields = render.RECORD.unpack(getattr(binary, name)(*args))
+        assert text.renderRecord(fields) == getattr(text, name)(*args)
+
+
+def test_readRecords_rejects_malformed_files(tmp_path):
+    record = render.BinaryRenderer().delete('09:00:03.000000', 'ABC123', 'S001', 'Bid')
+    not_binary = os.path.join(str(tmp_path), 'text.bin')
+    with open(not_binary, 'wb') as binary_file:
+        binary_file.write(b'* 1 09:00:00.000000:  ENTER\n')
+    with pytest.raises(ValueError):
+        list(render.readRecords(not_binary))
+    truncated = os.path.join(str(tmp_path), 'truncated.bin')
+    with open(truncated, 'wb') as binary_file:
+        binary_file.write(render.MAGIC + record + record[:10])
+    with pytest.raises(ValueError):
+        list(render.readRecords(truncated))
@@ -0,0 +1,61 @@
+"""reorder.ReorderBuffer: runs through the buffer give the serial output in stable timestamp order, and a full buffer
+writes its earliest line early rather than growing."""
+
+import os
+
+import pytest
+
+import convertRun
+import merge
+import reorder
+
+from conftest import readLines
+
+
+class ListWriter(object):
+    # stands in for output.BufferedLineWriter
+    def __init__(self):
+        self.lines = []
+        self.closed = False
+
+    def write(self, line):
+        self.lines.append(line)
+
+    def close(self):
+        self.closed = True
+
+
+def line(timeStamp, orderId):
+    return '* %s %s:  ENTER S001 %s' % (orderId, timeStamp, orderId)
+
+
+@pytest.mark.parametrize('options', [{}, {'batchrows': 50}, {'maxrows': 10 ** 9}], ids=['blocks', 'batch', 'rows'])
+def test_runParser_reorder_matches_sorted_serial(case, tmp_path, options):
+    input_path, expected = case
+    output_path = os.path.join(str(tmp_path), 'out.txt')
+    convertRun.runParser(input_path, output_path, convertRun.buildParser(), reorderlines=100000, **options)
+    assert readLines(output_path) == sorted(expected, key=merge.timeStampKey)
+
+
+def test_release_holds_lines_after_the_watermark():
+    writer = ListWriter()
+    buffer = reorder.ReorderBuffer(writer)
+    buffer.writeLines([line('09:00:00.002000', 1), line('09:00:00.001000', 2), line('09:00:00.002000', 3)])
+    buffer.release(None)
+    assert writer.lines == []
+    buffer.release('09:00:00.001000')
+    assert writer.lines == [line('09:00:00.001000', 2)]
+    buffer.close()
+    # equal timestamps keep the order they were written in
+    assert writer.lines == [line('09:00:00.001000', 2), line('09:00:00.002000', 1), line('09:00:00.002000', 3)]
+    assert writer.closed and buffer.forcedCount == 0
+
+
+def test_full_buffer_writes_earliest_line():
+    writer = ListWriter()
+    buffer = reorder.ReorderBuffer(writer, maxLines=2)
+    buffer.writeLines([line('09:00:00.003000', 1), line('09:00:00.001000', 2), line('09:00:00.002000', 3)])
+    assert writer.lines == [line('09:00:00.001000', 2)]
+    assert buffer.forcedCount == 1
+    buffer.close()
+    assert writer.lines == [line('09:00:00.001000', 2), line('09:00:00.002000', 3), line('09:00:00.003000', 1)]
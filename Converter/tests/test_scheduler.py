@@ -0,0 +1,85 @@
+"""scheduler: the worker count follows the cores and the available memory, and jobs are dispatched largest input
+first."""
+
+import os
+
+import pytest
+
+import scheduler
+
+
+def sizeOf(job):
+    # runner for runJobs: module level, so it can be pickled to the workers
+    if job.options.get('fail'):
+        raise ValueError(job.input_path)
+    return {'size': os.path.getsize(job.input_path)}
+
+
+def makeJobs(tmp_path, sizes, options=None):
+    jobs = []
+    for number, size in enumerate(sizes):
+        input_path = os.path.join(str(tmp_path), 'in%s.txt' % number)
+        with open(input_path, 'w') as input_file:
+            input_file.write('x' * size)
+        jobs.append(scheduler.FileJob(input_path, input_path + '.out', options or {}))
+    return jobs
+
+
+@pytest.fixture
+def machine(monkeypatch):
+    """
+    Returns a function that sets the cores and available memory scheduler.workerCount sees.
+    """
+    def machine(cores, memory):
+        monkeypatch.setattr(scheduler.multiprocessing, 'cpu_count', lambda: cores)
+        monkeypatch.setattr(scheduler, 'availableMemory', lambda: memory)
+    return machine
+
+
+def test_workerCount_limited_by_cores(machine, tmp_path):
+    jobs = makeJobs(tmp_path, [1] * 10)
+    machine(4, 64 << 30)
+    assert scheduler.workerCount(jobs) == 4
+    assert scheduler.workerCount(jobs[:3]) == 3  # never more workers than jobs
+    machine(4, None)  # memory unknown: one worker per core
+    assert scheduler.workerCount(jobs) == 4
+
+
+def test_workerCount_limited_by_memory(machine, tmp_path):
+    jobs = makeJobs(tmp_path, [1] * 10)
+    machine(16, 5 << 30)
+    assert scheduler.workerCount(jobs) == 5
+    assert scheduler.workerCount(jobs, workerMemory=2 << 30) == 2
+    machine(16, 100 << 20)  # not enough memory for one worker still runs one
+    assert scheduler.workerCount(jobs) == 1
+
+
+def test_workerCount_explicit_processors(machine, tmp_path):
+    jobs = makeJobs(tmp_path, [1] * 10)
+    machine(2, 1 << 30)
+    assert scheduler.workerCount(jobs, processors=8) == 8  # used as given, whatever the cores and memory
+    assert scheduler.workerCount(jobs[:3], processors=8) == 3
+    assert scheduler.workerCount(jobs, processors=0) == 1
+
+
+def test_runJobs_dispatches_largest_first(tmp_path):
+    sizes = [30, 500, 10, 2000, 70]
+    jobs = makeJobs(tmp_path, sizes)
+    # one worker runs the jobs one at a time, so the completion order is the dispatch order
+    results = scheduler.runJobs(sizeOf, jobs, processors=1, nolog=True)
+    assert [result.size for result in results] == sorted(sizes, reverse=True)
+    assert [result.stats['size'] for result in results] == sorted(sizes, reverse=True)
+    assert all(result.error is None for result in results)
+
+
+def test_runJobs_keeps_going_after_a_failed_job(tmp_path):
+    jobs = makeJobs(tmp_path, [10, 20])
+    bad_path = os.path.join(str(tmp_path), 'bad.txt')
+    with open(bad_path, 'w') as bad_file:
+        bad_file.write('x' * 15)
+    bad = scheduler.FileJob(bad_path, bad_path + '.out', {'fail': True})
+    results = scheduler.runJobs(sizeOf, jobs + [bad], processors=2, nolog=True)
+    assert sorted(result.size for result in results) == [10, 15, 20]
+    failed = [result for result in results if result.error is not None]
+    assert [result.input_path for result in failed] == [bad_path]
+    assert 'ValueError' in failed[0].error and failed[0].stats is None
@@ -0,0 +1,123 @@
+"""Conversion server: feeds give the lines of a file run, subscribers get the lines of every feed, and a row that
+fails to convert is reported to its feed without stopping the server."""
+
+import asyncio
+import os
+
+import instrument
+import render
+import server
+
+
+def writeBytes(path, data):
+    with open(path, 'wb') as output_file:
+        output_file.write(data)
+
+
+def readBytes(path):
+    with open(path, 'rb') as input_file:
+        return input_file.read()
+
+
+async def waitFor(condition):
+    for attempt in range(500):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("timed out")
+
+
+async def runFeeds(conversion_server, socket_dir, inputs, subscribers=0):
+    # serves the feeds in inputs ((input path, output path) pairs) at once, returns the bytes each subscriber was sent
+    feed_path = os.path.join(socket_dir, 'feed.sock')
+    sub_path = os.path.join(socket_dir, 'sub.sock')
+    feeds = await conversion_server.start(unixPath=feed_path)
+    subs = await conversion_server.start(unixPath=sub_path, handler=conversion_server.handleSubscriber)
+    sub_outputs = [os.path.join(socket_dir, 'sub%s.out' % i) for i in range(subscribers)]
+    sub_tasks = [asyncio.ensure_future(server.subscribe(path, unixPath=sub_path)) for path in sub_outputs]
+    await waitFor(lambda: len(conversion_server.subscribers) == subscribers)
+    await asyncio.gather(*[server.sendFile(input_path, output_path, unixPath=feed_path, chunkBytes=997)
+                           for input_path, output_path in inputs])
+    conversion_server.closeSubscribers()
+    await asyncio.gather(*sub_tasks)
+    feeds.close()
+    subs.close()
+    return [readBytes(path) for path in sub_outputs]
+
+
+def test_feed_and_subscribers(generatedCase, case, tmp_path):
+    inputs = [(generatedCase[0], str(tmp_path / 'generated.out')), (case[0], str(tmp_path / 'case.out'))]
+    sub_bytes = asyncio.run(runFeeds(server.ConversionServer(idleflush=5.0), str(tmp_path), inputs, subscribers=2))
+    generated = readBytes(inputs[0][1]).decode('ascii').splitlines()
+    assert generated == generatedCase[1]
+    assert readBytes(inputs[1][1]).decode('ascii').splitlines() == case[1]
+    for data in sub_bytes:
+        lines = data.decode('ascii').splitlines()
+        # the feeds are interleaved batch by batch, each feed's lines in order
+        assert sorted(lines) == sorted(generatedCase[1] + case[1])
+        only_generated = set(generated) - set(case[1])
+        assert [line for line in lines if line in only_generated] == \
+            [line for line in generated if line in only_generated]
+
+
+def test_parse_error_reported_to_its_feed(generatedCase, tmp_path):
+    input_path, expected = generatedCase
+    with open(input_path, 'rb') as input_file:
+        rows = input_file.read().split(b'\n')
+    bad_path = str(tmp_path / 'bad.txt')
+    writeBytes(bad_path, b'\n'.join(rows[:1000]) + b'\nS28800000A   1234567B   100BHP  \n' + b'\n'.join(rows[1000:]))
+    for binary in (False, True):
+        conversion_server = server.ConversionServer(binary=binary, idleflush=5.0)
+        bad_output, good_output = str(tmp_path / 'bad.out'), str(tmp_path / 'good.out')
+        asyncio.run(runFeeds(conversion_server, str(tmp_path), [(bad_path, bad_output), (input_path, good_output)]))
+        report = server.errorReport(bad_output)
+        first, last = map(int, report.split(':')[0].split()[-3::2])
+        assert first <= 1001 <= last and ': ValueError: ' in report
+        assert server.errorReport(good_output) is None
+        if binary:
+            data = readBytes(good_output)
+            assert data.startswith(render.MAGIC) and (len(data) - len(render.MAGIC)) % render.RECORD.size == 0
+        else:
+            assert readBytes(good_output).decode('ascii').splitlines() == expected
+            lines = readBytes(bad_output).decode('ascii').splitlines()
+            assert lines[-1] == 'ERROR ' + report
+            assert len(lines) > 900 and lines[:-1] == expected[:len(lines) - 1]
+
+
+def test_invalid_bytes_reported_to_their_feed(generatedCase, tmp_path):
+    input_path, expected = generatedCase
+    with open(input_path, 'rb') as input_file:
+        rows = input_file.read().split(b'\n')
+    bad_path = str(tmp_path / 'bad.txt')
+    writeBytes(bad_path, b'\n'.join(rows[:1000]) + b'\nS28800000A\xff\xfe\n' + b'\n'.join(rows[1000:]))
+    conversion_server = server.ConversionServer(idleflush=5.0)
+    bad_output, good_output = str(tmp_path / 'bad.out'), str(tmp_path / 'good.out')
+    asyncio.run(runFeeds(conversion_server, str(tmp_path), [(bad_path, bad_output), (input_path, good_output)]))
+    report = server.errorReport(bad_output)
+    first, last = map(int, report.split(':')[0].split()[-3::2])
+    assert first <= 1001 <= last and ': UnicodeDecodeError: ' in report
+    assert readBytes(good_output).decode('ascii').splitlines() == expected
+    lines = readBytes(bad_output).decode('ascii').splitlines()
+    assert lines[-1] == 'ERROR ' + report
+    assert lines[:-1] == expected[:len(lines) - 1]
+
+
+def test_slow_subscriber_is_dropped():
+    async def run():
+        conversion_server = server.ConversionServer(subscriberQueue=2)
+        queue = asyncio.Queue(2)
+        conversion_server.subscribers[queue] = 'slow'
+        for batch in (b'a\n', b'b\n', b'c\n'):
+            conversion_server.publish(batch)
+        return conversion_server, queue
+    conversion_server, queue = asyncio.run(run())
+    assert not conversion_server.subscribers
+    assert queue.get_nowait() is None
+
+
+def test_server_logging_has_no_row_tracing():
+    instrument.configureLogging(trace=False)
+    try:
+        assert not instrument.tracer.active and not instrument.tracer.enabled
+    finally:
+        instrument.tracer.configure(False)
@@ -0,0 +1,55 @@
+"""timestamp.TimeStampFormatter: the cached millisecond is reused for repeated timestamps, every timestamp is rendered
+as the string formatting reference does, and batch.formatTimeStamps gives the same strings."""
+
+import random
+
+import numpy as np
+
+import batch
+import timestamp
+
+
+def reference(millis):
+    # the output timestamp written with string formatting
+    secs, ms = divmod(millis, 1000)
+    mins, secs = divmod(secs, 60)
+    hours, mins = divmod(mins, 60)
+    return '%02d:%02d:%02d.%03d000' % (hours, mins, secs, ms)
+
+
+def sampleMillis(count):
+    # bursts of repeated timestamps over a trading day, as the parser formats them
+    rnd = random.Random(count)
+    millis = []
+    while len(millis) < count:
+        millis.extend([rnd.randrange(24 * 3600000)] * rnd.randint(1, 5))
+    return millis[:count]
+
+
+def test_cache_reuses_last_millisecond():
+    formatter = timestamp.TimeStampFormatter()
+    first = formatter.format(45296789)
+    assert first == '12:34:56.789000'
+    assert formatter.lastMillis == 45296789 and formatter.lastString == '12:34:56.789'
+    assert formatter.format(45296789) is first  # served from the cache, not rendered again
+    assert formatter.millisToString(45296789) is formatter.lastString
+    assert formatter.format(45296790) == '12:34:56.790000'
+    assert formatter.lastMillis == 45296790
+    assert formatter.format(45296789) == first  # the cache only holds the last millisecond
+    assert formatter.parse(first) == 45296789
+    assert formatter.parse(first) == 45296789 and formatter.lastParsed == first
+
+
+def test_format_matches_reference():
+    formatter = timestamp.TimeStampFormatter()
+    millis = [0, 1, 999, 1000, 59999, 60000, 3599999, 3600000, 86399999, 100 * 3600000 + 1] + sampleMillis(5000)
+    for x in millis:
+        assert formatter.format(x) == reference(x)
+        assert formatter.millisToString(x) == reference(x)[:-3]
+        assert formatter.parse(formatter.format(x)) == x
+
+
+def test_formatTimeStamps_matches_formatter():
+    formatter = timestamp.TimeStampFormatter()
+    millis = sampleMillis(5000)
+    assert batch.formatTimeStamps(np.array(millis, dtype=np.int64)) == [formatter.format(x) for x in millis]
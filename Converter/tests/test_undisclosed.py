@@ -0,0 +1,37 @@
+"""undisclosed.UndisclosedRegistry: undisclosed orders are registered on entry, skipped by the Parser, and removed when
+they are cancelled."""
+
+import convertRun
+import undisclosed
+
+
+def test_registry_add_remove_purge():
+    registry = undisclosed.UndisclosedRegistry()
+    registry.add('ABC123')
+    registry.add('0444')
+    assert 'ABC123' in registry and '0444' in registry
+    assert '444' not in registry  # leading zeros make a different ID
+    assert len(registry) == 2
+    registry.remove('ABC123')
+    registry.remove('ABC123')  # already removed, and unknown IDs, are ignored
+    registry.remove('999')
+    assert 'ABC123' not in registry
+    assert (len(registry), registry.addedCount, registry.removedCount) == (1, 2, 1)
+    assert registry.purge() == 1
+    assert (len(registry), registry.removedCount) == (0, 2)
+
+
+def test_parser_skips_undisclosed_order_until_cancelled():
+    pasr = convertRun.buildParser()
+    registry = pasr.passive_writer.undisclosedOrders
+    assert pasr.parse('S42257971A      444S     0ABC       408400Y') == "undisclosed order"
+    assert '444' in registry and len(pasr.passive_writer.orderStore) == 0
+    # an execution against the undisclosed order has no passive details to trade against
+    assert pasr.parse('S42257978E      444   100      T02      555') == 0
+    assert pasr.parse('S42257980A      444S     0ABC       408400Y') == 0  # re-entry of the order
+    assert pasr.parse('S42257985X      444     0') == 0
+    assert '444' not in registry and registry.removedCount == 1
+    # the next order is written as usual
+    lines = pasr.parseMany(['S42257990A      333B    50ABC       408300Y']) + list(pasr.flush())
+    assert [line.split()[3] for line in lines] == ['ENTER']
+    assert [line.split()[1] for line in lines] == ['333']
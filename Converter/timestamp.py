@@ -0,0 +1,61 @@
+class TimeStampFormatter(object):
+    """
+    Renders millisecond timestamps in the output format "00:00:00.000000" using integer arithmetic only.
+    Hours, minutes, seconds and milliseconds are looked up in precomputed padded string tables, and the last
+    millisecond rendered is cached, since bursts of messages (and the several strings written for one message) share
+    the same timestamp.
+    """
+
+    def __init__(self):
+        """
+        Builds the padded lookup tables and an empty cache.
+        """
+        self.twoDigits = ['%02d' % x for x in range(100)]
+        self.threeDigits = ['%03d' % x for x in range(1000)]
+        self.lastMillis = None
+        self.lastString = None
+        self.lastTimeStamp = None
+        self.lastParsed = None
+        self.lastParsedMillis = None
+
+
+    def millisToString(self, millis):
+        """
+        Takes a timestamp in milliseconds (int) and returns it as "00:00:00.000".
+        """
+        if millis == self.lastMillis:
+            return self.lastString
+        secs, ms = divmod(millis, 1000)
+        mins, secs = divmod(secs, 60)
+        hours, mins = divmod(mins, 60)
+        twoDigits = self.twoDigits
+        if hours < 100:
+            hours = twoDigits[hours]
+        stringTime = "%s:%s:%s.%s" % (hours, twoDigits[mins], twoDigits[secs], self.threeDigits[ms])
+        self.lastMillis = millis
+        self.lastString = stringTime
+        self.lastTimeStamp = stringTime + "000"
+        return stringTime
+
+
+    def format(self, millis):
+        """
+        Takes a timestamp in milliseconds (int) and returns the output timestamp "00:00:00.000000".
+        """
+        if millis != self.lastMillis:
+            self.millisToString(millis)
+        return self.lastTimeStamp
+
+
+    def parse(self, timeStamp):
+        """
+        Takes an output timestamp "00:00:00.000000" and returns it in milliseconds (int), the inverse of format().
+        """
+        if timeStamp == self.lastParsed:
+            return self.lastParsedMillis
+        hours, mins, secs = timeStamp.split(':')
+        secs, fraction = secs.split('.')
+        millis = ((int(hours) * 60 + int(mins)) * 60 + int(secs)) * 1000 + int(fraction[:3])
+        self.lastParsed = timeStamp
+        self.lastParsedMillis = millis
+        return millis
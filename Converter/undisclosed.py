@@ -0,0 +1,54 @@
+import orderstore
+
+
+class UndisclosedRegistry(object):
+    """
+    Registry of undisclosed orders (passive orders entered with zero visible volume).
+    Messages for these orders are skipped by the Parser, so membership is checked for every 'A', 'E' and 'X' row.
+    Order IDs are held by their orderstore.orderKey in a set for constant time membership, and are removed when the
+    order is cancelled.
+    """
+
+    def __init__(self):
+        """
+        Creates the empty registry and its counters.
+        """
+        self.orders = set()
+        self.addedCount = 0
+        self.removedCount = 0
+
+
+    def __len__(self):
+        return len(self.orders)
+
+
+    def __contains__(self, orderId):
+        return orderstore.orderKey(orderId) in self.orders
+
+
+    def add(self, orderId):
+        """
+        Registers an undisclosed order.
+        """
+        self.orders.add(orderstore.orderKey(orderId))
+        self.addedCount += 1
+
+
+    def remove(self, orderId):
+        """
+        Removes an undisclosed order once it is dead. Unknown order IDs are ignored.
+        """
+        key = orderstore.orderKey(orderId)
+        if key in self.orders:
+            self.orders.discard(key)
+            self.removedCount += 1
+
+
+    def purge(self):
+        """
+        Removes every undisclosed order, for use at the end of a session. Returns the number of orders purged.
+        """
+        purged = len(self.orders)
+        self.removedCount += purged
+        self.orders = set()
+        return purged